@@ -6,8 +6,14 @@ TEAM OWNER: Jordan (Backend & Security)
 """
 
 import os
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
-from auth_utils import hash_password, verify_password
+import threading
+import time
+from flask import (
+    Flask, render_template, stream_template, make_response, request, redirect, url_for,
+    session, jsonify, Response, abort, send_from_directory,
+)
+from werkzeug.exceptions import TooManyRequests
+from auth_utils import dummy_hash, hash_password, verify_password, needs_rehash
 from database import (
     init_db,
     get_db,
@@ -15,12 +21,31 @@ from database import (
     get_user_by_login,
     get_user_by_username,
     get_user_and_profile,
-    get_profiles_except,
+    get_profiles_by_ids,
+    get_blocked_ids,
+    get_match_suggestions,
+    get_suggested_ids,
     record_accepted_match,
-    delete_profiles_for_old_matches,
 )
+import compression
+from change_feed import ChangeFeed
 import database as db
+import locations
+import metrics
+import render_cache
+import static_assets
+import profile_index
+import profile_store
+import profiler
+import rate_limit
+from maintenance import CleanupScheduler
+from match_cache import MatchCache
 from matching import rank_candidates
+from parallel_rank import shutdown_pool
+from rate_limit import AdmissionGate, Overloaded
+from reciprocal import ReciprocalRanker
+from user_cache import UserCache
+from write_queue import WriteBehindQueue
 
 # ---- Tell Flask where templates/static actually are ----
 APP_DIR = os.path.dirname(os.path.abspath(__file__))          # code/backend
@@ -30,7 +55,251 @@ STATIC_DIR   = os.path.join(APP_DIR, "..", "frontend", "static")
 app = Flask(__name__, template_folder=TEMPLATE_DIR, static_folder=STATIC_DIR)
 
 app.secret_key = os.environ.get("FLASK_SECRET", "supersecretkey")  # Needed for session management
-init_db()
+# Registered first so its after_request hook runs last (compresses the final body)
+compression.init_app(app)
+static_assets.init_app(app)
+MATCHES_TOP_K = int(os.environ.get("MATCHES_TOP_K", 50))  # How many matches each /matches page shows (0 = all)
+MATCH_CACHE_SPARE = 10  # extra ranked rows cached so blocks/profile edits rarely force a recompute
+# Serve precompute_matches.py results while they are younger than this (0 = never)
+MATCH_SUGGESTIONS_MAX_AGE_HOURS = float(os.environ.get("MATCH_SUGGESTIONS_MAX_AGE_HOURS", 24))
+# Pages with more rows than this are streamed while the template renders
+STREAM_MIN_ROWS = int(os.environ.get("STREAM_MIN_ROWS", 200))
+# Build the match index/store on a background thread at startup (0 = on first /matches)
+WARM_ON_START = os.environ.get("WARM_ON_START", "1") == "1"
+
+# One pooled DB connection per request (bound by whichever helper needs it
+# first), handed back when the request ends
+app.before_request(db.begin_request)
+app.teardown_appcontext(db.close_db)
+
+# Ranked /matches results per user, kept in sync by _apply_changes (change_feed)
+match_cache = MatchCache(
+    max_entries=int(os.environ.get("MATCH_CACHE_ENTRIES", 10_000)),
+    max_bytes=int(os.environ.get("MATCH_CACHE_BYTES", 64 * 1024 * 1024)),
+    ttl=float(os.environ.get("MATCH_CACHE_TTL", 300)),
+)
+
+# Current user's row (user + profile) for authenticated routes; _profile_changed invalidates
+user_cache = UserCache(
+    get_user_and_profile,
+    max_entries=int(os.environ.get("USER_CACHE_ENTRIES", 10_000)),
+    ttl=float(os.environ.get("USER_CACHE_TTL", 60)),
+)
+
+# /matches?mutual=1 ranking (candidates' bars come from profile_store.kth_best)
+mutual_ranker = ReciprocalRanker(profile_store.get_store)
+
+def _profile_changed(user_id):
+    """Push a user's current row to the in-process match index and caches."""
+    user_cache.invalidate(user_id)
+    mutual_ranker.profile_changed(user_id)
+    row = user_cache.get(user_id)
+    if row is None:
+        # Deleted: take them out of everything that ranks or lists them
+        profile_index.get_index().remove(user_id)
+        profile_store.get_store().remove(user_id)
+        match_cache.user_removed(user_id)
+        return
+    profile_index.get_index().upsert(user_id, row)
+    profile_store.get_store().upsert(user_id, row)
+    match_cache.profile_changed(row)
+
+# ---------------------------------------------------
+# Optional write-behind queue: single-row block/report/accept writes from
+# concurrent requests share one transaction per WRITE_BEHIND_MS window
+# (0 = off, every write commits on its own)
+# ---------------------------------------------------
+WRITE_BEHIND_MS = float(os.environ.get("WRITE_BEHIND_MS", 0))
+write_queue = WriteBehindQueue(window=WRITE_BEHIND_MS / 1000) if WRITE_BEHIND_MS > 0 else None
+
+def _write_one(table, row, write_now):
+    """Insert one row via the write queue (waits for its commit) or directly."""
+    if write_queue is None:
+        write_now(*row)
+    else:
+        write_queue.submit(table, row).result()
+
+# ---------------------------------------------------
+# Change feed: the changelog table (filled by SQLite triggers) is the one
+# path by which writes reach the in-process caches and indexes. Routes poll
+# right after their own commit; the background poll picks up other
+# workers' and scripts' writes.
+# ---------------------------------------------------
+change_feed = ChangeFeed()
+
+# Above this many changed users in one batch (bulk imports, scripts) it is
+# cheaper to drop the in-process structures and reload them on next use
+CHANGE_FEED_REBUILD_USERS = int(os.environ.get("CHANGE_FEED_REBUILD_USERS", 200))
+
+def _apply_changes(changes):
+    """change_feed subscriber: update this process's match structures."""
+    changed_users = {}
+    for change in changes:
+        if change.table in ("users", "profiles"):
+            changed_users[change.user_id] = True
+        elif change.table == "blocks" and change.op == "insert":
+            match_cache.blocked(change.user_id, change.other_id)
+        elif change.table == "blocks":
+            match_cache.invalidate(change.user_id)  # an unblocked user may belong back in the list
+    if len(changed_users) > CHANGE_FEED_REBUILD_USERS:
+        _reset_caches()
+        return
+    for uid in changed_users:
+        _profile_changed(uid)
+
+def _reset_caches():
+    """The feed lost changes (changelog pruned past us): rebuild everything on next use."""
+    profile_index.invalidate()
+    profile_store.invalidate()
+    match_cache.clear()
+    user_cache.clear()
+    mutual_ranker.clear()
+
+# ---------------------------------------------------
+# Background cleanup: delete profiles 10 days after an accepted match
+# (runs on its own thread instead of inside /matches/accept and /admin/users),
+# and trim the changelog on its own interval even when the cleanup is off
+# ---------------------------------------------------
+cleanup_scheduler = CleanupScheduler(
+    interval=float(os.environ.get("CLEANUP_INTERVAL_SECONDS", 3600)),
+    days=10,
+    batch_size=int(os.environ.get("CLEANUP_BATCH_SIZE", 250)),
+    on_deleted=lambda user_ids: change_feed.poll(),
+    changelog_keep_rows=int(os.environ.get("CHANGELOG_KEEP_ROWS", 100_000)),
+    changelog_interval=float(os.environ.get("CHANGELOG_PRUNE_INTERVAL_SECONDS", 300)),
+)
+
+# ---------------------------------------------------
+# Application factory: importing this module does no I/O and starts no
+# threads. create_app() (wsgi.py, `python app.py`) applies schema migrations
+# if PRAGMA user_version is behind, starts the cleanup thread and warms the
+# match structures in the background. A plain `from app import app` gets the
+# same setup from _ensure_started on its first request.
+# ---------------------------------------------------
+_started = False
+_start_lock = threading.Lock()
+warm_thread = None
+
+def _warm():
+    """Load profile_index / profile_store now, so the first /matches doesn't pay for it."""
+    t0 = time.perf_counter()
+    try:
+        profile_index.get_index()
+        profile_store.get_store()
+    except Exception:
+        app.logger.exception("background warm-up failed")
+        return
+    app.logger.info("warmed match index for %d users in %.2fs",
+                    len(profile_index.get_index()), time.perf_counter() - t0)
+
+def create_app(warm=None):
+    """Finish one-time setup (idempotent) and return the Flask app."""
+    global _started, warm_thread
+    if _started:
+        return app
+    with _start_lock:
+        if not _started:
+            init_db()
+            change_feed.subscribe(_apply_changes, on_reset=_reset_caches)
+            change_feed.start()
+            if cleanup_scheduler.enabled:
+                cleanup_scheduler.start()
+            if WARM_ON_START if warm is None else warm:
+                warm_thread = threading.Thread(target=_warm, name="roomsync-warm", daemon=True)
+                warm_thread.start()
+            _started = True
+    return app
+
+@app.before_request
+def _ensure_started():
+    if not _started:
+        create_app()
+
+# ---------------------------------------------------
+# Metrics: per-request timings, /metrics and optional Server-Timing header
+# ---------------------------------------------------
+render_template = metrics.timed("render")(render_template)
+
+if metrics.ENABLED:
+    @app.before_request
+    def _metrics_begin():
+        metrics.begin_request()
+
+    @app.after_request
+    def _metrics_end(response):
+        timings = metrics.end_request(request.url_rule.rule if request.url_rule else "unmatched")
+        if metrics.SERVER_TIMING and timings:
+            response.headers["Server-Timing"] = metrics.server_timing(timings)
+        return response
+
+    metrics.gauge("roomsync_db_pool_open_connections", lambda: db.get_pool().stats()["open"])
+    metrics.gauge("roomsync_db_pool_in_use_connections", lambda: db.get_pool().stats()["in_use"])
+    metrics.gauge("roomsync_match_cache_entries", lambda: match_cache.stats()["entries"])
+    metrics.gauge("roomsync_match_cache_bytes", lambda: match_cache.stats()["bytes"])
+    metrics.gauge("roomsync_match_cache_hits", lambda: match_cache.hits)
+    metrics.gauge("roomsync_match_cache_misses", lambda: match_cache.misses)
+    metrics.gauge("roomsync_user_cache_entries", lambda: user_cache.stats()["entries"])
+    metrics.gauge("roomsync_user_cache_hits", lambda: user_cache.hits)
+    metrics.gauge("roomsync_user_cache_misses", lambda: user_cache.misses)
+    metrics.gauge("roomsync_user_cache_coalesced", lambda: user_cache.coalesced)
+    metrics.gauge("roomsync_card_cache_hits", lambda: card_cache.hits)
+    metrics.gauge("roomsync_card_cache_misses", lambda: card_cache.misses)
+    metrics.gauge("roomsync_change_feed_changes", lambda: change_feed.stats()["changes"])
+    metrics.gauge("roomsync_change_feed_lag_rows", lambda: change_feed.stats()["lag"])
+    metrics.gauge("roomsync_cleanup_rows_deleted", lambda: cleanup_scheduler.stats()["rows_deleted_total"])
+    metrics.gauge("roomsync_cleanup_last_duration_seconds", lambda: cleanup_scheduler.stats()["last_duration_s"])
+    metrics.gauge("roomsync_cleanup_lag_seconds", lambda: cleanup_scheduler.stats()["lag_s"])
+    if write_queue is not None:
+        metrics.gauge("roomsync_write_queue_depth", lambda: write_queue.stats()["queued"])
+
+# ---------------------------------------------------
+# Rate limits (token bucket per route and client, per worker unless
+# RATE_LIMIT_BACKEND=sqlite) and admission control (at most MATCHES_MAX_CONCURRENT rankings per
+# worker; the rest wait MATCHES_ADMISSION_WAIT_MS, then get a 429)
+# ---------------------------------------------------
+rate_limiter = rate_limit.make_limiter()
+matches_gate = AdmissionGate(
+    max_concurrent=int(os.environ.get("MATCHES_MAX_CONCURRENT", 2)),
+    wait=float(os.environ.get("MATCHES_ADMISSION_WAIT_MS", 250)) / 1000,
+)
+
+def _too_many(retry_after, message):
+    """429 with Retry-After; JSON for the JSON routes, Flask's error page otherwise."""
+    if request.is_json:
+        response = jsonify({"error": message})
+        response.status_code = 429
+    else:
+        response = TooManyRequests(message).get_response()
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+@app.before_request
+def _rate_limit():
+    user_id = session.get("user_id")
+    client = f"user:{user_id}" if user_id else f"ip:{request.remote_addr}"
+    retry_after = rate_limiter.check(request.endpoint, request.method, client)
+    if retry_after is not None:
+        return _too_many(retry_after, "Too many requests, please slow down.")
+
+@app.errorhandler(Overloaded)
+def _overloaded(exc):
+    return _too_many(exc.retry_after, "The server is busy, please try again shortly.")
+
+if metrics.ENABLED:
+    for _rule in rate_limiter.rules:
+        metrics.gauge(f"roomsync_rate_limited_{_rule.name.lower().replace(':', '_')}",
+                      lambda name=_rule.name: rate_limiter.stats()[name]["limited"])
+    metrics.gauge("roomsync_matches_in_flight", lambda: matches_gate.stats()["in_flight"])
+    metrics.gauge("roomsync_matches_rejected", lambda: matches_gate.stats()["rejected"])
+
+# Opt-in profiles of slow requests (PROFILE_SLOW_MS) or of requests sent with
+# "X-Profile: <PROFILE_TOKEN>"; registered last so metrics' per-request
+# call list already exists. Listed on /admin/profiles.
+profiler.init_app(app)
+
+@app.route("/metrics")
+def metrics_route():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/")
 def index():
@@ -65,6 +334,8 @@ def register():
         (email, username, hash_password(password_raw)),
     )
     db.commit()
+    # New users have no profile yet, but still show up in everyone's matches
+    change_feed.poll()
     return redirect(url_for("login"))
 
 # ----------------------------------
@@ -82,7 +353,12 @@ def login():
         return render_template("login.html", message="Please enter username and password.")
 
     user = get_user_by_username(username)
-    if user and verify_password(password, user["password_hash"]):
+    # Unknown usernames still pay for one KDF run, so timing doesn't reveal them
+    hashed = user["password_hash"] if user else dummy_hash()
+    if verify_password(password, hashed) and user:
+        # Transparently move old (e.g. unsalted SHA-256) hashes to the current hasher
+        if needs_rehash(user["password_hash"]):
+            db.update_password_hash(user["id"], hash_password(password))
         session["user_id"] = user["id"]
         session["username"] = user["username"]
         return redirect(url_for("matches"))
@@ -109,31 +385,26 @@ def profile():
         pets = (request.form.get("pets") or "").strip()
         cleanliness = (request.form.get("cleanliness") or "").strip()
 
-        # Check if profile exists
-        profile_exists = db.execute(
-            "SELECT 1 FROM profiles WHERE user_id=?",
-            (user_id,)
-        ).fetchone()
-
-        if profile_exists:
-            # Update existing record
-            db.execute("""
-                UPDATE profiles
-                SET budget=?, location=?, lifestyle=?, smoking=?, pets=?, cleanliness=?
-                WHERE user_id=?
-            """, (budget, location, lifestyle, smoking, pets, cleanliness, user_id))
-        else:
-            # Insert new record
-            db.execute("""
-                INSERT INTO profiles (user_id, budget, location, lifestyle, smoking, pets, cleanliness)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, budget, location, lifestyle, smoking, pets, cleanliness))
+        # Canonical region resolved once here, so matching compares integers
+        region_id = locations.region_id(location)
+
+        # One statement for both new and existing profiles (profiles.user_id is UNIQUE)
+        db.execute("""
+            INSERT INTO profiles (user_id, budget, location, region_id, lifestyle, smoking, pets, cleanliness)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                budget=excluded.budget, location=excluded.location,
+                region_id=excluded.region_id,
+                lifestyle=excluded.lifestyle, smoking=excluded.smoking,
+                pets=excluded.pets, cleanliness=excluded.cleanliness
+        """, (user_id, budget, location, region_id, lifestyle, smoking, pets, cleanliness))
 
         db.commit()
+        change_feed.poll()
         message = "Profile updated successfully."
 
     # Fetch updated profile to display
-    profile_row = get_user_and_profile(user_id)
+    profile_row = user_cache.get(user_id)
     return render_template("profile.html", message=message, profile=profile_row)
 
 # ----------------------------------
@@ -142,25 +413,208 @@ def logout():
     session.clear()
     return redirect(url_for("index"))
 
+# ---------------------------------------------------
+# Rendered pages: card fragment cache, ETag / 304, streaming for big pages
+# ---------------------------------------------------
+def _assets_version():
+    return static_assets.assets_version(TEMPLATE_DIR, STATIC_DIR)
+
+# Rendered straight from the Jinja env: no per-card context processors or
+# signals. Keyed by the asset version too, so an edited card template or a
+# new static hash in it never serves old HTML.
+card_cache = render_cache.FragmentCache(
+    lambda match: app.jinja_env.get_template("_match_card.html").render(match=match),
+    max_entries=int(os.environ.get("CARD_CACHE_ENTRIES", 5000)),
+    version=_assets_version,
+)
+
+def _send_page(etag, rows, template, context):
+    """
+    304 if the client already has `etag`; otherwise render `template` with
+    context() (only called when needed), streamed when it has many rows.
+    """
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif rows > STREAM_MIN_ROWS:
+        response = Response(stream_template(template, **context()), mimetype="text/html")
+    else:
+        response = make_response(render_template(template, **context()))
+    response.set_etag(etag)
+    # Browsers must revalidate (cheap thanks to the ETag) but never reuse another user's page
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def _parse_cursor(raw):
+    """'<score>:<user_id>' of the last match on the previous page, or None."""
+    try:
+        score, uid = raw.split(":")
+        return int(score), int(uid)
+    except (AttributeError, ValueError):
+        return None
+
+def _load_ranked(top):
+    """(user_id, score) pairs -> rank_candidates-style rows with display fields."""
+    rows = {r["user_id"]: r for r in get_profiles_by_ids(uid for uid, _ in top)}
+    return [{"profile": rows[uid], "score": s} for uid, s in top if uid in rows]
+
+def _matches_after(user_id, after):
+    """One page of matches ranked after the cursor row (same order as page 1)."""
+    ranked = match_cache.get_after(user_id, after, MATCHES_TOP_K)
+    if ranked is None:
+        with matches_gate:
+            me = user_cache.get(user_id)
+            exclude = [user_id] + get_blocked_ids(user_id)
+            top = profile_store.get_store().rank(me, top_k=MATCHES_TOP_K, exclude=exclude, after=after)
+            ranked = _load_ranked(top)
+    return ranked
+
+def _nearby_matches(user_id, after):
+    """Matches limited to the user's own region (ids via idx_profiles_region), ranked in profile_store."""
+    me = user_cache.get(user_id)
+    if not me or me.get("region_id") is None:
+        return []
+    exclude = [user_id] + get_blocked_ids(user_id)
+    region = db.get_user_ids_in_region(me["region_id"])
+    return _load_ranked(profile_store.get_store().rank(
+        me, top_k=MATCHES_TOP_K, exclude=exclude, after=after, only=region))
+
+def _mutual_matches(user_id, after):
+    """Matches ordered by reciprocal.reciprocal_score (what both sides think)."""
+    me = user_cache.get(user_id)
+    if not me:
+        return []
+    exclude = [user_id] + get_blocked_ids(user_id)
+    return _load_ranked(mutual_ranker.rank(me, MATCHES_TOP_K, exclude=exclude, after=after))
+
+def _rank_fresh(user_id):
+    """Rank from scratch (cache miss) and cache the result."""
+    me = user_cache.get(user_id)
+    # Rank a few more than we show so the cached list survives blocks/edits
+    keep = MATCHES_TOP_K + MATCH_CACHE_SPARE if MATCHES_TOP_K else None
+
+    # Only load the users that can make the top-k. When the index can't
+    # prune (e.g. too few users share anything with me), rank everyone
+    # from the in-memory profile_store and load just the winners' rows.
+    exclude = [user_id] + get_blocked_ids(user_id)
+    ids = profile_index.get_index().candidate_ids(me, top_k=keep, exclude=exclude)
+    if ids is None:
+        ranked = _load_ranked(profile_store.get_store().rank(me, top_k=keep, exclude=exclude))
+    else:
+        candidates = get_profiles_by_ids(ids)
+        ranked = rank_candidates(me, candidates, top_k=keep) if candidates else []
+    match_cache.put(user_id, me, ranked, limit=MATCHES_TOP_K,
+                    truncated=bool(keep) and len(ranked) >= keep, exclude=exclude)
+    if MATCHES_TOP_K:
+        ranked = ranked[:MATCHES_TOP_K]
+    return ranked
+
+def _next_cursor(ranked, prefix=""):
+    """Cursor of the page's last row when the page is full (more may follow)."""
+    if MATCHES_TOP_K and len(ranked) >= MATCHES_TOP_K:
+        last = ranked[-1]
+        return f"{prefix}{last['score']}:{last['profile']['user_id']}"
+    return None
+
+def _precomputed_page(user_id, after_rank=-1, after=None, last=None):
+    """
+    A page of a ranking that started on precompute_matches.py results, as
+    (rows, next cursor): the stored rows after `after_rank` ("s<rank>:<score>:
+    <user_id>" cursors), then, once those run out, the live ranking minus
+    everyone the stored list holds, after `after` ("x<score>:<user_id>"
+    cursors). Pages never switch to the plain live ranking, which orders the
+    same people differently if scores changed since the job ran, so nobody is
+    skipped or shown twice. None if the viewer has no fresh precomputed list.
+
+    The one exception: when the list is deleted between pages (a profile
+    edit, database._add_suggestion_invalidation), an s cursor carries on in
+    the plain live ranking after `last`, the (score, user_id) of the last row
+    shown, instead of starting over from page 1.
+    """
+    ranked = []
+    if after is None:
+        ranked = get_match_suggestions(user_id, MATCH_SUGGESTIONS_MAX_AGE_HOURS,
+                                       limit=MATCHES_TOP_K, after_rank=after_rank)
+        if not ranked and after_rank < 0:
+            return None
+        if len(ranked) >= MATCHES_TOP_K:
+            return ranked, _next_cursor(ranked, f"s{ranked[-1]['rank']}:")
+    listed = get_suggested_ids(user_id, MATCH_SUGGESTIONS_MAX_AGE_HOURS)
+    if not listed and last is not None:
+        ranked = _matches_after(user_id, last)
+        return ranked, _next_cursor(ranked)
+    with matches_gate:
+        me = user_cache.get(user_id)
+        exclude = [user_id, *get_blocked_ids(user_id), *listed]
+        top = profile_store.get_store().rank(me, top_k=MATCHES_TOP_K - len(ranked),
+                                             exclude=exclude, after=after)
+    live = _load_ranked(top)
+    return ranked + live, _next_cursor(ranked + live, "x") if live else None
+
+def _parse_precomputed_cursor(raw):
+    """
+    's<rank>:<score>:<user_id>' -> (rank, None, (score, user_id));
+    'x<score>:<user_id>' -> (-1, (score, user_id), None).
+    """
+    if raw.startswith("s"):
+        rank, _, last = raw[1:].partition(":")
+        try:
+            return int(rank), None, _parse_cursor(last)
+        except ValueError:
+            return -1, None, None
+    return -1, _parse_cursor(raw[1:]), None
+
 @app.route("/matches")
 def matches():
     user_id = session.get("user_id")
     if not user_id:
         return redirect(url_for("login"))
 
-    me = get_user_and_profile(user_id)
-    candidates = get_profiles_except(user_id) or []
-    ranked = []
-
-    # Only rank if there are candidates
-    if candidates:
-        ranked = rank_candidates(me, candidates)
+    # ?after=<score>:<user_id> pages through the ranking; ordering is
+    # (score desc, user_id), so the cursor stays stable as users sign up.
+    # Pages that started on precomputed suggestions use s/x cursors instead
+    # (_precomputed_page) and stay on that ranking.
+    raw_after = request.args.get("after") or ""
+    after = _parse_cursor(raw_after) if MATCHES_TOP_K else None
+    # ?nearby=1 only shows people in the same region
+    nearby = request.args.get("nearby") == "1"
+    # ?mutual=1 ranks by how well each side fits the other (reciprocal.py)
+    mutual = request.args.get("mutual") == "1" and not nearby
+    next_cursor = None
+    if nearby:
+        with matches_gate:
+            ranked = _nearby_matches(user_id, after)
+        next_cursor = _next_cursor(ranked)
+    elif mutual:
+        with matches_gate:
+            ranked = _mutual_matches(user_id, after)
+        next_cursor = _next_cursor(ranked)
+    elif MATCHES_TOP_K and raw_after[:1] in ("s", "x"):
+        ranked, next_cursor = _precomputed_page(user_id, *_parse_precomputed_cursor(raw_after)) or ([], None)
     else:
-        # Avoid template crash if no matches exist
-        candidates = [{"username": "No matches yet"}]
+        ranked = _matches_after(user_id, after) if after else match_cache.get(user_id)
+        if ranked is None and MATCH_SUGGESTIONS_MAX_AGE_HOURS > 0:
+            # Fresh results from the nightly precompute_matches.py job, if any
+            if MATCHES_TOP_K:
+                ranked, next_cursor = _precomputed_page(user_id) or (None, None)
+            else:
+                ranked = get_match_suggestions(user_id, MATCH_SUGGESTIONS_MAX_AGE_HOURS) or None
+        if ranked is None:
+            with matches_gate:
+                ranked = _rank_fresh(user_id)
+        if next_cursor is None:
+            next_cursor = _next_cursor(ranked)
+
+    # Avoid template crash if no matches exist
+    if not ranked:
         ranked = [{"profile": {"username": "No matches yet", "location": "", "budget": "", "lifestyle": ""}, "score": 0}]
 
-    return render_template("matches.html", ranked=ranked, profiles=candidates)
+    # Same viewer + same cards + same assets -> same page, so a 304 skips rendering
+    etag = render_cache.page_etag(user_id, nearby, mutual, next_cursor, _assets_version(),
+                                  [(m["score"], card_cache.key(m["profile"])) for m in ranked])
+    return _send_page(etag, len(ranked), "matches.html",
+                      lambda: {"cards": [card_cache.render(m) for m in ranked],
+                               "next_cursor": next_cursor, "nearby": nearby, "mutual": mutual})
 
 # ----------------------------------
 # Accept a match and trigger cleanup
@@ -169,55 +623,85 @@ def matches():
 def accept_match(other_id):
     """
     Called when the current user accepts a match with another user.
-    Records the accepted match and runs profile cleanup for matches
-    older than 10 days.
+    Records the accepted match; profiles are deleted 10 days later by the
+    background cleanup_scheduler.
     """
     user_id = session.get("user_id")
     if not user_id:
         return redirect(url_for("login"))
 
     # Record the accepted match (user_id <-> other_id)
-    record_accepted_match(user_id, other_id)
-
-    # Run cleanup to delete profiles for any matches accepted 10+ days ago
-    delete_profiles_for_old_matches(days=10)
+    _write_one("matches", (user_id, other_id), record_accepted_match)
 
     return redirect(url_for("matches"))
 
 @app.route("/admin/users")
 def admin_users():
-    # Also run cleanup here so admins always see a "fresh" system
-    delete_profiles_for_old_matches(days=10)
-
-    db = get_db()
-    rows = db.execute("SELECT id, email, username FROM users ORDER BY id").fetchall()
-    html = ["<h3>All Users</h3><table border='1' cellpadding='6'>",
-            "<tr><th>ID</th><th>Email</th><th>Username</th></tr>"]
-    for r in rows:
-        html.append(f"<tr><td>{r['id']}</td><td>{r['email']}</td><td>{r['username']}</td></tr>")
-    html.append("</table>")
-    return "".join(html)
+    # Users are only ever added or removed, so (count, max id) versions the page
+    count, max_id = db.get_users_version()
+    etag = render_cache.page_etag("admin_users", count, max_id, _assets_version())
+    return _send_page(etag, count, "admin_users.html", lambda: {"users": db.iter_users()})
+
+@app.route("/admin/profiles")
+def admin_profiles():
+    if not profiler.authorized(request):
+        abort(404)
+    return render_template("admin_profiles.html", profiles=profiler.recent(),
+                           token=request.args.get("token"))
+
+@app.route("/admin/profiles/<name>")
+def admin_profile_file(name):
+    if not profiler.authorized(request) or not name.endswith(profiler.FILE_SUFFIXES):
+        abort(404)
+    return send_from_directory(profiler.PROFILE_DIR, name, as_attachment=True)
 # ----------------------------------
 
 # --------------------------------------------------
 # Joe – Block & Report user
 # --------------------------------------------------
+# Both routes take one JSON object, or a JSON array of them for bulk imports
+# (admin tooling); arrays are written with executemany in chunked transactions.
+
+def _missing(items, *keys):
+    """Index of the first item that isn't an object with every key set, else None."""
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not all(item.get(k) for k in keys):
+            return i
+    return None
+
 @app.route("/block", methods=["POST"])
 def block_user_route():
     data = request.json
+    if isinstance(data, list):
+        bad = _missing(data, "blocker_id", "blocked_id")
+        if bad is not None:
+            return jsonify({"error": f"Item {bad}: missing blocker_id or blocked_id"}), 400
+        pairs = [(d["blocker_id"], d["blocked_id"]) for d in data]
+        count = db.block_users(pairs)
+        change_feed.poll()
+        return jsonify({"message": f"{count} users blocked", "count": count})
+
     blocker_id = data.get("blocker_id")
     blocked_id = data.get("blocked_id")
 
     if not blocker_id or not blocked_id:
         return jsonify({"error": "Missing blocker_id or blocked_id"}), 400
 
-    db.block_user(blocker_id, blocked_id)
+    _write_one("blocks", (blocker_id, blocked_id), db.block_user)
+    change_feed.poll()
     return jsonify({"message": "User blocked successfully"})
 
 
 @app.route("/report", methods=["POST"])
 def report_user_route():
     data = request.json
+    if isinstance(data, list):
+        bad = _missing(data, "reporter_id", "reported_id")
+        if bad is not None:
+            return jsonify({"error": f"Item {bad}: missing reporter_id or reported_id"}), 400
+        count = db.report_users((d["reporter_id"], d["reported_id"], d.get("reason", "")) for d in data)
+        return jsonify({"message": f"{count} users reported", "count": count})
+
     reporter_id = data.get("reporter_id")
     reported_id = data.get("reported_id")
     reason = data.get("reason", "")
@@ -225,11 +709,20 @@ def report_user_route():
     if not reporter_id or not reported_id:
         return jsonify({"error": "Missing reporter_id or reported_id"}), 400
 
-    db.report_user(reporter_id, reported_id, reason)
+    _write_one("reports", (reporter_id, reported_id, reason), db.report_user)
     return jsonify({"message": "User reported successfully"})
 
 # ----------------------------------
 
+def shutdown():
+    """Stop background work and close pools (gunicorn.conf.py calls this on graceful exit)."""
+    cleanup_scheduler.stop()
+    change_feed.stop()
+    if write_queue is not None:
+        write_queue.stop()
+    shutdown_pool()
+    db.get_pool().close()
+
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5001)), debug=False)
\ No newline at end of file
+    create_app().run(host="0.0.0.0", port=int(os.environ.get("PORT", 5001)), debug=False)
\ No newline at end of file
@@ -6,15 +6,117 @@ Sprint 1 Tasks:
 - Implement hash_password(password) using SHA-256.
 - Implement verify_password(password, hashed) for login.
 
+Hashes are stored with their algorithm, salt and cost, so the cost can be
+raised later without breaking existing accounts:
+
+    pbkdf2_sha256$<iterations>$<salt b64>$<hash b64>
+    scrypt$<n>$<r>$<p>$<salt b64>$<hash b64>
+    <64 hex chars>          legacy unsalted SHA-256 (Sprint 1)
+
+Config (env):
+- PASSWORD_HASHER       "pbkdf2_sha256" (default) or "scrypt"
+- PBKDF2_ITERATIONS     default 260000
+- SCRYPT_N / SCRYPT_R / SCRYPT_P   default 16384 / 8 / 1
+- PASSWORD_HASH_WORKERS max KDF computations running at once (default 2)
+
+KDF work runs on a small bounded thread pool (hashlib releases the GIL while
+hashing), so a burst of logins queues there instead of eating every CPU the
+other requests need. Legacy and malformed hashes are checked inline.
+Use needs_rehash() after a successful login to upgrade old hashes.
+When the username doesn't exist, verify against dummy_hash() anyway, so the
+response takes as long as a wrong password and doesn't reveal the account.
+
 TEAM OWNER: Jordan (Security & Backend)
 """
 
+import base64
 import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "pbkdf2_sha256")
+PBKDF2_ITERATIONS = int(os.environ.get("PBKDF2_ITERATIONS", 260_000))
+SCRYPT_N = int(os.environ.get("SCRYPT_N", 2 ** 14))
+SCRYPT_R = int(os.environ.get("SCRYPT_R", 8))
+SCRYPT_P = int(os.environ.get("SCRYPT_P", 1))
+HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+
+_SALT_BYTES = 16
+_kdf_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="kdf")
+_dummy_hash: str | None = None
+
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
 
-def hash_password(password: str) -> str:
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # maxmem must cover 128 * n * r bytes, plus some slack
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=32,
+                          maxmem=256 * n * r + 1024 * 1024)
+
+
+def _run_kdf(fn, *args) -> bytes:
+    return _kdf_pool.submit(fn, *args).result()
+
+
+def hash_password(password: str, algorithm: str | None = None) -> str:
     # Jordan
-    return hashlib.sha256(password.encode()).hexdigest()
+    algorithm = algorithm or PASSWORD_HASHER
+    salt = os.urandom(_SALT_BYTES)
+    if algorithm == "pbkdf2_sha256":
+        digest = _run_kdf(_pbkdf2, password, salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+    if algorithm == "scrypt":
+        digest = _run_kdf(_scrypt, password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+    raise ValueError(f"unknown password hasher {algorithm!r}")
+
 
 def verify_password(password: str, hashed: str) -> bool:
     # Jordan
-    return hashlib.sha256(password.encode()).hexdigest() == hashed
\ No newline at end of file
+    if not hashed:
+        return False
+    parts = hashed.split("$")
+    try:
+        if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            iterations, salt, expected = int(parts[1]), base64.b64decode(parts[2]), base64.b64decode(parts[3])
+            actual = _run_kdf(_pbkdf2, password, salt, iterations)
+        elif parts[0] == "scrypt" and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            salt, expected = base64.b64decode(parts[4]), base64.b64decode(parts[5])
+            actual = _run_kdf(_scrypt, password, salt, n, r, p)
+        elif len(parts) == 1 and len(hashed) == 64:
+            # Legacy Sprint 1 hash: cheap, no need for the KDF pool
+            expected = hashed.encode()
+            actual = hashlib.sha256(password.encode()).hexdigest().encode()
+        else:
+            return False
+    except ValueError:
+        return False  # malformed stored hash
+    return hmac.compare_digest(actual, expected)
+
+
+def dummy_hash() -> str:
+    """Hash of a random password with the current hasher and cost (made once per process)."""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(_b64(os.urandom(_SALT_BYTES)))
+    return _dummy_hash
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True if `hashed` isn't using the current algorithm and cost (e.g. legacy SHA-256)."""
+    parts = (hashed or "").split("$")
+    if PASSWORD_HASHER == "pbkdf2_sha256":
+        return not (parts[0] == "pbkdf2_sha256" and len(parts) == 4
+                    and parts[1] == str(PBKDF2_ITERATIONS))
+    if PASSWORD_HASHER == "scrypt":
+        return not (parts[0] == "scrypt" and len(parts) == 6
+                    and parts[1:4] == [str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)])
+    return True
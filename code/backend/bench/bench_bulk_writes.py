@@ -0,0 +1,87 @@
+"""
+bench_bulk_writes.py
+Rows per second for block inserts through the three write paths:
+- single:  database.block_user once per row (one transaction each, today's
+           path), called from the same number of concurrent threads
+- bulk:    database.block_users (executemany, one transaction per chunk)
+- queue:   write_queue.WriteBehindQueue fed by concurrent threads, each waiting
+           for its row to commit (group commit)
+
+Usage (from code/backend):
+    python bench/bench_bulk_writes.py [--rows 5000] [--threads 32] [--window-ms 2]
+                                      [--synchronous FULL]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from write_queue import WriteBehindQueue
+
+
+def fresh_db(label):
+    database.DB_PATH = os.path.join(tempfile.mkdtemp(prefix=f"roomsync-{label}-"), "roommate.db")
+    database.init_db()
+
+
+def pairs(n):
+    return [(i, i + 1) for i in range(1, n + 1)]
+
+
+def count_blocks():
+    with database.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+
+
+def run_single(rows, args):
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(lambda row: database.block_user(*row), rows))
+    return f"{len(rows)} transactions"
+
+
+def run_bulk(rows, args):
+    database.block_users(rows)
+    return f"{-(-len(rows) // database.BULK_CHUNK_SIZE)} transactions"
+
+
+def run_queue(rows, args):
+    q = WriteBehindQueue(window=args.window_ms / 1000)
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(lambda row: q.submit("blocks", row).result(), rows))
+    q.stop()
+    stats = q.stats()
+    return f"{stats['batches']} transactions, {stats['rows'] / max(stats['batches'], 1):.0f} rows each"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--window-ms", type=float, default=2)
+    parser.add_argument("--synchronous", default=database.SYNCHRONOUS,
+                        help="PRAGMA synchronous for the run (FULL shows the fsync cost)")
+    args = parser.parse_args()
+    database.SYNCHRONOUS = args.synchronous
+
+    rows = pairs(args.rows)
+    baseline = None
+    for label, run in (("single", run_single), ("bulk", run_bulk), ("queue", run_queue)):
+        fresh_db(label)
+        t0 = time.perf_counter()
+        note = run(rows, args)
+        elapsed = time.perf_counter() - t0
+        assert count_blocks() == args.rows, f"{label}: wrote {count_blocks()} rows"
+        database.get_pool().close()
+        rate = args.rows / elapsed
+        baseline = baseline or rate
+        print(f"{label:7s} {rate:12,.0f} rows/s  {rate / baseline:5.1f}x single  ({elapsed:.2f}s, {note})")
+
+
+if __name__ == "__main__":
+    main()
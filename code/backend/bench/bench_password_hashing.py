@@ -0,0 +1,74 @@
+"""
+bench_password_hashing.py
+Login (verify_password) throughput at each hashing cost, with many request
+threads verifying at once through auth_utils' bounded KDF pool.
+
+Usage (from code/backend):
+    python bench/bench_password_hashing.py [--threads 32] [--seconds 3]
+    PASSWORD_HASH_WORKERS=4 python bench/bench_password_hashing.py
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth_utils
+
+SETTINGS = [
+    ("legacy sha256", None),
+    ("pbkdf2_sha256", 100_000),
+    ("pbkdf2_sha256", 260_000),
+    ("pbkdf2_sha256", 600_000),
+    ("scrypt", 2 ** 14),
+    ("scrypt", 2 ** 15),
+]
+
+
+def make_hash(algorithm, cost):
+    if algorithm == "legacy sha256":
+        import hashlib
+        return hashlib.sha256(b"hunter2").hexdigest()
+    if algorithm == "pbkdf2_sha256":
+        auth_utils.PBKDF2_ITERATIONS = cost
+    else:
+        auth_utils.SCRYPT_N = cost
+    return auth_utils.hash_password("hunter2", algorithm)
+
+
+def throughput(hashed, threads, seconds):
+    done = [0] * threads
+    stop = time.perf_counter() + seconds
+
+    def worker(slot):
+        while time.perf_counter() < stop:
+            assert auth_utils.verify_password("hunter2", hashed)
+            done[slot] += 1
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    t0 = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return sum(done) / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=32, help="concurrent login requests")
+    parser.add_argument("--seconds", type=float, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.threads} request threads, {auth_utils.HASH_WORKERS} KDF workers")
+    print(f"{'hasher':15s} {'cost':>8s} {'logins/s':>10s} {'ms/login':>9s}")
+    for algorithm, cost in SETTINGS:
+        rate = throughput(make_hash(algorithm, cost), args.threads, args.seconds)
+        print(f"{algorithm:15s} {cost or '-':>8} {rate:10.1f} {1000 / rate:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
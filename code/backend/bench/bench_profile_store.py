@@ -0,0 +1,80 @@
+"""
+bench_profile_store.py
+Measures memory per profile for profile_store.ProfileStore against the dict
+rows get_profiles_except builds, and the time to rank everyone from each.
+
+Usage (from code/backend):
+    python bench/bench_profile_store.py [--users 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matching import rank_candidates
+from profile_store import MAX_BYTES_PER_PROFILE, ProfileStore
+
+
+def make_rows(n, rnd):
+    locations = ["Seattle", "Tacoma", "Bellevue", "Redmond", "Everett", "Portland"]
+    return [{
+        "user_id": i,
+        "username": f"user{i}",
+        "email": f"user{i}@example.com",
+        "budget": str(rnd.randint(400, 1500)),
+        "location": rnd.choice(locations),
+        "lifestyle": rnd.choice(["early sleeper", "night owl"]),
+        "smoking": rnd.choice(["yes", "no"]),
+        "pets": rnd.choice(["yes", "no"]),
+        "cleanliness": rnd.choice(["low", "medium", "high"]),
+    } for i in range(1, n + 1)]
+
+
+def measure(build):
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    args = parser.parse_args()
+    rnd = random.Random(42)
+
+    # Build the strings outside the measurement, like rows coming from SQLite
+    source = make_rows(args.users, rnd)
+    rows, dict_bytes = measure(lambda: [dict(r) for r in source])
+
+    store = ProfileStore()
+    store.load(source[:1])  # warm the interner so only the arrays are measured
+    _, store_bytes = measure(lambda: store.load(source))
+
+    per_dict = dict_bytes / args.users
+    per_store = store_bytes / args.users
+    print(f"dict rows:     {per_dict:8.1f} bytes/profile")
+    print(f"profile_store: {per_store:8.1f} bytes/profile ({store.nbytes / args.users:.1f} in arrays)")
+
+    me = source[0]
+    t0 = time.perf_counter()
+    a = rank_candidates(me, rows[1:], top_k=50)
+    t1 = time.perf_counter()
+    b = store.rank(me, top_k=50, exclude=[me["user_id"]])
+    t2 = time.perf_counter()
+    assert [(r["profile"]["user_id"], r["score"]) for r in a] == b
+    print(f"rank dict rows: {(t1 - t0) * 1000:8.1f} ms   rank store: {(t2 - t1) * 1000:8.1f} ms")
+
+    if per_store > MAX_BYTES_PER_PROFILE:
+        print(f"FAIL: more than {MAX_BYTES_PER_PROFILE} bytes/profile")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+bench_query_plans.py
+Seeds a throwaway database with N users (default 100k) and checks that the
+database.py helpers use indexes instead of full table scans.
+
+Every SQL statement a helper runs is captured with a trace callback and fed to
+EXPLAIN QUERY PLAN. A "SCAN <table>" on a table that helper is not allowed to
+scan fails the run (exit code 1), so a dropped index can't slip back in.
+
+Usage (from code/backend):
+    python bench/bench_query_plans.py [--users 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import locations
+
+# helper name -> tables it may legitimately scan
+# (get_profiles_except returns every other user, so walking users is expected)
+ALLOWED_SCANS = {
+    "get_user_by_username": set(),
+    "get_profile_by_user_id": set(),
+    "get_user_and_profile": set(),
+    "get_blocked_ids": set(),
+    "get_profiles_by_ids": set(),
+    "get_profiles_except": {"u"},
+    "get_user_ids_in_region": set(),
+    "delete_profiles_for_old_matches": set(),
+}
+
+
+def seed(conn, n_users: int, rnd: random.Random):
+    places = ["Seattle", "Seattle, WA", "Tacoma", "Bellevue", "Redmond", "Everett", "Portland"]
+    conn.executemany(
+        "INSERT INTO users (email, username, password_hash) VALUES (?, ?, ?)",
+        ((f"user{i}@example.com", f"user{i}", "x") for i in range(n_users)),
+    )
+    conn.executemany(
+        """INSERT INTO profiles (user_id, budget, location, region_id, lifestyle, smoking, pets, cleanliness)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        ((i, str(rnd.randint(400, 1500)), loc, locations.region_id(loc), rnd.choice(["early", "late"]),
+          rnd.choice(["yes", "no"]), rnd.choice(["yes", "no"]), rnd.choice(["low", "medium", "high"]))
+         for i, loc in ((i, rnd.choice(places)) for i in range(1, n_users + 1))),
+    )
+    conn.executemany(
+        """INSERT INTO matches (user1_id, user2_id, status, accepted_at)
+           VALUES (?, ?, 'accepted', datetime('now', ?))""",
+        ((rnd.randint(1, n_users), rnd.randint(1, n_users), f"-{rnd.randint(0, 30)} days")
+         for _ in range(n_users // 10)),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO blocks (blocker_id, blocked_id) VALUES (?, ?)",
+        ((rnd.randint(1, n_users), rnd.randint(1, n_users)) for _ in range(n_users // 10)),
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+
+
+def plan_violations(conn, statements, allowed):
+    bad = []
+    for sql in statements:
+        if not sql.lstrip().upper().startswith(("SELECT", "DELETE", "UPDATE")):
+            continue
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall():
+            detail = row[3]
+            if detail.startswith("SCAN ") and detail.split()[1] not in allowed:
+                bad.append(detail)
+    return bad
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    database.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="roomsync-bench-"), "roommate.db")
+    database.init_db()
+    rnd = random.Random(args.seed)
+
+    conn = database.get_db()  # bound like a request, so every helper below reuses it
+    t0 = time.perf_counter()
+    seed(conn, args.users, rnd)
+    print(f"seeded {args.users} users in {time.perf_counter() - t0:.1f}s "
+          f"(schema v{database.SCHEMA_VERSION})")
+
+    some_ids = [rnd.randint(1, args.users) for _ in range(5)]
+    calls = {
+        "get_user_by_username": lambda: database.get_user_by_username("user123"),
+        "get_profile_by_user_id": lambda: database.get_profile_by_user_id(some_ids[0]),
+        "get_user_and_profile": lambda: database.get_user_and_profile(some_ids[0]),
+        "get_blocked_ids": lambda: database.get_blocked_ids(some_ids[1]),
+        "get_profiles_by_ids": lambda: database.get_profiles_by_ids(some_ids),
+        "get_profiles_except": lambda: database.get_profiles_except(some_ids[2]),
+        "get_user_ids_in_region": lambda: database.get_user_ids_in_region(locations.region_id("Tacoma")),
+        "delete_profiles_for_old_matches": lambda: database.delete_profiles_for_old_matches(days=10),
+    }
+
+    failed = False
+    for name, call in calls.items():
+        statements = []
+        conn.set_trace_callback(statements.append)
+        t0 = time.perf_counter()
+        call()
+        elapsed = time.perf_counter() - t0
+        conn.set_trace_callback(None)
+        bad = plan_violations(conn, statements, ALLOWED_SCANS[name])
+        status = "FULL SCAN: " + "; ".join(bad) if bad else "ok"
+        print(f"{name:34s} {elapsed * 1000:9.2f} ms  {status}")
+        failed = failed or bool(bad)
+
+    database.close_db()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+bench_scoring_model.py
+Compares the graded scoring_model.ScoringModel with the legacy exact-match
+scorer (matching.score_batch): per-candidate cost of the compiled evaluators,
+and a check that ScoringModel.score_batch equals the per-pair score().
+Run it with the default SCORING_MODEL=exact, or both sides are the model.
+
+Usage (from code/backend):
+    python bench/bench_scoring_model.py [--users 100000] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matching import compile_columns, compile_profile, score_batch
+from scoring_model import ScoringModel
+
+
+def make_rows(n, rnd):
+    locations = ["Seattle", "Tacoma", "Bellevue", "Redmond", "Everett", "Portland", ""]
+    return [{
+        "user_id": i,
+        "budget": rnd.choice([str(rnd.randint(400, 1500)), "$1,100", "mid", ""]),
+        "location": rnd.choice(locations),
+        "lifestyle": rnd.choice(["early sleeper", "night owl"]),
+        "smoking": rnd.choice(["yes", "no"]),
+        "pets": rnd.choice(["yes", "no", ""]),
+        "cleanliness": rnd.choice(["low", "medium", "mid", "high", ""]),
+    } for i in range(1, n + 1)]
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    rnd = random.Random(42)
+
+    rows = make_rows(args.users, rnd)
+    me = rows[0]
+    model = ScoringModel.from_config()
+
+    legacy_columns = compile_columns([compile_profile(p) for p in rows])
+    me_codes = compile_profile(me)
+    model_columns = model.compile(rows)
+
+    sample = rnd.sample(range(args.users), min(2000, args.users))
+    batch = model.score_batch(me, model_columns)
+    mismatches = sum(batch[i] != model.score(me, rows[i]) for i in sample)
+
+    legacy_s = best_of(args.repeat, lambda: score_batch(me_codes, legacy_columns))
+    model_s = best_of(args.repeat, lambda: model.score_batch(me, model_columns))
+    per = 1e9 / args.users
+    print(f"legacy exact-match: {legacy_s * 1000:8.1f} ms  ({legacy_s * per:6.1f} ns/candidate)")
+    print(f"graded model:       {model_s * 1000:8.1f} ms  ({model_s * per:6.1f} ns/candidate)")
+    print(f"ratio: {model_s / legacy_s:.2f}x   batch vs score() mismatches: {mismatches}/{len(sample)}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+bench_startup.py
+Cold-start time of the app: a fresh Python process per trial, timed from
+`import app` to the first request served (GET /base through Flask's test
+client), split into import / create_app / first request.
+
+Two database states are measured:
+- new:      empty data dir, so create_app runs every schema migration
+- existing: database already at SCHEMA_VERSION (what every worker restart and
+            every extra container sees), so setup is one PRAGMA read
+
+Usage (from code/backend):
+    python bench/bench_startup.py [--trials 10] [--users 0]
+
+--users N seeds the existing database with bench/populate.py first, which
+shows that background warm-up (WARM_ON_START) doesn't delay the first request.
+
+It ends with the modules `import app` pulls in directly, by cumulative
+import time (python -X importtime, median of the trials). Flask (with
+werkzeug and jinja2) is nearly all of it; the app's own modules, matching,
+profile_store and parallel_rank included, add a few ms together, which is
+why they are still imported eagerly.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+
+# Runs in the child process; prints one JSON line of timings in seconds
+CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.create_app()
+t2 = time.perf_counter()
+resp = app.app.test_client().get("/base")
+t3 = time.perf_counter()
+assert resp.status_code == 200, resp.status_code
+print(json.dumps({"import": t1 - t0, "create_app": t2 - t1, "first_request": t3 - t2, "total": t3 - t0}))
+"""
+
+
+def trial(data_dir):
+    env = dict(os.environ, RAILWAY_VOLUME_MOUNT_PATH=data_dir, CLEANUP_INTERVAL_SECONDS="0",
+               CHANGELOG_PRUNE_INTERVAL_SECONDS="0")
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    timings = json.loads(out.strip().splitlines()[-1])
+    timings["process"] = time.perf_counter() - t0  # includes interpreter start-up
+    return timings
+
+
+def report(label, runs):
+    print(f"{label:9s}", "  ".join(
+        f"{key} {statistics.median(r[key] for r in runs) * 1000:7.1f} ms"
+        for key in ("import", "create_app", "first_request", "total", "process")
+    ))
+
+
+def import_breakdown(trials, top=12):
+    """Cumulative ms per module imported directly by app.py, biggest first."""
+    per_module = {}
+    for _ in range(trials):
+        err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=BACKEND_DIR,
+                             env=dict(os.environ, RAILWAY_VOLUME_MOUNT_PATH=tempfile.gettempdir()),
+                             capture_output=True, text=True, check=True).stderr
+        # "import time: self [us] | cumulative | name", children listed before
+        # their parent and indented two more spaces
+        children = []
+        for line in err.splitlines():
+            parts = line.split("|")
+            if len(parts) != 3 or not parts[1].strip().isdigit():
+                continue
+            depth = (len(parts[2]) - len(parts[2].lstrip()) - 1) // 2
+            name = parts[2].strip()
+            if depth == 1:
+                children.append((name, int(parts[1]) / 1000))
+            elif depth == 0:
+                if name == "app":
+                    for child, ms in children:
+                        per_module.setdefault(child, []).append(ms)
+                children = []
+    medians = sorted(((statistics.median(v), k) for k, v in per_module.items()), reverse=True)
+    own = sum(ms for ms, name in medians if os.path.exists(os.path.join(BACKEND_DIR, name + ".py")))
+    print("imports by app.py (cumulative ms):", ", ".join(f"{name} {ms:.1f}" for ms, name in medians[:top]))
+    print(f"app's own modules: {own:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=10)
+    parser.add_argument("--users", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"median of {args.trials} trials")
+    report("new", [trial(tempfile.mkdtemp(prefix="roomsync-start-")) for _ in range(args.trials)])
+
+    existing = tempfile.mkdtemp(prefix="roomsync-start-")
+    trial(existing)  # creates the schema
+    if args.users:
+        subprocess.run([sys.executable, os.path.join(BENCH_DIR, "populate.py"), "--users", str(args.users),
+                        "--db", os.path.join(existing, "roommate.db"), "--append"],
+                       cwd=BACKEND_DIR, check=True)
+    report("existing", [trial(existing) for _ in range(args.trials)])
+    import_breakdown(args.trials)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+bench_suite.py
+Matching benchmark suite over seeded synthetic populations (bench/populate.py).
+
+For each population size (default 1k, 10k, 100k users) it measures:
+- compatibility_score   pairs scored one call at a time
+- rank_candidates       one viewer against every other user (top 50)
+- get_profiles_except   loading every other user's row from SQLite
+- matches_route         GET /matches through Flask's test client, with the
+                        match cache cleared so every request ranks from scratch
+
+and reports throughput, p50 / p95 / p99 latency and peak traced memory
+(tracemalloc, one extra run per benchmark so tracing doesn't skew timings).
+
+--runs N (default 3) repeats every size N times and reports the median of
+each number, plus its run-to-run spread: 1.4826 * median absolute deviation
+/ median, a robust relative standard deviation (one outlier run doesn't
+move it).
+
+Results are written as JSON (--out) and compared with a stored baseline
+(--baseline, default bench/baseline.json). A benchmark regresses when its
+p50 latency or peak memory grows, or its throughput drops, by more than
+its band: NOISE_SIGMAS (3) times the spread recorded with the baseline,
+never less than --tolerance (default 15%) and never more than MAX_BAND
+(50%), so a noisy benchmark can't hide a large slowdown; benchmarks that
+noisy are listed as a warning instead. Any regression exits with status 1.
+--update-baseline stores this run instead: record it with --runs 7 on a
+quiet machine, and only when the benchmarked code path changes on
+purpose, never to clear a failing check.
+
+Usage (from code/backend):
+    python bench/bench_suite.py [--sizes 1000,10000,100000] [--seed 42] [--runs 3]
+                                [--tolerance 0.15] [--out bench/results.json]
+                                [--update-baseline]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# A throwaway data dir, no background cleanup, changelog pruning or
+# change-feed polling, no rate limits (every login comes from one client),
+# and cheap password hashes so logging in the benchmark users doesn't
+# dominate the route timings
+os.environ["RAILWAY_VOLUME_MOUNT_PATH"] = tempfile.mkdtemp(prefix="roomsync-suite-")
+os.environ.setdefault("CLEANUP_INTERVAL_SECONDS", "0")
+os.environ.setdefault("CHANGELOG_PRUNE_INTERVAL_SECONDS", "0")
+os.environ.setdefault("PBKDF2_ITERATIONS", "1000")
+os.environ.setdefault("WARM_ON_START", "0")
+os.environ.setdefault("CHANGE_FEED_INTERVAL_SECONDS", "0")
+os.environ.setdefault("RATE_LIMITS", "")
+
+import app as roomsync
+import database
+import profile_index
+import profile_store
+from load_test import percentile
+from matching import compatibility_score, rank_candidates
+from populate import PASSWORD, populate
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+NOISE_SIGMAS = 3
+MAX_BAND = 0.5
+# Compared against the baseline: metric -> whether a higher value is worse
+COMPARED = {"p50_ms": True, "throughput_per_s": False, "peak_mem_mb": True}
+
+
+def summarize(latencies, units, unit):
+    """latencies in seconds (one per timed call); units = work items those calls covered."""
+    values = sorted(latencies)
+    total = sum(values)
+    return {
+        "calls": len(values),
+        "unit": unit,
+        "throughput_per_s": round(units / total, 1) if total else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 4),
+        "p95_ms": round(percentile(values, 95) * 1000, 4),
+        "p99_ms": round(percentile(values, 99) * 1000, 4),
+    }
+
+
+def peak_mb(fn):
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(peak / 1024 / 1024, 3)
+
+
+def timed_calls(fn, args_list):
+    latencies = []
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def bench_compatibility_score(rows, rnd, repeats):
+    pairs = [(rnd.choice(rows), rnd.choice(rows)) for _ in range(20_000)]
+    lat = timed_calls(compatibility_score, pairs)
+    result = summarize(lat, len(pairs), "pairs")
+    result["peak_mem_mb"] = peak_mb(lambda: compatibility_score(*pairs[0]))
+    return result
+
+
+def bench_rank_candidates(rows, rnd, repeats):
+    viewers = [rnd.choice(rows) for _ in range(repeats)]
+    lat = timed_calls(lambda me: rank_candidates(me, rows, top_k=50), [(me,) for me in viewers])
+    result = summarize(lat, len(rows) * repeats, "candidates")
+    result["peak_mem_mb"] = peak_mb(lambda: rank_candidates(viewers[0], rows, top_k=50))
+    return result
+
+
+def bench_get_profiles_except(user_ids, rnd, repeats):
+    viewers = [(rnd.choice(user_ids),) for _ in range(repeats)]
+    counts = []
+    lat = timed_calls(lambda uid: counts.append(len(database.get_profiles_except(uid))), viewers)
+    result = summarize(lat, sum(counts), "rows")
+    result["peak_mem_mb"] = peak_mb(lambda: database.get_profiles_except(viewers[0][0]))
+    return result
+
+
+def bench_matches_route(usernames, rnd, repeats):
+    client = roomsync.app.test_client()
+
+    def view(username):
+        client.post("/login", data={"username": username, "password": PASSWORD})
+        roomsync.match_cache.clear()
+        t0 = time.perf_counter()
+        resp = client.get("/matches")
+        elapsed = time.perf_counter() - t0
+        assert resp.status_code == 200, resp.status_code
+        client.get("/logout")
+        return elapsed
+
+    view(usernames[0])  # loads profile_index / profile_store once, outside the timings
+    lat = [view(rnd.choice(usernames)) for _ in range(repeats)]
+    result = summarize(lat, repeats, "requests")
+    result["peak_mem_mb"] = peak_mb(lambda: view(usernames[0]))
+    return result
+
+
+def run_size(n_users, seed, log=print):
+    database.DB_PATH = os.path.join(tempfile.mkdtemp(prefix=f"roomsync-{n_users}-"), "roommate.db")
+    database.init_db()
+    with database.connection() as conn:
+        first = populate(conn, n_users, seed, log=log)
+        usernames = [r[0] for r in conn.execute(
+            "SELECT username FROM users u JOIN profiles p ON p.user_id = u.id WHERE u.id >= ?", (first,))]
+    profile_index.invalidate()
+    profile_store.invalidate()
+    roomsync.match_cache.clear()
+    roomsync.user_cache.clear()
+
+    rnd = random.Random(seed)
+    rows = database.get_profiles_except(0)
+    user_ids = [r["user_id"] for r in rows]
+    # Fewer repeats for the expensive whole-population benchmarks at large sizes
+    repeats = max(5, min(50, 500_000 // n_users))
+    results = {}
+    for name, bench, data in (
+        ("compatibility_score", bench_compatibility_score, rows),
+        ("rank_candidates", bench_rank_candidates, rows),
+        ("get_profiles_except", bench_get_profiles_except, user_ids),
+        ("matches_route", bench_matches_route, usernames),
+    ):
+        results[name] = bench(data, rnd, repeats)
+        r = results[name]
+        log(f"  {n_users:>7d} {name:20s} {r['throughput_per_s']:>14,.0f} {r['unit']}/s  "
+            f"p50 {r['p50_ms']:9.3f} ms  p95 {r['p95_ms']:9.3f} ms  p99 {r['p99_ms']:9.3f} ms  "
+            f"peak {r['peak_mem_mb']:8.2f} MB")
+    database.get_pool().close()
+    return results
+
+
+def merge_runs(runs):
+    """
+    Per benchmark, the median of every number over several run_size results,
+    and the spread of each compared one (see the module docstring).
+    """
+    merged = {}
+    for name, first in runs[0].items():
+        merged[name] = {}
+        for key, value in first.items():
+            if not isinstance(value, float):
+                merged[name][key] = value
+                continue
+            merged[name][key] = round(statistics.median(r[name][key] for r in runs), 4)
+            if key in COMPARED:
+                values = [r[name][key] for r in runs]
+                median = statistics.median(values)
+                mad = statistics.median(abs(v - median) for v in values)
+                merged[name][key + "_spread"] = round(1.4826 * mad / median, 4) if median else 0.0
+        merged[name]["runs"] = len(runs)
+    return merged
+
+
+def compare(current, baseline, tolerance, warn=print):
+    """List of human-readable regressions of `current` against `baseline`."""
+    problems = []
+    for size, benches in current["results"].items():
+        for name, now in benches.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base:
+                continue
+            label = f"{name} @ {size} users"
+            for key, higher_is_worse in COMPARED.items():
+                if not base.get(key):
+                    continue
+                noise = NOISE_SIGMAS * base.get(key + "_spread", 0.0)
+                if noise > MAX_BAND:
+                    warn(f"WARNING: {label}: {key} varies by {noise:.0%} run to run (3 sigma); "
+                         f"checked at {MAX_BAND:.0%}, record the baseline with more --runs")
+                band = min(MAX_BAND, max(tolerance, noise))
+                change = now[key] / base[key] - 1
+                if (change if higher_is_worse else -change / (1 + change)) > band:
+                    problems.append(f"{label}: {key} {now[key]:,.3f} vs baseline {base[key]:,.3f} "
+                                    f"({change:+.0%}, band {band:.0%})")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=os.path.join(BENCH_DIR, "results.json"))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    report = {
+        "meta": {
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {
+            str(n): merge_runs([run_size(n, args.seed) for _ in range(max(1, args.runs))])
+            for n in sizes
+        },
+    }
+    roomsync.shutdown()
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"updated baseline {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        problems = compare(report, json.load(f), args.tolerance)
+    for p in problems:
+        print("REGRESSION:", p)
+    if problems:
+        sys.exit(1)
+    print(f"no regressions beyond each benchmark's noise band (at least {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
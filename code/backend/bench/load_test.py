@@ -0,0 +1,127 @@
+"""
+load_test.py
+Python version of tests/roomsync-tests LoadTest.test500SimultaneousUsers:
+N virtual users (default 500) pushed through a fixed thread pool (default
+100) with a 2 second connect/read timeout, against a running server.
+
+Each virtual user hits the chosen routes in order and the report shows, per
+route: requests, failures, throughput and p50 / p95 / p99 / max latency.
+For login / matches, accounts loadtest<i> are registered first (idempotent).
+Responses shed by rate limiting / admission control (429) are failures and
+are also counted in the "429" column. Every virtual user logs in from the
+same address, so start the server with RATE_LIMITS="" to measure raw
+capacity.
+
+Usage (from code/backend, with the server already running):
+    gunicorn -c gunicorn.conf.py wsgi:app
+    python bench/load_test.py --url http://localhost:5001 --routes base,login,matches
+"""
+
+import argparse
+import http.cookiejar
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.failures = {}
+        self.shed = {}
+
+    def add(self, route, seconds, status):
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            self.failures[route] = self.failures.get(route, 0) + (status != 200)
+            self.shed[route] = self.shed.get(route, 0) + (status == 429)
+
+    def report(self, wall):
+        print(f"{'route':10s} {'reqs':>6s} {'fail':>5s} {'429':>5s} {'req/s':>8s} "
+              f"{'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'max ms':>8s}")
+        for route, values in self.latencies.items():
+            values = sorted(values)
+            print(f"{route:10s} {len(values):6d} {self.failures[route]:5d} {self.shed[route]:5d} "
+                  f"{len(values) / wall:8.1f} "
+                  f"{percentile(values, 50) * 1000:8.1f} {percentile(values, 95) * 1000:8.1f} "
+                  f"{percentile(values, 99) * 1000:8.1f} {values[-1] * 1000:8.1f}")
+
+
+def request(opener, url, data=None, timeout=2.0):
+    """HTTP status of the response, or 0 if the request failed outright."""
+    body = urllib.parse.urlencode(data).encode() if data is not None else None
+    try:
+        with opener.open(url, data=body, timeout=timeout) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+    except (urllib.error.URLError, OSError):
+        return 0
+
+
+def virtual_user(i, args, results):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    creds = {"username": f"loadtest{i}", "password": "loadtest"}
+    for route in args.routes:
+        t0 = time.perf_counter()
+        if route == "base":
+            status = request(opener, args.url + "/base", timeout=args.timeout)
+        elif route == "login":
+            status = request(opener, args.url + "/login", creds, timeout=args.timeout)
+        elif route == "matches":
+            status = request(opener, args.url + "/matches", timeout=args.timeout)
+        else:
+            raise SystemExit(f"unknown route {route!r}")
+        results.add(route, time.perf_counter() - t0, status)
+
+
+def register_users(args):
+    opener = urllib.request.build_opener()
+    for i in range(args.users):
+        request(opener, args.url + "/register", {
+            "email": f"loadtest{i}@example.com", "username": f"loadtest{i}", "password": "loadtest",
+        }, timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:5001")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--routes", default="base", help="comma list of base, login, matches")
+    args = parser.parse_args()
+    args.url = args.url.rstrip("/")
+    args.routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+
+    if {"login", "matches"} & set(args.routes):
+        register_users(args)
+
+    results = Results()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        for i in range(args.users):
+            pool.submit(virtual_user, i, args, results)
+    results.report(time.perf_counter() - t0)
+
+    # Same bar as LoadTest.java: at least 90% of the first route succeeds
+    first = args.routes[0]
+    ok = len(results.latencies[first]) - results.failures[first]
+    if ok < 0.9 * args.users:
+        raise SystemExit(f"only {ok}/{args.users} {first} requests succeeded")
+
+
+if __name__ == "__main__":
+    main()
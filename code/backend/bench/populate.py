@@ -0,0 +1,137 @@
+"""
+populate.py
+Seeded synthetic population for roommate.db: users, profiles, accepted
+matches, blocks and reports. The same --seed and --users always produce the
+same rows.
+
+Skew is deliberate, so benchmarks see realistic postings and not a uniform
+spread:
+- locations follow a Zipf-like curve (a few big cities, a long tail), with
+  spelling variants ("Seattle, WA", "seattle") so canonicalization gets exercised
+- lifestyle, smoking, pets and cleanliness have lopsided splits, and some
+  fields are left blank
+- budgets are clustered around $900 with a long upper tail
+
+Every user's password is "password" (hashed once, shared by all rows).
+
+Usage (from code/backend):
+    python bench/populate.py --users 10000 [--seed 42] [--db path/to/roommate.db] [--append]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import locations
+from auth_utils import hash_password
+
+PASSWORD = "password"
+
+# (spellings, weight): weight ~ 1 / rank, so the top city holds about a third of users
+CITIES = [
+    (["Seattle", "Seattle, WA", "seattle", "Capitol Hill"], 1.0),
+    (["Tacoma", "Tacoma WA"], 1 / 2),
+    (["Bellevue", "Bellevue, Washington"], 1 / 3),
+    (["Redmond"], 1 / 4),
+    (["Everett"], 1 / 5),
+    (["Kirkland"], 1 / 6),
+    (["Renton"], 1 / 7),
+    (["Olympia"], 1 / 8),
+    (["Spokane"], 1 / 9),
+    (["Portland", "PDX"], 1 / 10),
+    (["Bellingham"], 1 / 11),
+    (["Walla Walla"], 1 / 12),      # not in the gazetteer: matched as plain text
+    ([""], 1 / 4),                  # no location given
+]
+LIFESTYLES = (["early sleeper", "night owl", "student", "remote worker", ""], [40, 30, 15, 10, 5])
+SMOKING = (["no", "yes", ""], [80, 12, 8])
+PETS = (["no", "yes", ""], [55, 35, 10])
+CLEANLINESS = (["medium", "high", "low", ""], [45, 35, 12, 8])
+REASONS = ["spam", "fake profile", "harassment", "no-show", ""]
+
+
+def _pick(rnd, choices):
+    values, weights = choices
+    return rnd.choices(values, weights)[0]
+
+
+def make_profile(rnd):
+    spellings, _ = rnd.choices(CITIES, [w for _, w in CITIES])[0]
+    location = rnd.choice(spellings)
+    budget = "" if rnd.random() < 0.05 else str(int(min(3000, max(350, rnd.lognormvariate(6.8, 0.3)))))
+    return (budget, location, locations.region_id(location), _pick(rnd, LIFESTYLES),
+            _pick(rnd, SMOKING), _pick(rnd, PETS), _pick(rnd, CLEANLINESS))
+
+
+def populate(conn, n_users: int, seed: int = 42, profile_share: float = 0.9, log=print):
+    """Append `n_users` users (and their data) to the open connection; returns the first new id."""
+    rnd = random.Random(seed)
+    t0 = time.perf_counter()
+    password_hash = hash_password(PASSWORD)
+    first = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0] or 0) + 1
+    ids = range(first, first + n_users)
+    # The seed decides the names, so --append with a new seed can't collide with an old run
+    tag = f"s{seed}n{first}"
+
+    conn.executemany(
+        "INSERT INTO users (id, email, username, password_hash) VALUES (?, ?, ?, ?)",
+        ((i, f"{tag}u{i}@example.com", f"{tag}u{i}", password_hash) for i in ids),
+    )
+    conn.executemany(
+        """INSERT INTO profiles (user_id, budget, location, region_id, lifestyle, smoking, pets, cleanliness)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        ((i, *make_profile(rnd)) for i in ids if rnd.random() < profile_share),
+    )
+
+    def other(i):
+        j = rnd.randrange(first, first + n_users)
+        return j if j != i else (j + 1 - first) % n_users + first
+
+    conn.executemany(
+        """INSERT INTO matches (user1_id, user2_id, status, accepted_at)
+           VALUES (?, ?, 'accepted', datetime('now', ?))""",
+        ((i, other(i), f"-{rnd.randint(0, 30)} days")
+         for i in rnd.sample(ids, n_users // 20)),
+    )
+    # Most users block nobody, a few block many
+    conn.executemany(
+        "INSERT OR IGNORE INTO blocks (blocker_id, blocked_id) VALUES (?, ?)",
+        ((i, other(i)) for i in rnd.sample(ids, n_users // 25)
+         for _ in range(min(50, int(rnd.paretovariate(1.5))))),
+    )
+    conn.executemany(
+        "INSERT INTO reports (reporter_id, reported_id, reason) VALUES (?, ?, ?)",
+        ((i, other(i), rnd.choice(REASONS)) for i in rnd.sample(ids, n_users // 50)),
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    log(f"populated {n_users} users (ids {first}-{first + n_users - 1}) "
+        f"in {time.perf_counter() - t0:.1f}s")
+    return first
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default=None, help="database file (default: database.DB_PATH)")
+    parser.add_argument("--append", action="store_true", help="allow adding to a non-empty database")
+    args = parser.parse_args()
+
+    if args.db:
+        database.DB_PATH = os.path.abspath(args.db)
+    database.init_db()
+    with database.connection() as conn:
+        existing = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        if existing and not args.append:
+            raise SystemExit(f"{database.DB_PATH} already has {existing} users (use --append)")
+        populate(conn, args.users, args.seed)
+
+
+if __name__ == "__main__":
+    main()
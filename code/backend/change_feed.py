@@ -0,0 +1,175 @@
+"""
+change_feed.py
+In-process tail of the changelog table (database._add_changelog).
+
+SQLite triggers append one row per insert/update/delete on users, profiles,
+blocks and matches, whichever process or statement made it: /profile,
+database.block_user, bulk writes, cleanup deletes, other gunicorn workers,
+admin scripts. Each row gets a sequence number that only grows, so a reader
+that remembers the last seq it applied can pick up exactly where it stopped
+instead of rescanning the tables.
+
+WHAT THIS MODULE PROVIDES
+- Change(seq, table, op, user_id, other_id)
+    table: "users" | "profiles" | "blocks" | "matches"
+    op:    "insert" | "update" | "delete"
+    user_id / other_id: users.id, profiles.user_id, blocks.blocker_id /
+    blocked_id, matches.user1_id / user2_id
+- ChangeFeed.subscribe(callback, name=None, start=None, on_reset=None)
+    callback(list[Change]) gets every change after the subscriber's offset,
+    in seq order. The offset starts at `start`, else at the offset last saved
+    under `name` (maintenance_state "changefeed:<name>"), else at the current
+    head. Named subscribers save their offset after each delivered batch, so
+    they resume across restarts. If the callback raises, the batch is
+    retried on the next poll.
+    on_reset() is called instead when the offset fell behind the oldest row
+    still in the log (see database.prune_changelog): changes were lost, so
+    the subscriber must rebuild from the tables.
+- ChangeFeed.poll(): deliver everything committed so far. When it returns,
+  every change committed before the call has been delivered, so writers
+  call it right after their own commit.
+- ChangeFeed.start() / stop(): poll on a daemon thread every `interval`
+  seconds (picks up other processes' writes).
+
+Stats (ChangeFeed.stats()): polls, changes, resets, errors, head, lag (rows
+behind the head for the slowest subscriber)
+
+Config (env):
+- CHANGE_FEED_INTERVAL_SECONDS   background poll interval (0 = only poll after own writes)
+- CHANGE_FEED_BATCH              rows fetched per query (default 1000)
+"""
+
+from __future__ import annotations
+import logging
+import os
+import threading
+from typing import Callable, NamedTuple
+
+import database
+
+log = logging.getLogger(__name__)
+
+CHANGE_FEED_INTERVAL_SECONDS = float(os.environ.get("CHANGE_FEED_INTERVAL_SECONDS", 1))
+CHANGE_FEED_BATCH = int(os.environ.get("CHANGE_FEED_BATCH", 1000))
+
+
+class Change(NamedTuple):
+    seq: int
+    table: str
+    op: str
+    user_id: int | None
+    other_id: int | None
+
+
+class _Subscriber:
+    __slots__ = ("callback", "name", "offset", "on_reset")
+
+    def __init__(self, callback, name, offset, on_reset):
+        self.callback = callback
+        self.name = name
+        self.offset = offset
+        self.on_reset = on_reset
+
+
+class ChangeFeed:
+    def __init__(self, interval: float = CHANGE_FEED_INTERVAL_SECONDS, batch_size: int = CHANGE_FEED_BATCH):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._subscribers: list[_Subscriber] = []
+        self._poll_lock = threading.Lock()   # one poll at a time, so changes apply in order
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._stats = {"polls": 0, "changes": 0, "resets": 0, "errors": 0, "head": 0}
+
+    def subscribe(
+        self,
+        callback: Callable[[list[Change]], None],
+        name: str | None = None,
+        start: int | None = None,
+        on_reset: Callable[[], None] | None = None,
+    ) -> int:
+        """Register a subscriber; returns the offset it starts after."""
+        if start is None and name:
+            saved = database.get_state(f"changefeed:{name}")
+            start = int(saved) if saved is not None else None
+        if start is None:
+            start = database.get_changelog_bounds()[1]
+        with self._poll_lock:
+            self._subscribers.append(_Subscriber(callback, name, start, on_reset))
+        return start
+
+    def poll(self) -> int:
+        """Deliver every committed change to every subscriber; returns changes delivered."""
+        delivered = 0
+        with self._poll_lock:
+            oldest, head = database.get_changelog_bounds()
+            for sub in self._subscribers:
+                if oldest is not None and sub.offset < oldest - 1:
+                    self._reset(sub, head)
+                    continue
+                while sub.offset < head:
+                    rows = database.get_changes(sub.offset, self.batch_size)
+                    if not rows:
+                        break
+                    changes = [Change(*r) for r in rows]
+                    try:
+                        sub.callback(changes)
+                    except Exception:
+                        log.exception("change feed subscriber %s failed at seq %d",
+                                      sub.name or sub.callback, changes[0].seq)
+                        with self._lock:
+                            self._stats["errors"] += 1
+                        break
+                    self._advance(sub, changes[-1].seq)
+                    delivered += len(changes)
+            with self._lock:
+                self._stats["polls"] += 1
+                self._stats["changes"] += delivered
+                self._stats["head"] = head
+        return delivered
+
+    def _advance(self, sub: _Subscriber, seq: int):
+        sub.offset = seq
+        if sub.name:
+            database.set_state(f"changefeed:{sub.name}", str(seq))
+
+    def _reset(self, sub: _Subscriber, head: int):
+        log.warning("change feed subscriber %s fell behind the changelog; resetting",
+                    sub.name or sub.callback)
+        with self._lock:
+            self._stats["resets"] += 1
+        if sub.on_reset is not None:
+            try:
+                sub.on_reset()
+            except Exception:
+                log.exception("change feed reset of %s failed", sub.name or sub.callback)
+                with self._lock:
+                    self._stats["errors"] += 1
+                return
+        self._advance(sub, head)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        offsets = [s.offset for s in self._subscribers]
+        stats["lag"] = stats["head"] - min(offsets) if offsets else 0
+        return stats
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                log.exception("change feed poll failed")
+
+    def start(self):
+        if self.interval > 0 and (self._thread is None or not self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="roomsync-change-feed", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float | None = 5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
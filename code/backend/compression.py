@@ -0,0 +1,88 @@
+"""
+compression.py
+gzip / brotli response compression for text responses, including streamed
+ones (compressed chunk by chunk as the template renders).
+
+Brotli is used when the client accepts it AND the optional `brotli` package
+is installed; otherwise gzip. Static files (sent straight from disk) and
+bodies smaller than COMPRESS_MIN_BYTES are left alone. A compressed
+response's ETag is made weak, since the bytes differ from the identity
+representation.
+
+WHAT THIS MODULE PROVIDES
+- init_app(app)
+
+Config (env):
+- COMPRESS_MIN_BYTES: smallest body worth compressing (default: 1024)
+- COMPRESS_LEVEL:     gzip level 1-9 (default: 6; brotli uses quality 5)
+"""
+
+from __future__ import annotations
+import os
+import zlib
+
+from flask import request
+
+try:
+    import brotli  # optional
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", 6))
+COMPRESSIBLE = ("text/html", "text/css", "text/plain", "application/json", "application/javascript")
+
+
+def _compressor(encoding: str):
+    """(process, finish) for one response body."""
+    if encoding == "br":
+        c = brotli.Compressor(quality=5)
+        return c.process, c.finish
+    c = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)  # 31 = gzip container
+    return c.compress, c.flush
+
+
+def _choose(accept_encodings) -> str | None:
+    if brotli is not None and accept_encodings["br"]:
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress_stream(chunks, encoding):
+    process, finish = _compressor(encoding)
+    for chunk in chunks:
+        out = process(chunk.encode() if isinstance(chunk, str) else chunk)
+        if out:
+            yield out
+    yield finish()
+
+
+def init_app(app):
+    @app.after_request
+    def _compress(response):
+        if (response.status_code != 200
+                or response.direct_passthrough
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = _choose(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = _compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+        else:
+            body = response.get_data()
+            if len(body) < COMPRESS_MIN_BYTES:
+                return response
+            process, finish = _compressor(encoding)
+            response.set_data(process(body) + finish())
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
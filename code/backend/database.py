@@ -6,7 +6,14 @@ TEAM OWNER: Database 1 (Profiles) & Database 2 (Matches) (Emery)
 """
 
 import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import locations
+import metrics
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
@@ -19,15 +26,207 @@ DB_PATH = os.path.join(
     "roommate.db"
 )
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+# -------------------------
+# Connection pool
+# -------------------------
+# Connections are opened once, get their PRAGMAs once, and are reused.
+# Inside a Flask request (app.py calls begin_request) the first helper that
+# needs a connection binds one pooled connection to the request, and every
+# helper after it reuses that one; app.py returns it in teardown (close_db).
+# When every kept connection is busy (request threads plus the cleanup,
+# change feed, warm-up and write queue threads), the pool opens extra ones
+# rather than make callers wait, and closes them again when they come back.
+# ConnectionPool.stats() reports the counts (app.py's /metrics gauges).
+
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))  # connections kept open
+POOL_MAX = int(os.environ.get("DB_POOL_MAX", 64))   # hard cap, including extra ones
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5))  # seconds to wait at the cap
+BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", 5000))
+SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")  # NORMAL is safe with WAL
+CACHE_SIZE = int(os.environ.get("DB_CACHE_SIZE", -16000))  # negative = KiB, so 16 MB
+MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", 256 * 1024 * 1024))
+BULK_CHUNK_SIZE = int(os.environ.get("DB_BULK_CHUNK_SIZE", 1000))  # rows per commit in bulk writes
+
+def _connect(path: str) -> sqlite3.Connection:
+    metrics.add("db_connections_opened", 1)
+    conn = sqlite3.connect(path, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS:d}")
+    conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size={CACHE_SIZE:d}")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE:d}")
+    return conn
+
+class ConnectionPool:
+    """
+    Thread-safe pool keeping `size` open connections to `path`. Grows past
+    `size` on demand (up to `max_size`) and closes the extra connections
+    when they are released; only at `max_size` does acquire() wait.
+    """
+
+    def __init__(self, path: str, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT,
+                 max_size: int = POOL_MAX):
+        self.path = path
+        self.size = size
+        self.max_size = max(size, max_size)
+        self.timeout = timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.max_size:
+                self._opened += 1
+                open_new = True
+            else:
+                open_new = False
+        if open_new:
+            try:
+                return _connect(self.path)
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f"connection pool exhausted ({self.max_size} connections busy)"
+            ) from None
+
+    def release(self, conn: sqlite3.Connection):
+        # Never hand out a connection with someone else's half-done transaction
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            extra = self._opened > self.size
+            if extra:
+                self._opened -= 1
+        if extra:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    def stats(self) -> dict:
+        """open (connections alive), idle (waiting in the pool), in_use, size, max_size."""
+        with self._lock:
+            opened = self._opened
+        idle = self._idle.qsize()
+        return {"open": opened, "idle": idle, "in_use": max(0, opened - idle),
+                "size": self.size, "max_size": self.max_size}
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._opened -= 1
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+_request_conn: ContextVar = ContextVar("request_conn", default=None)
+_in_request: ContextVar = ContextVar("in_request", default=False)
+
+def get_pool() -> ConnectionPool:
+    """Shared pool for the current DB_PATH (rebuilt if DB_PATH is changed)."""
+    global _pool
+    pool = _pool
+    if pool is None or pool.path != DB_PATH:
+        with _pool_lock:
+            if _pool is None or _pool.path != DB_PATH:
+                if _pool is not None:
+                    _pool.close()
+                _pool = ConnectionPool(DB_PATH)
+            pool = _pool
+    return pool
+
+def begin_request():
+    """Mark the current context as a request, so connection() binds like get_db() (before_request hook)."""
+    _in_request.set(True)
+
+def get_db():
+    """The connection bound to the current request (borrowed from the pool on first use)."""
+    conn = _request_conn.get()
+    if conn is None:
+        conn = get_pool().acquire()
+        _request_conn.set(conn)
     return conn
 
+def close_db(exc=None):
+    """Return the request's connection to the pool (registered as a Flask teardown)."""
+    _in_request.set(False)
+    conn = _request_conn.get()
+    if conn is not None:
+        _request_conn.set(None)
+        get_pool().release(conn)
+
+@contextmanager
+def connection():
+    """
+    The request's connection inside a request (bound on first use), else
+    one borrowed from the pool for this block.
+    """
+    conn = _request_conn.get()
+    if conn is None and _in_request.get():
+        conn = get_db()
+    if conn is not None:
+        yield conn
+        return
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+_initialized_path: str | None = None
+
 def init_db():
     # Shared: Database 1 + Database 2
+    # Once per process and DB file; after that, and for a DB that is already
+    # at SCHEMA_VERSION, this is one PRAGMA read and no writes.
+    global _initialized_path
+    if _initialized_path == DB_PATH:
+        return
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+    with connection() as conn:
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            migrate(conn)
+    _initialized_path = DB_PATH
+
+# -------------------------
+# Schema migrations
+# -------------------------
+# Each migration runs once, in its own transaction, and bumps PRAGMA
+# user_version. Statements are written to be idempotent so a DB created
+# before versioning (user_version = 0) upgrades cleanly.
+
+def migrate(conn):
+    """Apply every migration newer than the DB's PRAGMA user_version."""
+    for version, step in MIGRATIONS:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have applied it while we waited for the lock
+            if conn.execute("PRAGMA user_version").fetchone()[0] < version:
+                step(conn)
+                conn.execute(f"PRAGMA user_version={version:d}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def _create_schema(conn):
+    # Version 1: the original tables
     c = conn.cursor()
     c.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -94,193 +293,781 @@ def init_db():
     c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users(email)")
     c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users(username)")
 
-    conn.commit()
-    conn.close()
+def _add_lookup_indexes(conn):
+    # Version 2: one profile per user + indexes for the hot queries.
+    # blocks already has UNIQUE(blocker_id, blocked_id), which covers the
+    # "blocked_id FROM blocks WHERE blocker_id = ?" subquery.
+    c = conn.cursor()
 
+    # Keep only the newest row for users that ended up with several profiles
+    c.execute("""
+        DELETE FROM profiles
+        WHERE id NOT IN (SELECT MAX(id) FROM profiles GROUP BY user_id)
+    """)
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_profiles_user_id ON profiles(user_id)")
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_matches_user1 ON matches(user1_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_matches_user2 ON matches(user2_id)")
+    # Covering indexes for the cleanup query's two UNION halves
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_matches_status_accepted_user1
+        ON matches(status, accepted_at, user1_id)
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_matches_status_accepted_user2
+        ON matches(status, accepted_at, user2_id)
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_reports_reported ON reports(reported_id)")
+
+def _add_maintenance_state(conn):
+    # Version 3: small key/value table for background jobs (e.g. cleanup watermark)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS maintenance_state (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+
+def _add_match_suggestions(conn):
+    # Version 4: top-N matches per user written by precompute_matches.py
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS match_suggestions (
+            user_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            candidate_id INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            computed_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, rank)
+        ) WITHOUT ROWID
+    """)
+
+def _add_profile_regions(conn):
+    # Version 5: canonical region per profile (locations.py) so location
+    # matching and "same region" lookups use an indexed integer
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(profiles)")}
+    if "region_id" not in columns:
+        conn.execute("ALTER TABLE profiles ADD COLUMN region_id INTEGER")
+    backfill_region_ids(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_profiles_region ON profiles(region_id, user_id)")
+
+def backfill_region_ids(conn):
+    """Recompute profiles.region_id from location (after the gazetteer changes). Returns rows changed."""
+    rows = conn.execute("SELECT id, location, region_id FROM profiles").fetchall()
+    changed = [(rid, r[0]) for r in rows
+               if (rid := locations.region_id(r[1])) != r[2]]
+    conn.executemany("UPDATE profiles SET region_id=? WHERE id=?", changed)
+    return len(changed)
+
+# table -> (column logged as user_id, column logged as other_id) for the changelog
+CHANGELOG_TABLES = {
+    "users": ("id", None),
+    "profiles": ("user_id", None),
+    "blocks": ("blocker_id", "blocked_id"),
+    "matches": ("user1_id", "user2_id"),
+}
+
+def _add_changelog(conn):
+    # Version 6: every insert/update/delete on the tables above appends a row
+    # here (via triggers), so any process can tail what changed (change_feed.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS changelog (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            op TEXT NOT NULL,
+            user_id INTEGER,
+            other_id INTEGER,
+            changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    for table, (key, other) in CHANGELOG_TABLES.items():
+        for op, row in (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD")):
+            if table == "users" and op == "update":
+                continue  # password rehashes; nothing derived depends on them
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS changelog_{table}_{op}
+                AFTER {op.upper()} ON {table}
+                BEGIN
+                    INSERT INTO changelog (table_name, op, user_id, other_id)
+                    VALUES ('{table}', '{op}', {row}.{key}, {f"{row}.{other}" if other else "NULL"});
+                END
+            """)
+
+def _add_rate_limits(conn):
+    # Version 7: token buckets shared by every worker (rate_limit.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+def _add_suggestion_candidate_index(conn):
+    # Version 8: find every precomputed list a user appears in, so their
+    # rows can be dropped when their profile changes
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_match_suggestions_candidate ON match_suggestions(candidate_id)"
+    )
+
+# profiles columns a precomputed score depends on (precompute_matches.py)
+SUGGESTION_INPUT_COLUMNS = ("budget", "location", "region_id", "lifestyle", "smoking", "pets", "cleanliness")
+
+def _add_suggestion_invalidation(conn):
+    # Version 9: a profile edit or delete drops that user's precomputed list
+    # and their rows in everyone else's, inside the writer's own transaction
+    # (once per write, whichever process made it)
+    drop = """
+        DELETE FROM match_suggestions WHERE user_id = {row}.{key};
+        DELETE FROM match_suggestions WHERE candidate_id = {row}.{key};
+    """
+    changed = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in SUGGESTION_INPUT_COLUMNS)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS suggestions_profiles_update
+        AFTER UPDATE ON profiles WHEN {changed}
+        BEGIN {drop.format(row="NEW", key="user_id")} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS suggestions_profiles_delete
+        AFTER DELETE ON profiles
+        BEGIN {drop.format(row="OLD", key="user_id")} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS suggestions_users_delete
+        AFTER DELETE ON users
+        BEGIN {drop.format(row="OLD", key="id")} END
+    """)
+
+MIGRATIONS = [
+    (1, _create_schema),
+    (2, _add_lookup_indexes),
+    (3, _add_maintenance_state),
+    (4, _add_match_suggestions),
+    (5, _add_profile_regions),
+    (6, _add_changelog),
+    (7, _add_rate_limits),
+    (8, _add_suggestion_candidate_index),
+    (9, _add_suggestion_invalidation),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+@metrics.timed("db", rows=True)
 def add_user(email: str, username: str, hashed_pw: str):
     # Database 1
     """Insert a new user; returns rowid or None on duplicate."""
-    conn = get_db()
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO users (email, username, password_hash)
-            VALUES (?, ?, ?)
-            """,
-            (email, username, hashed_pw),
-        )
-        conn.commit()
-        return cur.lastrowid
-    except sqlite3.IntegrityError:
-        return None  # duplicate email or username
-    finally:
-        conn.close()
+    with connection() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                INSERT INTO users (email, username, password_hash)
+                VALUES (?, ?, ?)
+                """,
+                (email, username, hashed_pw),
+            )
+            conn.commit()
+            return cur.lastrowid
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            return None  # duplicate email or username
 
+@metrics.timed("db", rows=True)
 def get_user_by_username(username: str):
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE username=? LIMIT 1", (username,))
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM users WHERE username=? LIMIT 1", (username,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+@metrics.timed("db", rows=True)
+def update_password_hash(user_id: int, password_hash: str):
+    """Replace a user's stored hash (used to upgrade legacy hashes at login)."""
+    with connection() as conn:
+        conn.execute("UPDATE users SET password_hash=? WHERE id=?", (password_hash, user_id))
+        conn.commit()
 
+@metrics.timed("db", rows=True)
 def get_user_by_login(login_identifier: str):
     """Return a user by username OR email."""
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT * FROM users WHERE username=? OR email=? LIMIT 1",
-        (login_identifier, login_identifier),
-    )
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT * FROM users WHERE username=? OR email=? LIMIT 1",
+            (login_identifier, login_identifier),
+        )
+        row = cur.fetchone()
+        return dict(row) if row else None
 
 # Helpers for the frontend to access user profile data
+@metrics.timed("db", rows=True)
 def get_profile_by_user_id(user_id: int):
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM profiles WHERE user_id=? LIMIT 1", (user_id,))
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM profiles WHERE user_id=? LIMIT 1", (user_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
 
+@metrics.timed("db", rows=True)
 def get_user_and_profile(user_id: int):
     """Username + email + profile fields in one dict."""
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT u.id AS user_id, u.username, u.email,
-               p.budget, p.location, p.lifestyle, p.smoking, p.pets, p.cleanliness
-        FROM users u
-        LEFT JOIN profiles p ON p.user_id = u.id
-        WHERE u.id=? LIMIT 1
-    """, (user_id,))
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT u.id AS user_id, u.username, u.email,
+                   p.budget, p.location, p.region_id, p.lifestyle, p.smoking, p.pets, p.cleanliness
+            FROM users u
+            LEFT JOIN profiles p ON p.user_id = u.id
+            WHERE u.id=? LIMIT 1
+        """, (user_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
 
+@metrics.timed("db", rows=True)
 def get_profiles_except(user_id: int):
     """All other users with their profile fields (if any), excluding users blocked by current user."""
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT 
-            u.id AS user_id,
-            u.username,
-            u.email,
-            COALESCE(p.budget, '') AS budget,
-            COALESCE(p.location, '') AS location,
-            COALESCE(p.lifestyle, '') AS lifestyle,
-            COALESCE(p.smoking, '') AS smoking,
-            COALESCE(p.pets, '') AS pets,
-            COALESCE(p.cleanliness, '') AS cleanliness
-        FROM users u
-        LEFT JOIN profiles p ON p.user_id = u.id
-        WHERE u.id <> ?
-          AND u.id NOT IN (
-              SELECT blocked_id FROM blocks WHERE blocker_id = ?
-          )
-        ORDER BY u.id
-    """, (user_id, user_id))
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    return list(iter_profiles_except(user_id))
 
+def iter_profiles_except(user_id: int, page_size: int = 5000, chunk_size: int = 500):
+    """
+    Generator version of get_profiles_except (same rows, same ORDER BY u.id).
+    Reads one keyset page (u.id > last id seen) of `page_size` rows per query
+    and pulls it from the cursor `chunk_size` rows at a time with fetchmany,
+    so the whole population is never held in memory at once.
+    """
+    last_id = 0
+    while True:
+        with connection() as conn:
+            cur = conn.execute("""
+                SELECT 
+                    u.id AS user_id,
+                    u.username,
+                    u.email,
+                    COALESCE(p.budget, '') AS budget,
+                    COALESCE(p.location, '') AS location,
+                    p.region_id,
+                    COALESCE(p.lifestyle, '') AS lifestyle,
+                    COALESCE(p.smoking, '') AS smoking,
+                    COALESCE(p.pets, '') AS pets,
+                    COALESCE(p.cleanliness, '') AS cleanliness
+                FROM users u
+                LEFT JOIN profiles p ON p.user_id = u.id
+                WHERE u.id > ?
+                  AND u.id <> ?
+                  AND u.id NOT IN (
+                      SELECT blocked_id FROM blocks WHERE blocker_id = ?
+                  )
+                ORDER BY u.id
+                LIMIT ?
+            """, (last_id, user_id, user_id, page_size))
+            seen = 0
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                seen += len(rows)
+                last_id = rows[-1]["user_id"]
+                for r in rows:
+                    yield dict(r)
+        if seen < page_size:
+            return
 
+@metrics.timed("db", rows=True)
+def get_profiles_by_ids(ids):
+    """Same rows as get_profiles_except, but only for the given user ids (ORDER BY u.id)."""
+    ids = list(ids)
+    if not ids:
+        return []
+    with connection() as conn:
+        cur = conn.cursor()
+        rows = []
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cur.execute(f"""
+                SELECT 
+                    u.id AS user_id,
+                    u.username,
+                    u.email,
+                    COALESCE(p.budget, '') AS budget,
+                    COALESCE(p.location, '') AS location,
+                    p.region_id,
+                    COALESCE(p.lifestyle, '') AS lifestyle,
+                    COALESCE(p.smoking, '') AS smoking,
+                    COALESCE(p.pets, '') AS pets,
+                    COALESCE(p.cleanliness, '') AS cleanliness
+                FROM users u
+                LEFT JOIN profiles p ON p.user_id = u.id
+                WHERE u.id IN ({",".join("?" * len(chunk))})
+            """, chunk)
+            rows.extend(dict(r) for r in cur.fetchall())
+        rows.sort(key=lambda r: r["user_id"])
+        return rows
+
+@metrics.timed("db", rows=True)
+def get_blocked_ids(blocker_id: int):
+    """Ids of every user blocked by `blocker_id`."""
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT blocked_id FROM blocks WHERE blocker_id=?", (blocker_id,))
+        rows = cur.fetchall()
+        return [r[0] for r in rows]
+
+@metrics.timed("db", rows=True)
+def get_all_match_profiles():
+    """user_id + the matching fields for every user, by id (builds profile_index / profile_store)."""
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT u.id AS user_id,
+                   p.budget, p.location, p.region_id, p.lifestyle, p.smoking, p.pets, p.cleanliness
+            FROM users u
+            LEFT JOIN profiles p ON p.user_id = u.id
+            ORDER BY u.id
+        """)
+        rows = cur.fetchall()
+        return [dict(r) for r in rows]
+
+def iter_match_profiles(chunk_size: int = 5000):
+    """Like get_all_match_profiles, but streamed in user-id order, `chunk_size` rows per query."""
+    last_id = 0
+    while True:
+        with connection() as conn:
+            rows = conn.execute("""
+                SELECT u.id AS user_id,
+                       p.budget, p.location, p.region_id, p.lifestyle, p.smoking, p.pets, p.cleanliness
+                FROM users u
+                LEFT JOIN profiles p ON p.user_id = u.id
+                WHERE u.id > ?
+                ORDER BY u.id
+                LIMIT ?
+            """, (last_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        for r in rows:
+            yield dict(r)
+        last_id = rows[-1]["user_id"]
+
+def iter_users(chunk_size: int = 5000):
+    """id, email, username for every user in id order, `chunk_size` rows per query."""
+    last_id = 0
+    while True:
+        with connection() as conn:
+            rows = conn.execute(
+                "SELECT id, email, username FROM users WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, chunk_size),
+            ).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1]["id"]
+
+@metrics.timed("db", rows=True)
+def get_users_version():
+    """(count, max id) of users: changes whenever a user is added or deleted (admin page ETag)."""
+    with connection() as conn:
+        return tuple(conn.execute("SELECT COUNT(*), MAX(id) FROM users").fetchone())
+
+@metrics.timed("db", rows=True)
+def get_blocked_map(blocker_ids):
+    """{blocker_id: set(blocked_ids)} for every given blocker (missing = blocks nobody)."""
+    ids = list(blocker_ids)
+    blocked = {}
+    with connection() as conn:
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = conn.execute(f"""
+                SELECT blocker_id, blocked_id FROM blocks
+                WHERE blocker_id IN ({",".join("?" * len(chunk))})
+            """, chunk).fetchall()
+            for r in rows:
+                blocked.setdefault(r[0], set()).add(r[1])
+    return blocked
+
+
+@metrics.timed("db", rows=True)
 def get_user_by_email(email):
     # Database 1
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE email=?", (email,))
-    row = c.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT * FROM users WHERE email=?", (email,))
+        row = c.fetchone()
+        return dict(row) if row else None
 
+@metrics.timed("db", rows=True)
 def add_profile(user_id, budget, location, lifestyle, smoking, pets, cleanliness):
     # Database 1
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO profiles (user_id, budget, location, lifestyle, smoking, pets, cleanliness)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (user_id, budget, location, lifestyle, smoking, pets, cleanliness))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute("""
+            INSERT INTO profiles (user_id, budget, location, region_id, lifestyle, smoking, pets, cleanliness)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, budget, location, locations.region_id(location),
+              lifestyle, smoking, pets, cleanliness))
+        conn.commit()
+
+@metrics.timed("db", rows=True)
+def get_user_ids_in_region(region_id: int):
+    """Ids of users whose profile is in `region_id` (idx_profiles_region), ascending."""
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT user_id FROM profiles WHERE region_id=? ORDER BY user_id", (region_id,)
+        ).fetchall()
+        return [r[0] for r in rows]
 
+@metrics.timed("db", rows=True)
 def get_all_profiles():
     # Database 2
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM profiles")
-    rows = cur.fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM profiles")
+        rows = cur.fetchall()
+        return [dict(r) for r in rows]
 
 # -------------------------
 # Matches + cleanup helpers
 # -------------------------
 
+@metrics.timed("db", rows=True)
 def record_accepted_match(user1_id: int, user2_id: int):
     """
     Record that two users have accepted a match.
     Stores timestamp so we can clean up profiles after 10 days.
     """
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO matches (user1_id, user2_id, status, accepted_at)
-        VALUES (?, ?, 'accepted', datetime('now'))
-    """, (user1_id, user2_id))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO matches (user1_id, user2_id, status, accepted_at)
+            VALUES (?, ?, 'accepted', datetime('now'))
+        """, (user1_id, user2_id))
+        conn.commit()
 
+@metrics.timed("db", rows=True)
 def delete_profiles_for_old_matches(days: int = 10):
     """
     Delete profiles for users whose match was accepted at least `days` days ago.
     This satisfies the requirement: delete user profiles 10 days after
     a successful match is accepted.
     """
-    conn = get_db()
-    cur = conn.cursor()
-    # Find all user_ids in accepted matches older than N days
-    cur.execute("""
-        DELETE FROM profiles
-        WHERE user_id IN (
-            SELECT user1_id FROM matches
-            WHERE status = 'accepted'
-              AND accepted_at <= datetime('now', ?)
-            UNION
-            SELECT user2_id FROM matches
-            WHERE status = 'accepted'
-              AND accepted_at <= datetime('now', ?)
+    with connection() as conn:
+        cur = conn.cursor()
+        # Find all user_ids in accepted matches older than N days
+        cur.execute("""
+            DELETE FROM profiles
+            WHERE user_id IN (
+                SELECT user1_id FROM matches
+                WHERE status = 'accepted'
+                  AND accepted_at <= datetime('now', ?)
+                UNION
+                SELECT user2_id FROM matches
+                WHERE status = 'accepted'
+                  AND accepted_at <= datetime('now', ?)
+            )
+        """, (f'-{days} days', f'-{days} days'))
+        conn.commit()
+
+@metrics.timed("db", rows=True)
+def delete_profiles_for_expired_matches_batch(days: int = 10, batch_size: int = 250):
+    """
+    One bounded step of the profile cleanup, for the background scheduler.
+
+    Only looks at matches that expired since the last step: the last processed
+    (accepted_at, id) is kept in maintenance_state, so each call picks up where
+    the previous one stopped. Handles at most `batch_size` matches in one short
+    write transaction.
+
+    Returns (profiles_deleted, user_ids, matches_processed, last_accepted_at).
+    """
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM maintenance_state WHERE name='cleanup_watermark'"
+            ).fetchone()
+            last_at, last_id = row[0].rsplit("|", 1) if row else ("", 0)
+            matches = conn.execute("""
+                SELECT id, user1_id, user2_id, accepted_at FROM matches
+                WHERE status = 'accepted'
+                  AND accepted_at <= datetime('now', ?)
+                  AND (accepted_at, id) > (?, ?)
+                ORDER BY accepted_at, id
+                LIMIT ?
+            """, (f'-{days} days', last_at, int(last_id), batch_size)).fetchall()
+            if not matches:
+                conn.commit()
+                return 0, [], 0, None
+
+            user_ids = sorted({m["user1_id"] for m in matches} | {m["user2_id"] for m in matches})
+            cur = conn.execute(
+                f"DELETE FROM profiles WHERE user_id IN ({','.join('?' * len(user_ids))})",
+                user_ids,
+            )
+            last = matches[-1]
+            conn.execute(
+                "INSERT OR REPLACE INTO maintenance_state (name, value) VALUES ('cleanup_watermark', ?)",
+                (f"{last['accepted_at']}|{last['id']}",),
+            )
+            conn.commit()
+            return cur.rowcount, user_ids, len(matches), last["accepted_at"]
+        except Exception:
+            conn.rollback()
+            raise
+
+# -------------------------
+# Job state + match suggestions
+# -------------------------
+
+@metrics.timed("db", rows=True)
+def get_state(name: str):
+    with connection() as conn:
+        row = conn.execute("SELECT value FROM maintenance_state WHERE name=?", (name,)).fetchone()
+        return row[0] if row else None
+
+@metrics.timed("db", rows=True)
+def set_state(name: str, value: str):
+    with connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO maintenance_state (name, value) VALUES (?, ?)", (name, value)
         )
-    """, (f'-{days} days', f'-{days} days'))
-    conn.commit()
-    conn.close()
-    
+        conn.commit()
+
+@metrics.timed("db", rows=True)
+def save_match_suggestions(ranked_by_user, state_name=None, state_value=None):
+    """
+    Replace the stored suggestions for every user in `ranked_by_user`
+    ({user_id: [(candidate_id, score), ...]}) in one transaction. Optionally
+    records job progress in maintenance_state inside the same transaction.
+    """
+    with connection() as conn:
+        try:
+            user_ids = list(ranked_by_user)
+            conn.executemany("DELETE FROM match_suggestions WHERE user_id=?", ((u,) for u in user_ids))
+            conn.executemany(
+                """
+                INSERT INTO match_suggestions (user_id, rank, candidate_id, score, computed_at)
+                VALUES (?, ?, ?, ?, datetime('now'))
+                """,
+                ((uid, rank, cid, score)
+                 for uid, ranked in ranked_by_user.items()
+                 for rank, (cid, score) in enumerate(ranked)),
+            )
+            if state_name is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO maintenance_state (name, value) VALUES (?, ?)",
+                    (state_name, state_value),
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+@metrics.timed("db", rows=True)
+def get_match_suggestions(user_id: int, max_age_hours: float = 24, limit: int = -1, after_rank: int = -1):
+    """
+    Precomputed matches for `user_id`, best first, in the same shape as
+    rank_candidates output plus each row's "rank" (position in the stored
+    list; pass the last one as `after_rank` for the next page). Skips
+    suggestions older than `max_age_hours` and users blocked since they were
+    computed. Empty list if none are fresh.
+    """
+    with connection() as conn:
+        rows = conn.execute("""
+            SELECT s.score,
+                   s.rank,
+                   u.id AS user_id,
+                   u.username,
+                   u.email,
+                   COALESCE(p.budget, '') AS budget,
+                   COALESCE(p.location, '') AS location,
+                   p.region_id,
+                   COALESCE(p.lifestyle, '') AS lifestyle,
+                   COALESCE(p.smoking, '') AS smoking,
+                   COALESCE(p.pets, '') AS pets,
+                   COALESCE(p.cleanliness, '') AS cleanliness
+            FROM match_suggestions s
+            JOIN users u ON u.id = s.candidate_id
+            LEFT JOIN profiles p ON p.user_id = u.id
+            WHERE s.user_id = ?
+              AND s.rank > ?
+              AND s.computed_at >= datetime('now', ?)
+              AND s.candidate_id NOT IN (
+                  SELECT blocked_id FROM blocks WHERE blocker_id = ?
+              )
+            ORDER BY s.rank
+            LIMIT ?
+        """, (user_id, after_rank, f"-{max_age_hours} hours", user_id, limit)).fetchall()
+    ranked = []
+    for r in rows:
+        profile = dict(r)
+        score = profile.pop("score")
+        rank = profile.pop("rank")
+        ranked.append({"profile": profile, "score": score, "rank": rank})
+    return ranked
+
+@metrics.timed("db", rows=True)
+def get_suggested_ids(user_id: int, max_age_hours: float = 24):
+    """Every candidate in `user_id`'s fresh precomputed list (blocked ones included)."""
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT candidate_id FROM match_suggestions WHERE user_id = ? AND computed_at >= datetime('now', ?)",
+            (user_id, f"-{max_age_hours} hours"),
+        ).fetchall()
+    return [r[0] for r in rows]
+
+@metrics.timed("db", rows=True)
 def block_user(blocker_id: int, blocked_id: int):
     """Insert a block entry; prevents match/display."""
-    conn = get_db()
-    cur = conn.cursor()
-    try:
+    with connection() as conn:
+        cur = conn.cursor()
         cur.execute("""
             INSERT OR IGNORE INTO blocks (blocker_id, blocked_id)
             VALUES (?, ?)
         """, (blocker_id, blocked_id))
         conn.commit()
-    finally:
-        conn.close()
-
 
+@metrics.timed("db", rows=True)
 def report_user(reporter_id: int, reported_id: int, reason: str):
     """Record user reports for admin review."""
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO reports (reporter_id, reported_id, reason)
-        VALUES (?, ?, ?)
-    """, (reporter_id, reported_id, reason))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO reports (reporter_id, reported_id, reason)
+            VALUES (?, ?, ?)
+        """, (reporter_id, reported_id, reason))
+        conn.commit()
+
+# -------------------------
+# Changelog (filled by triggers, see _add_changelog)
+# -------------------------
+
+@metrics.timed("db", rows=True)
+def get_changes(after_seq: int, limit: int = 1000):
+    """Up to `limit` changelog rows with seq > after_seq, oldest first."""
+    with connection() as conn:
+        return conn.execute(
+            """SELECT seq, table_name, op, user_id, other_id FROM changelog
+               WHERE seq > ? ORDER BY seq LIMIT ?""",
+            (after_seq, limit),
+        ).fetchall()
+
+@metrics.timed("db", rows=True)
+def get_changelog_bounds():
+    """(oldest seq still kept, newest seq); (None, 0) when the log is empty."""
+    with connection() as conn:
+        row = conn.execute("SELECT MIN(seq), MAX(seq) FROM changelog").fetchone()
+        return row[0], row[1] or 0
+
+@metrics.timed("db", rows=True)
+def prune_changelog(keep_rows: int):
+    """Delete all but the newest `keep_rows` (at least 1) changelog rows; returns rows deleted."""
+    with connection() as conn:
+        cur = conn.execute(
+            "DELETE FROM changelog WHERE seq <= (SELECT MAX(seq) FROM changelog) - ?",
+            (max(1, keep_rows),),
+        )
+        conn.commit()
+        return cur.rowcount
+
+# -------------------------
+# Rate limits (token buckets, see rate_limit.py)
+# -------------------------
+
+@metrics.timed("db")
+def take_token(key: str, capacity: float, rate: float, now: float, busy_timeout_ms: int | None = None):
+    """
+    Refill `key`'s bucket at `rate` tokens/s (up to `capacity`) and take one
+    token, atomically across processes. Returns (allowed, tokens left).
+    `busy_timeout_ms` caps the wait for the write lock for this call
+    (sqlite3.OperationalError once it runs out).
+    """
+    with connection() as conn:
+        if busy_timeout_ms is not None:
+            conn.execute(f"PRAGMA busy_timeout={busy_timeout_ms:d}")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at FROM rate_limits WHERE key=?", (key,)
+                ).fetchone()
+                tokens = capacity if row is None else min(
+                    capacity, row[0] + max(0.0, now - row[1]) * rate
+                )
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                conn.commit()
+                return allowed, tokens
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            if busy_timeout_ms is not None:
+                conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS:d}")
+
+@metrics.timed("db", rows=True)
+def prune_rate_limits(idle_before: float):
+    """Forget buckets untouched since `idle_before` (they'd be full again anyway)."""
+    with connection() as conn:
+        cur = conn.execute("DELETE FROM rate_limits WHERE updated_at < ?", (idle_before,))
+        conn.commit()
+        return cur.rowcount
+
+# -------------------------
+# Bulk writes
+# -------------------------
+# executemany inside one transaction per chunk, so a few thousand rows cost
+# a handful of commits (fsyncs) instead of one each. write_rows is also what
+# write_queue.WriteBehindQueue uses to flush several tables at once.
+
+BULK_SQL = {
+    "matches": """
+        INSERT INTO matches (user1_id, user2_id, status, accepted_at)
+        VALUES (?, ?, 'accepted', datetime('now'))
+    """,
+    "blocks": "INSERT OR IGNORE INTO blocks (blocker_id, blocked_id) VALUES (?, ?)",
+    "reports": "INSERT INTO reports (reporter_id, reported_id, reason) VALUES (?, ?, ?)",
+}
+
+@metrics.timed("db", rows=True)
+def write_rows(rows_by_table):
+    """
+    Insert {table: [row tuple, ...]} (tables from BULK_SQL) in ONE transaction.
+    Returns {table: rows inserted}; duplicate blocks are ignored, not counted.
+    """
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            written = {}
+            for table, rows in rows_by_table.items():
+                written[table] = conn.executemany(BULK_SQL[table], rows).rowcount
+            conn.commit()
+            return written
+        except Exception:
+            conn.rollback()
+            raise
+
+def _write_chunked(table, rows, chunk_size):
+    total = 0
+    chunk = []
+    for row in rows:
+        chunk.append(tuple(row))
+        if len(chunk) >= chunk_size:
+            total += write_rows({table: chunk})[table]
+            chunk = []
+    if chunk:
+        total += write_rows({table: chunk})[table]
+    return total
+
+def record_accepted_matches(pairs, chunk_size: int = BULK_CHUNK_SIZE):
+    """Bulk record_accepted_match for (user1_id, user2_id) pairs; returns rows inserted."""
+    return _write_chunked("matches", pairs, chunk_size)
+
+def block_users(pairs, chunk_size: int = BULK_CHUNK_SIZE):
+    """Bulk block_user for (blocker_id, blocked_id) pairs; returns new blocks."""
+    return _write_chunked("blocks", pairs, chunk_size)
+
+def report_users(reports, chunk_size: int = BULK_CHUNK_SIZE):
+    """Bulk report_user for (reporter_id, reported_id, reason) rows; returns rows inserted."""
+    return _write_chunked("reports", reports, chunk_size)
@@ -0,0 +1,42 @@
+"""
+gunicorn.conf.py
+Production serving config: several worker processes, each with a few
+threads (gthread), so slow /matches requests and SQLite waits don't block
+the whole server. Every setting can be overridden from the environment.
+
+    GUNICORN_WORKERS   worker processes          (default: 2 * CPUs + 1)
+    GUNICORN_THREADS   threads per worker        (default: 4)
+    GUNICORN_TIMEOUT   seconds before a stuck worker is restarted (default: 30)
+    GUNICORN_GRACEFUL  seconds to finish in-flight requests on SIGTERM (default: 30)
+    RANK_WORKERS       rank processes per worker (default: CPUs // workers, which
+                       is 0 = off with the default worker count: the web workers
+                       already keep every core busy, and a pool per worker would
+                       start about 2 * CPUs^2 processes)
+    PORT               listen port               (default: 5001, same as app.py)
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5001)}"
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL", 30))
+# Read by parallel_rank when each worker imports the app
+os.environ.setdefault("RANK_WORKERS", str(multiprocessing.cpu_count() // workers))
+keepalive = 5
+backlog = 2048  # LoadTest.java opens up to 500 connections at once
+
+# Import the app in each worker after the fork, so no DB connections or
+# background threads are shared between processes
+preload_app = False
+accesslog = "-"
+
+
+def worker_exit(server, worker):
+    # SIGTERM: gunicorn stops accepting, waits for in-flight requests, then
+    # calls this so the cleanup thread and process/DB pools shut down cleanly
+    import app
+    app.shutdown()
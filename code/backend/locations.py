@@ -0,0 +1,115 @@
+"""
+locations.py
+Location canonicalization: free-text locations -> integer region ids.
+
+"Seattle", "seattle, wa", "Seattle WA" and "Capitol Hill" all map to the same
+region. The gazetteer is a small CSV (locations.csv next to this module:
+region_id, name, '|'-separated aliases; kept out of data/ because the
+database volume is mounted over that directory). Trailing state / country words ("wa", "washington",
+"usa") are dropped when the full text isn't a known name or alias.
+
+Profiles store the region id (profiles.region_id, indexed) when they are
+written, so matching compares one integer and /matches can fetch everyone in
+a region with an index lookup.
+
+If the gazetteer can't be read, a warning is logged and every location is
+unknown (region_id() returns None), so matching falls back to comparing the
+normalized text instead of failing.
+
+WHAT THIS MODULE PROVIDES
+- normalize(text) -> str
+- region_id(text) -> int | None
+- region_name(region_id) -> str | None
+- reload(path=None) -> re-read the gazetteer
+
+Config (env):
+- LOCATION_GAZETTEER: CSV path (default: locations.csv next to this file)
+"""
+
+from __future__ import annotations
+import csv
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+
+log = logging.getLogger(__name__)
+
+GAZETTEER_PATH = os.environ.get(
+    "LOCATION_GAZETTEER",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "locations.csv"),
+)
+
+# Dropped from the end of a location when the full text isn't recognized
+_SUFFIXES = {"wa", "washington", "usa", "us", "united states"}
+_PUNCT = re.compile(r"[^\w\s]+")
+
+_aliases: dict[str, int] = {}
+_names: dict[int, str] = {}
+_lock = threading.Lock()
+_loaded = False
+
+
+def normalize(text: str | None) -> str:
+    """Lowercase, punctuation to spaces, single spaces."""
+    if not text:
+        return ""
+    return " ".join(_PUNCT.sub(" ", text.lower()).split())
+
+
+def reload(path: str | None = None):
+    """(Re)read the gazetteer CSV."""
+    global _aliases, _names, _loaded
+    aliases: dict[str, int] = {}
+    names: dict[int, str] = {}
+    with open(path or GAZETTEER_PATH, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            rid = int(row["region_id"])
+            names[rid] = normalize(row["name"])
+            aliases[names[rid]] = rid
+            for alias in (row.get("aliases") or "").split("|"):
+                if normalize(alias):
+                    aliases[normalize(alias)] = rid
+    with _lock:
+        _aliases, _names, _loaded = aliases, names, True
+    region_id.cache_clear()
+
+
+def _ensure_loaded():
+    global _loaded
+    if _loaded:
+        return
+    try:
+        reload()
+    except OSError as exc:
+        log.warning("location gazetteer unavailable (%s); matching locations by text", exc)
+        with _lock:
+            _loaded = True
+
+
+@lru_cache(maxsize=65536)
+def region_id(text: str | None) -> int | None:
+    """Region id for a free-text location, or None if it isn't in the gazetteer."""
+    _ensure_loaded()
+    words = normalize(text).split()
+    while words:
+        rid = _aliases.get(" ".join(words))
+        if rid is not None:
+            return rid
+        # "seattle wa usa" -> "seattle wa" -> "seattle"
+        for n in (2, 1):
+            if len(words) > n and " ".join(words[-n:]) in _SUFFIXES:
+                words = words[:-n]
+                break
+        else:
+            return None
+    return None
+
+
+def region_name(rid: int | None) -> str | None:
+    """Canonical (normalized) name of a region id."""
+    if rid is None:
+        return None
+    _ensure_loaded()
+    return _names.get(rid)
@@ -0,0 +1,157 @@
+"""
+maintenance.py
+Background maintenance for RoomSync, kept out of the request path.
+
+CleanupScheduler runs the "delete profiles 10 days after an accepted match"
+rule on a daemon thread every `interval` seconds. Each run only processes
+matches that expired since the previous run (the watermark is stored in the
+database, see database.delete_profiles_for_expired_matches_batch) and deletes
+in small batches, so the SQLite write lock is only ever held briefly.
+The same thread trims the changelog (change_feed.py) to its newest
+`changelog_keep_rows` rows every `changelog_interval` seconds, on its own
+schedule: turning the cleanup off (interval=0) does not let the log grow
+without bound.
+
+Metrics (CleanupScheduler.stats()):
+- runs, rows_deleted_total, last_rows_deleted, last_matches_processed
+- last_duration_s, last_run_at, changelog_rows_pruned
+- lag_s: how long the oldest still-unprocessed expired match has been
+  waiting past its expiry (0 when the run caught up)
+"""
+
+from __future__ import annotations
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable
+
+import database
+
+log = logging.getLogger(__name__)
+
+
+class CleanupScheduler:
+    def __init__(
+        self,
+        interval: float = 3600,
+        days: int = 10,
+        batch_size: int = 250,
+        max_batches: int = 200,
+        on_deleted: Callable[[Iterable[int]], None] | None = None,
+        changelog_keep_rows: int = 100_000,
+        changelog_interval: float = 300,
+    ):
+        self.interval = interval
+        self.days = days
+        self.batch_size = batch_size
+        self.max_batches = max_batches  # per run, so one run can't go on forever
+        self.on_deleted = on_deleted    # called with the user ids whose profiles were removed
+        self.changelog_keep_rows = changelog_keep_rows  # 0 = never prune
+        self.changelog_interval = changelog_interval    # 0 = never prune
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "runs": 0,
+            "rows_deleted_total": 0,
+            "last_rows_deleted": 0,
+            "last_matches_processed": 0,
+            "last_duration_s": 0.0,
+            "last_run_at": None,
+            "lag_s": 0.0,
+            "changelog_rows_pruned": 0,
+        }
+
+    def run_once(self) -> dict:
+        """Process newly expired matches in batches; returns the updated stats."""
+        start = time.perf_counter()
+        deleted = processed = 0
+        last_at = None
+        caught_up = False
+        for _ in range(self.max_batches):
+            rows, user_ids, n, at = database.delete_profiles_for_expired_matches_batch(
+                days=self.days, batch_size=self.batch_size
+            )
+            deleted += rows
+            processed += n
+            last_at = at or last_at
+            if user_ids and self.on_deleted:
+                self.on_deleted(user_ids)
+            if n < self.batch_size:
+                caught_up = True
+                break
+
+        lag = 0.0
+        if not caught_up and last_at:
+            expired_at = datetime.strptime(last_at, "%Y-%m-%d %H:%M:%S").replace(
+                tzinfo=timezone.utc
+            ) + timedelta(days=self.days)
+            lag = max(0.0, (datetime.now(timezone.utc) - expired_at).total_seconds())
+
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["rows_deleted_total"] += deleted
+            self._stats["last_rows_deleted"] = deleted
+            self._stats["last_matches_processed"] = processed
+            self._stats["last_duration_s"] = time.perf_counter() - start
+            self._stats["last_run_at"] = time.time()
+            self._stats["lag_s"] = lag
+        return self.stats()
+
+    def prune_changelog(self) -> int:
+        """Trim the changelog to its newest `changelog_keep_rows` rows; returns rows deleted."""
+        pruned = database.prune_changelog(self.changelog_keep_rows)
+        with self._lock:
+            self._stats["changelog_rows_pruned"] += pruned
+        return pruned
+
+    @property
+    def enabled(self) -> bool:
+        """Whether start() has anything to do."""
+        return self.interval > 0 or (self.changelog_interval > 0 and self.changelog_keep_rows > 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def _loop(self):
+        # (interval, job) pairs that are switched on; each keeps its own deadline
+        jobs = []
+        if self.interval > 0:
+            jobs.append((self.interval, self._cleanup))
+        if self.changelog_interval > 0 and self.changelog_keep_rows > 0:
+            jobs.append((self.changelog_interval, self._prune))
+        due = [0.0] * len(jobs)
+        while jobs and not self._stop.is_set():
+            for i, (interval, job) in enumerate(jobs):
+                if time.monotonic() >= due[i]:
+                    job()
+                    due[i] = time.monotonic() + interval
+            self._stop.wait(max(0.0, min(due) - time.monotonic()))
+
+    def _cleanup(self):
+        try:
+            result = self.run_once()
+            if result["last_rows_deleted"]:
+                log.info("cleanup deleted %d profiles in %.3fs (lag %.0fs)",
+                         result["last_rows_deleted"], result["last_duration_s"], result["lag_s"])
+        except Exception:
+            log.exception("profile cleanup failed")
+
+    def _prune(self):
+        try:
+            self.prune_changelog()
+        except Exception:
+            log.exception("changelog prune failed")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="roomsync-cleanup", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float | None = 5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,229 @@
+"""
+match_cache.py
+Per-user cache of ranked /matches results (LRU + TTL + memory cap).
+
+Each entry keeps the viewer's own profile, the ranked list and the ids they
+blocked, so writes can be applied precisely instead of throwing lists away:
+
+- the viewer's own profile changes  -> drop that viewer's entry (recomputed on next view)
+- another user's profile changes     -> rescore just that user in every cached list
+- block_user(blocker, blocked)       -> remove `blocked` from the blocker's list
+- a block is removed                 -> drop the blocker's entry
+- a user is deleted                  -> drop their entry and remove them from every list
+
+A cached list is an exact prefix of the full ranking (score desc, then
+user_id, same order as rank_candidates over get_profiles_except). It holds a
+few spare rows beyond what the page shows, so removals don't force a
+recompute; once fewer than `limit` rows remain the entry is dropped.
+"""
+
+from __future__ import annotations
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Mapping
+
+from matching import compatibility_score
+
+_ROW_OVERHEAD = 200  # rough bytes for a cached row's dict + tuple on top of its strings
+
+
+def _row_bytes(profile: Mapping[str, Any]) -> int:
+    return _ROW_OVERHEAD + sum(len(v) for v in profile.values() if isinstance(v, str))
+
+
+class _Entry:
+    __slots__ = ("me", "keys", "rows", "limit", "truncated", "exclude", "expires", "nbytes")
+
+    def __init__(self, me, ranked, limit, truncated, exclude, expires):
+        self.me = dict(me)
+        # keys[i] = (-score, user_id) sorts exactly like the ranking
+        self.rows = [(r["score"], r["profile"]) for r in ranked]
+        self.keys = [(-s, p["user_id"]) for s, p in self.rows]
+        self.limit = limit
+        self.truncated = truncated
+        self.exclude = set(exclude)
+        self.expires = expires
+        self.nbytes = _row_bytes(self.me) + sum(_row_bytes(p) for _, p in self.rows)
+
+    def _remove(self, user_id) -> bool:
+        for i, (_, uid) in enumerate(self.keys):
+            if uid == user_id:
+                del self.keys[i]
+                _, p = self.rows.pop(i)
+                self.nbytes -= _row_bytes(p)
+                return True
+        return False
+
+    def _insert(self, key, score, profile):
+        i = bisect.bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.rows.insert(i, (score, profile))
+        self.nbytes += _row_bytes(profile)
+
+    def rescore(self, profile: Mapping[str, Any]) -> bool:
+        """Apply another user's new profile; False if the entry can no longer be trusted."""
+        uid = profile["user_id"]
+        if uid in self.exclude:
+            return True
+        self._remove(uid)
+        score = compatibility_score(self.me, profile)
+        key = (-score, uid)
+        if not self.truncated:
+            self._insert(key, score, dict(profile))
+        elif self.keys and key < self.keys[-1]:
+            # Beats the last cached row, so it belongs in the known prefix
+            self._insert(key, score, dict(profile))
+        # Otherwise it ranks somewhere after the cached prefix, which stays exact
+        return len(self.rows) >= self.limit or not self.truncated
+
+    def discard(self, user_id) -> bool:
+        self._remove(user_id)
+        return len(self.rows) >= self.limit or not self.truncated
+
+    def block(self, blocked_id) -> bool:
+        self.exclude.add(blocked_id)
+        self._remove(blocked_id)
+        return len(self.rows) >= self.limit or not self.truncated
+
+
+class MatchCache:
+    def __init__(self, max_entries: int = 10_000, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rescored = 0
+
+    def get(self, user_id: int) -> list[dict[str, Any]] | None:
+        """The cached ranking for `user_id` (first `limit` rows), or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry.expires < time.monotonic():
+                if entry is not None:
+                    self._drop(user_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            rows = entry.rows[:entry.limit] if entry.limit else entry.rows
+            return [{"profile": p, "score": s} for s, p in rows]
+
+    def get_after(self, user_id: int, after: tuple[int, int], size: int) -> list[dict[str, Any]] | None:
+        """
+        The `size` rows ranked right after (score, user_id), for paging. None
+        if the entry is missing/expired or doesn't hold enough rows past it.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry.expires < time.monotonic():
+                self.misses += 1
+                return None
+            score, uid = after
+            i = bisect.bisect_right(entry.keys, (-score, uid))
+            if entry.truncated and len(entry.rows) - i < size:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return [{"profile": p, "score": s} for s, p in entry.rows[i:i + size]]
+
+    def put(
+        self,
+        user_id: int,
+        me: Mapping[str, Any],
+        ranked: list[dict[str, Any]],
+        limit: int,
+        truncated: bool,
+        exclude: Iterable[int] = (),
+    ):
+        """
+        Cache `ranked` (the top rows of the full ranking, possibly more than
+        `limit`). `truncated` says whether more eligible users exist beyond it.
+        """
+        entry = _Entry(me, ranked, limit, truncated, exclude, time.monotonic() + self.ttl)
+        with self._lock:
+            self._drop(user_id)
+            self._entries[user_id] = entry
+            self._bytes += entry.nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def profile_changed(self, profile: Mapping[str, Any]):
+        """`profile` is the user's new row (user_id, username, email + profile fields)."""
+        uid = profile["user_id"]
+        with self._lock:
+            if self._drop(uid):
+                self.invalidations += 1
+            for viewer, entry in list(self._entries.items()):
+                before = entry.nbytes
+                ok = entry.rescore(profile)
+                self._bytes += entry.nbytes - before
+                self.rescored += 1
+                if not ok:
+                    self._drop(viewer)
+                    self.invalidations += 1
+
+    def user_removed(self, user_id: int):
+        """`user_id` no longer exists: drop their list and take them out of everyone else's."""
+        with self._lock:
+            if self._drop(user_id):
+                self.invalidations += 1
+            for viewer, entry in list(self._entries.items()):
+                before = entry.nbytes
+                ok = entry.discard(user_id)
+                self._bytes += entry.nbytes - before
+                if not ok:
+                    self._drop(viewer)
+                    self.invalidations += 1
+
+    def invalidate(self, user_id: int):
+        """Drop `user_id`'s list (recomputed on their next view)."""
+        with self._lock:
+            if self._drop(user_id):
+                self.invalidations += 1
+
+    def blocked(self, blocker_id: int, blocked_id: int):
+        with self._lock:
+            entry = self._entries.get(blocker_id)
+            if entry is None:
+                return
+            before = entry.nbytes
+            ok = entry.block(blocked_id)
+            self._bytes += entry.nbytes - before
+            if not ok:
+                self._drop(blocker_id)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, user_id) -> bool:
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return False
+        self._bytes -= entry.nbytes
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "rescored": self.rescored,
+            }
@@ -1,16 +1,36 @@
 """
 matching.py
-RoomSync – Matching algorithm (standalone, no Flask/DB/UI dependencies)
+RoomSync – Matching algorithm (no Flask/DB/UI dependencies; uses locations
+for the gazetteer and metrics for timings, both stdlib-only)
 
 WHAT THIS MODULE PROVIDES
 - compatibility_score(me, other, weights=None) -> int
 - rank_candidates(me, candidates, weights=None, top_k=None) -> list[dict]
+- compile_profile(profile) -> tuple[int, ...]
+- compile_columns(compiled_profiles) -> list[array]
+- location_key(profile) -> str
+- intern(value) -> int / decode(code) -> str
+- score_batch(me_codes, columns, weights=None) -> list[int]
+- stream_rank_candidates(me, candidates, top_k, weights=None) -> list[dict]
+- graded_model() -> the scoring_model.ScoringModel in use, or None
+
+SCORING MODEL
+By default fields match all-or-nothing (budget by low/mid/high bucket). With
+SCORING_MODEL=graded every function above scores with the graded
+scoring_model.ScoringModel instead (scoring_model.json: budget by distance,
+so $899 vs $900 is a near-perfect match; cleanliness by level; nearby
+regions). Its weights come from that file, so `weights` arguments are
+ignored. Compiled profiles then hold the budget in dollar steps, and the
+index can't prune (profile_index.candidate_ids returns None). It is a
+per-process setting: every process sharing a match_suggestions table must
+use the same one.
 
 EXPECTED PROFILE FIELDS (strings OK; normalization is built-in):
 {
   "user_id": 123,
   "budget": "800",
   "location": "Seattle",
+  "region_id": 1,          (optional; looked up from location if absent)
   "lifestyle": "early sleeper",
   optional extras:
   "smoking": "no",
@@ -20,7 +40,18 @@ EXPECTED PROFILE FIELDS (strings OK; normalization is built-in):
 """
 
 from __future__ import annotations
-from typing import Any, Iterable, Mapping
+import heapq
+import os
+import threading
+from array import array
+from itertools import repeat
+from operator import add, mul
+from typing import Any, Iterable, Mapping, Sequence
+
+import locations
+import metrics
+
+SCORING_MODEL = os.environ.get("SCORING_MODEL", "exact")  # exact | graded
 
 DEFAULT_WEIGHTS = {
     "location": 35,
@@ -55,18 +86,48 @@ def _budget_bucket(budget: str | None) -> str:
     if "high" in b: return "high"
     return "unknown"
 
+def location_key(profile: Mapping[str, Any]) -> str:
+    """
+    What location matching compares: the canonical region name when the
+    location is in the gazetteer (so "Seattle, WA" == "seattle"), else the
+    normalized text. Uses the stored profiles.region_id when the row has it.
+    """
+    if "region_id" in profile:
+        rid = profile["region_id"]
+    else:
+        rid = locations.region_id(profile.get("location"))
+    return locations.region_name(rid) or _norm(profile.get("location"))
+
+_graded = None
+_graded_loaded = False
+
+def graded_model():
+    """The graded ScoringModel when SCORING_MODEL=graded (loaded once), else None."""
+    global _graded, _graded_loaded
+    if not _graded_loaded:
+        if SCORING_MODEL == "graded":
+            from scoring_model import ScoringModel  # imports this module
+            _graded = ScoringModel.from_config()
+        elif SCORING_MODEL != "exact":
+            raise ValueError(f"unknown SCORING_MODEL {SCORING_MODEL!r}")
+        _graded_loaded = True
+    return _graded
+
 def compatibility_score(
     me: Mapping[str, Any],
     other: Mapping[str, Any],
     weights: dict[str, int] | None = None,
 ) -> int:
+    model = graded_model()
+    if model is not None:
+        return model.score(me, other)
     W = (weights or DEFAULT_WEIGHTS).copy()
     score = 0
 
     if W.get("location", 0):
-        if _norm(me.get("location")) and _norm(other.get("location")):
-            if _norm(me.get("location")) == _norm(other.get("location")):
-                score += W["location"]
+        mine, theirs = location_key(me), location_key(other)
+        if mine and theirs and mine == theirs:
+            score += W["location"]
 
     if W.get("budget", 0):
         if _budget_bucket(me.get("budget")) == _budget_bucket(other.get("budget")):
@@ -85,12 +146,172 @@ def compatibility_score(
 
     return int(score)
 
+# -------------------------------------------------
+# Compiled profiles + batched scoring
+# -------------------------------------------------
+# A compiled profile is a tuple of integer codes, one per entry in FIELDS.
+# Code 0 means "missing" and never matches anything. Budget is stored as its
+# bucket code, which is never 0 (an unknown budget still matches another
+# unknown budget, exactly like compatibility_score). Location is coded from
+# location_key, so every spelling of one region shares a code. Under the
+# graded model, budget is the amount in steps instead (-1 = missing).
+
+FIELDS = ("location", "budget", "lifestyle", "smoking", "pets", "cleanliness")
+
+_BUDGET_CODES = {"low": 1, "mid": 2, "high": 3, "unknown": 4}
+
+_codes: dict[str, int] = {"": 0}
+_strings: list[str] = [""]  # code -> normalized string
+_codes_lock = threading.Lock()
+
+def _intern(value: str) -> int:
+    """Map a normalized string to a stable integer code (shared by all profiles)."""
+    code = _codes.get(value)
+    if code is None:
+        with _codes_lock:
+            code = _codes.get(value)
+            if code is None:
+                code = len(_strings)
+                _strings.append(value)
+                _codes[value] = code
+    return code
+
+def intern(value: str | None) -> int:
+    """Code for a raw field value (normalized first), same as compile_profile uses."""
+    return _intern(_norm(value))
+
+def decode(code: int) -> str:
+    """Normalized string for a code from compile_profile (not for the budget field)."""
+    return _strings[code]
+
+def _field_code(key: str, profile: Mapping[str, Any]) -> int:
+    if key == "location":
+        return _intern(location_key(profile))
+    if key == "budget":
+        model = graded_model()
+        if model is not None:
+            return model.budget_value(profile.get(key))
+        return _BUDGET_CODES[_budget_bucket(profile.get(key))]
+    return _intern(_norm(profile.get(key)))
+
+def compile_profile(profile: Mapping[str, Any]) -> tuple[int, ...]:
+    """Normalize a profile once and return its integer codes in FIELDS order."""
+    return tuple(_field_code(key, profile) for key in FIELDS)
+
+def compile_columns(compiled: Iterable[Sequence[int]]) -> list[array]:
+    """Turn compiled profiles (rows) into one compact int array per field."""
+    columns = [array("i") for _ in FIELDS]
+    for codes in compiled:
+        for col, code in zip(columns, codes):
+            col.append(code)
+    return columns
+
+def score_batch(
+    me_codes: Sequence[int],
+    columns: Sequence[Sequence[int]],
+    weights: dict[str, int] | None = None,
+) -> list[int]:
+    """
+    Score every candidate in `columns` against `me_codes` in one pass per field.
+    Each field builds an equality mask, multiplies it by the weight and adds it
+    to the running totals. Returns the same ints as compatibility_score.
+    """
+    model = graded_model()
+    if model is not None:
+        return model.score_codes(me_codes, columns)
+    W = weights or DEFAULT_WEIGHTS
+    n = len(columns[0]) if columns else 0
+    scores: list = [0] * n
+    for key, mine, col in zip(FIELDS, me_codes, columns):
+        w = W.get(key, 0)
+        if not w or not mine:
+            continue
+        scores = list(map(add, scores, map(mul, map(mine.__eq__, col), repeat(w))))
+    return [int(s) for s in scores]
+
+@metrics.timed("rank")
 def rank_candidates(
     me: Mapping[str, Any],
     candidates: Iterable[Mapping[str, Any]],
     weights: dict[str, int] | None = None,
     top_k: int | None = None,
 ) -> list[dict[str, Any]]:
-    scored = [{"profile": p, "score": compatibility_score(me, p, weights)} for p in candidates]
+    candidates = list(candidates)
+    metrics.add("candidates_scored", len(candidates))
+    columns = compile_columns(compile_profile(p) for p in candidates)
+    scores = score_batch(compile_profile(me), columns, weights)
+    if top_k:
+        # nlargest is documented as sorted(..., reverse=True)[:k], so ties keep input order
+        best = heapq.nlargest(top_k, range(len(scores)), key=scores.__getitem__)
+        return [{"profile": candidates[i], "score": scores[i]} for i in best]
+    scored = [{"profile": p, "score": s} for p, s in zip(candidates, scores)]
     scored.sort(key=lambda x: x["score"], reverse=True)
-    return scored[:top_k] if top_k else scored
\ No newline at end of file
+    return scored
+
+@metrics.timed("rank")
+def stream_rank_candidates(
+    me: Mapping[str, Any],
+    candidates: Iterable[Mapping[str, Any]],
+    top_k: int,
+    weights: dict[str, int] | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Streaming version of rank_candidates(me, candidates, weights, top_k).
+
+    `candidates` can be any iterable (e.g. a generator over a DB cursor); only
+    the best `top_k` profiles are kept, in a min-heap. Ties keep input order,
+    same as rank_candidates. Once the heap is full, a candidate stops being
+    scored as soon as a perfect result on its remaining fields could not beat
+    the current k-th best score.
+    """
+    if top_k <= 0:
+        return []
+    model = graded_model()
+    if model is not None:
+        # Partial similarities can't be bounded field by field: score every row
+        heap = []
+        seen = 0
+        for i, p in enumerate(candidates):
+            seen += 1
+            entry = (model.score(me, p), -i, p)
+            if len(heap) < top_k:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+        metrics.add("candidates_scored", seen)
+        heap.sort(reverse=True)
+        return [{"profile": p, "score": s} for s, _, p in heap]
+    W = weights or DEFAULT_WEIGHTS
+    me_codes = compile_profile(me)
+    plan = [(key, mine, W.get(key, 0)) for key, mine in zip(FIELDS, me_codes)]
+    plan = [(key, mine, w) for key, mine, w in plan if w and mine]
+
+    # best[j] = most the fields from j onwards can still add
+    best = [0] * (len(plan) + 1)
+    for j in range(len(plan) - 1, -1, -1):
+        best[j] = best[j + 1] + max(plan[j][2], 0)
+
+    # Heap entries are (score, -index, profile): the root is the current
+    # k-th best, and among equal scores the later candidate is the weaker one.
+    heap: list[tuple[int, int, Mapping[str, Any]]] = []
+    seen = 0
+    for i, p in enumerate(candidates):
+        seen += 1
+        full = len(heap) >= top_k
+        floor = heap[0][0] if full else None
+        score = 0
+        for j, (key, mine, w) in enumerate(plan):
+            if full and int(score + best[j]) <= floor:
+                break
+            if _field_code(key, p) == mine:
+                score += w
+        else:
+            score = int(score)
+            if not full:
+                heapq.heappush(heap, (score, -i, p))
+            elif score > floor:
+                heapq.heapreplace(heap, (score, -i, p))
+
+    metrics.add("candidates_scored", seen)
+    heap.sort(reverse=True)
+    return [{"profile": p, "score": s} for s, _, p in heap]
\ No newline at end of file
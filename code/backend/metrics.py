@@ -0,0 +1,230 @@
+"""
+metrics.py
+Lightweight timing + counter layer for the hot paths, exported as Prometheus
+text on /metrics (and, optionally, as a Server-Timing header per request).
+
+- @timed("db")      per-helper latency histogram + rows-returned histogram
+- @timed("rank")    per-entry-point latency histogram for matching code
+- add(name, n)      counter, also summed per request (e.g. candidates scored)
+- timer(kind, fn)   context manager version of @timed
+- gauge(name, fn)   value read at scrape time (cache stats, pool sizes, ...)
+- trace_calls()     also keep each request's individual @timed calls, for
+                    request_calls() (profiler.py attaches them to profiles)
+
+Config (env):
+- METRICS=0               disable everything; @timed then returns the function
+                          unchanged, so the disabled cost is zero per call
+- METRICS_SERVER_TIMING=1 add "Server-Timing: db;dur=..., rank;dur=..." headers
+
+No dependencies beyond the standard library (matching.py stays standalone).
+"""
+
+from __future__ import annotations
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+
+ENABLED = os.environ.get("METRICS", "1") != "0"
+SERVER_TIMING = ENABLED and os.environ.get("METRICS_SERVER_TIMING", "0") == "1"
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+_HELP = {
+    "roomsync_db_seconds": "Time spent in database.py helpers",
+    "roomsync_db_rows": "Rows returned by database.py helpers",
+    "roomsync_rank_seconds": "Time spent in matching / ranking entry points",
+    "roomsync_render_seconds": "Time spent rendering templates",
+    "roomsync_request_seconds": "Request latency per route",
+    "roomsync_candidates_scored_per_request": "Candidates scored while serving one request",
+}
+
+_lock = threading.Lock()
+_counters: dict[tuple[str, tuple], float] = {}
+_histograms: dict[tuple[str, tuple], "_Histogram"] = {}
+_gauges: dict[str, Callable[[], float]] = {}
+_request: ContextVar = ContextVar("metrics_request", default=None)
+_trace_calls = False
+MAX_TRACED_CALLS = 1000  # per request
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, value: float, buckets=SECONDS_BUCKETS, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = _Histogram(buckets)
+        hist.observe(value)
+
+
+def gauge(name: str, fn: Callable[[], float]):
+    """Register a value computed at scrape time."""
+    _gauges[name] = fn
+
+
+def add(name: str, n: int):
+    """Bump counter roomsync_<name>_total and this request's running total."""
+    if not ENABLED:
+        return
+    inc(f"roomsync_{name}_total", n)
+    req = _request.get()
+    if req is not None:
+        req["counts"][name] = req["counts"].get(name, 0) + n
+
+
+def _record(kind: str, fn_name: str, seconds: float, result=None, rows: bool = False):
+    observe(f"roomsync_{kind}_seconds", seconds, fn=fn_name)
+    if rows:
+        n = len(result) if isinstance(result, list) else (0 if result is None else 1)
+        observe(f"roomsync_{kind}_rows", n, COUNT_BUCKETS, fn=fn_name)
+    req = _request.get()
+    if req is not None:
+        req["timings"][kind] = req["timings"].get(kind, 0.0) + seconds
+        calls = req["calls"]
+        if calls is not None and len(calls) < MAX_TRACED_CALLS:
+            calls.append((kind, fn_name, seconds))
+
+
+def timed(kind: str, rows: bool = False):
+    """Decorator: latency histogram roomsync_<kind>_seconds{fn=...} (+ rows histogram)."""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            result = fn(*args, **kwargs)
+            _record(kind, fn.__name__, time.perf_counter() - t0, result, rows)
+            return result
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def timer(kind: str, fn_name: str):
+    if not ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(kind, fn_name, time.perf_counter() - t0)
+
+
+# -------------------------
+# Per-request bookkeeping (wired up in app.py)
+# -------------------------
+
+def trace_calls(enabled: bool = True):
+    """Record every @timed call of each request from now on (see request_calls)."""
+    global _trace_calls
+    _trace_calls = enabled
+
+
+def begin_request():
+    _request.set({"start": time.perf_counter(), "timings": {}, "counts": {},
+                  "calls": [] if _trace_calls else None})
+
+
+def request_calls() -> list[tuple[str, str, float]] | None:
+    """(kind, fn, seconds) of the current request's @timed calls so far, if traced."""
+    req = _request.get()
+    return None if req is None else req["calls"]
+
+
+def end_request(route: str) -> dict | None:
+    """Record the request's latency; returns its per-kind timings (seconds)."""
+    req = _request.get()
+    if req is None:
+        return None
+    _request.set(None)
+    observe("roomsync_request_seconds", time.perf_counter() - req["start"], route=route)
+    scored = req["counts"].get("candidates_scored")
+    if scored is not None:
+        observe("roomsync_candidates_scored_per_request", scored, COUNT_BUCKETS, route=route)
+    return req["timings"]
+
+
+def server_timing(timings: dict) -> str:
+    return ", ".join(f"{kind};dur={seconds * 1000:.2f}" for kind, seconds in timings.items())
+
+
+# -------------------------
+# Prometheus text exposition
+# -------------------------
+
+def _fmt_labels(labels: tuple, extra: tuple = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def render() -> str:
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(_histograms.items(), key=lambda kv: kv[0])
+        snapshot = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in histograms]
+
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_fmt_labels(labels)} {value}")
+
+    for (name, labels), counts, total, count, buckets in snapshot:
+        if name not in seen:
+            seen.add(name)
+            if name in _HELP:
+                lines.append(f"# HELP {name} {_HELP[name]}")
+            lines.append(f"# TYPE {name} histogram")
+        running = 0
+        for bound, n in zip(buckets, counts):
+            running += n
+            lines.append(f"{name}_bucket{_fmt_labels(labels, (('le', bound),))} {running}")
+        lines.append(f"{name}_bucket{_fmt_labels(labels, (('le', '+Inf'),))} {count}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {total}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {count}")
+
+    for name, fn in sorted(_gauges.items()):
+        try:
+            value = fn()
+        except Exception:
+            continue
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,138 @@
+"""
+parallel_rank.py
+Multi-process ranking for large candidate pools.
+
+Scoring is pure Python, so threads can't use more than one core. For pools of
+at least PARALLEL_MIN_CANDIDATES rows, rank_columns splits the compiled
+columns (see matching.compile_columns / profile_store) into one shard per
+worker, ships each shard as raw array bytes (no per-profile pickling), lets
+every worker return its local top-k and merges those into the global top-k.
+Smaller pools, and every pool under SCORING_MODEL=graded (its similarity
+tables need the parent's interned strings), are scored in-process. Both
+paths return the same list, in the same order, as the serial ranking.
+
+The process pool is created on first use and reused across requests.
+
+Config (env):
+- RANK_WORKERS             worker processes (default: CPU count; < 2 disables).
+                           Under gunicorn the default is CPUs // web workers
+                           (see gunicorn.conf.py), since every web worker gets
+                           its own pool
+- RANK_PARALLEL_MIN        pool size where the parallel path kicks in (default 50000)
+"""
+
+from __future__ import annotations
+import heapq
+import os
+import threading
+from array import array
+from typing import TYPE_CHECKING, Iterable, Sequence
+
+import metrics
+from matching import graded_model, score_batch
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+RANK_WORKERS = int(os.environ.get("RANK_WORKERS", os.cpu_count() or 1))
+PARALLEL_MIN_CANDIDATES = int(os.environ.get("RANK_PARALLEL_MIN", 50_000))
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _top(scores, ids, offset, top_k, exclude, after=None) -> list[tuple[int, int, int]]:
+    """(score, position, user_id) for the best rows, best first; ties keep position order."""
+    order = (i for i in range(len(scores)) if ids[i] not in exclude)
+    if after is not None:
+        # Keyset paging: only rows ranked strictly after (score, user_id)
+        a_score, a_uid = after
+        order = (i for i in order if scores[i] < a_score or (scores[i] == a_score and ids[i] > a_uid))
+    if top_k:
+        best = heapq.nlargest(top_k, order, key=scores.__getitem__)
+    else:
+        best = sorted(order, key=scores.__getitem__, reverse=True)
+    return [(scores[i], offset + i, ids[i]) for i in best]
+
+
+def _rank_shard(me_codes, weights, offset, ids_bytes, column_bytes, top_k, exclude, after):
+    # Runs in a worker process: rebuild the arrays from bytes and score them
+    ids = array("q")
+    ids.frombytes(ids_bytes)
+    columns = []
+    for raw in column_bytes:
+        col = array("i")
+        col.frombytes(raw)
+        columns.append(col)
+    return _top(score_batch(me_codes, columns, weights), ids, offset, top_k, exclude, after)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Imported here: multiprocessing is slow to import and most
+                # processes never rank enough candidates to need the pool
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # spawn: never fork a process that has DB/pool threads running
+                _pool = ProcessPoolExecutor(
+                    max_workers=RANK_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+@metrics.timed("rank")
+def rank_columns(
+    me_codes: Sequence[int],
+    ids: Sequence[int],
+    columns: Sequence[Sequence[int]],
+    top_k: int | None = None,
+    weights: dict[str, int] | None = None,
+    exclude: Iterable[int] = (),
+    parallel: bool | None = None,
+    after: tuple[int, int] | None = None,
+) -> list[tuple[int, int]]:
+    """
+    Rank compiled rows against `me_codes`; returns (user_id, score) pairs,
+    best first, ties in row order. `ids` / `columns` must be array-backed
+    (array or memoryview). parallel=None picks the mode from the pool size.
+    `after=(score, user_id)` skips everything up to and including that row,
+    for cursor-based paging (ids must be ascending, as in profile_store).
+    """
+    exclude = frozenset(exclude)
+    n = len(ids)
+    metrics.add("candidates_scored", n)
+    if parallel is None:
+        parallel = RANK_WORKERS > 1 and n >= PARALLEL_MIN_CANDIDATES
+    if not parallel or n == 0 or graded_model() is not None:
+        best = _top(score_batch(me_codes, columns, weights), ids, 0, top_k, exclude, after)
+        return [(uid, score) for score, _, uid in best]
+
+    shards = max(1, RANK_WORKERS)
+    step = -(-n // shards)
+    pool = get_pool()
+    futures = []
+    for start in range(0, n, step):
+        end = min(n, start + step)
+        futures.append(pool.submit(
+            _rank_shard, tuple(me_codes), weights, start,
+            memoryview(ids)[start:end].tobytes(),
+            [memoryview(c)[start:end].tobytes() for c in columns],
+            top_k, exclude, after,
+        ))
+    merged = [row for f in futures for row in f.result()]
+    merged.sort(key=lambda row: (-row[0], row[1]))
+    if top_k:
+        merged = merged[:top_k]
+    return [(uid, score) for score, _, uid in merged]
@@ -0,0 +1,95 @@
+"""
+precompute_matches.py
+Nightly batch job: compute every user's top-N matches and store them in the
+match_suggestions table, so /matches can serve them without ranking.
+
+- Streams users + profiles from SQLite in id order into a columnar
+  profile_store (no per-user dicts), then ranks each viewer against the
+  whole population with the batched column scorer.
+- Respects the blocks table.
+- Writes one transaction per block of viewers, together with its progress
+  marker, so an interrupted run resumes where it stopped (--restart to
+  start over).
+- Reports throughput in scored pairs per second.
+
+Usage (from code/backend):
+    python precompute_matches.py [--top-n 50] [--block-size 500] [--restart]
+"""
+
+import argparse
+import bisect
+import time
+
+import database
+from parallel_rank import rank_columns
+from profile_store import ProfileStore
+
+STATE_KEY = "precompute_progress"   # "<run started at>|<last finished user_id>"
+DONE_KEY = "precompute_last_complete"
+
+
+def run(top_n: int = 50, block_size: int = 500, restart: bool = False, log=print) -> dict:
+    database.init_db()
+
+    progress = database.get_state(STATE_KEY)
+    if progress and not restart:
+        run_id, last_done = progress.rsplit("|", 1)
+        last_done = int(last_done)
+        log(f"resuming run {run_id} after user {last_done}")
+    else:
+        run_id, last_done = time.strftime("%Y-%m-%dT%H:%M:%S"), 0
+
+    t0 = time.perf_counter()
+    store = ProfileStore()
+    store.load(database.iter_match_profiles())
+    ids, columns = store.view()
+    log(f"loaded {len(store)} profiles in {time.perf_counter() - t0:.1f}s")
+
+    first = bisect.bisect_right(ids, last_done)
+    total = len(ids) - first
+    pairs = 0
+    start = time.perf_counter()
+    for b in range(first, len(ids), block_size):
+        block = range(b, min(len(ids), b + block_size))
+        blocked = database.get_blocked_map(ids[i] for i in block)
+
+        results = {}
+        for i in block:
+            uid = ids[i]
+            me_codes = tuple(col[i] for col in columns)
+            exclude = blocked.get(uid, set()) | {uid}
+            # One viewer at a time in-process: shipping the columns to the
+            # pool for every viewer would cost more than it saves
+            results[uid] = rank_columns(me_codes, ids, columns, top_n, exclude=exclude, parallel=False)
+        pairs += len(block) * (len(ids) - 1)
+
+        database.save_match_suggestions(results, STATE_KEY, f"{run_id}|{ids[block[-1]]}")
+        elapsed = time.perf_counter() - start
+        log(f"{block[-1] + 1 - first}/{total} users, {pairs / max(elapsed, 1e-9):,.0f} pairs/s")
+
+    elapsed = time.perf_counter() - start
+    database.set_state(DONE_KEY, run_id)
+    database.set_state(STATE_KEY, "")
+    stats = {
+        "run_id": run_id,
+        "users": total,
+        "pairs": pairs,
+        "seconds": elapsed,
+        "pairs_per_second": pairs / elapsed if elapsed else 0.0,
+    }
+    log(f"done: {stats['users']} users, {pairs:,} pairs in {elapsed:.1f}s "
+        f"({stats['pairs_per_second']:,.0f} pairs/s)")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top-n", type=int, default=50, help="matches to store per user")
+    parser.add_argument("--block-size", type=int, default=500, help="users per write transaction")
+    parser.add_argument("--restart", action="store_true", help="ignore a half-finished run")
+    args = parser.parse_args()
+    run(top_n=args.top_n, block_size=args.block_size, restart=args.restart)
+
+
+if __name__ == "__main__":
+    main()
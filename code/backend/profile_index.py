@@ -0,0 +1,134 @@
+"""
+profile_index.py
+In-process inverted index over the categorical profile fields used by matching.
+
+Maps (field, code) -> set of user ids, where code is the interned value from
+matching.compile_profile (location, budget bucket, lifestyle, smoking, pets,
+cleanliness). /matches uses it to find the few users that can reach a score
+threshold or the current top-k bound, so it only loads and scores those.
+
+WHAT THIS MODULE PROVIDES
+- ProfileIndex: upsert(user_id, profile), remove(user_id), candidate_ids(...)
+- get_index() -> shared ProfileIndex, lazily loaded from the database
+- invalidate() -> force a reload on next use (e.g. after bulk deletes)
+"""
+
+from __future__ import annotations
+import threading
+from collections import defaultdict
+from typing import Any, Iterable, Mapping
+
+import database
+from matching import DEFAULT_WEIGHTS, FIELDS, compile_profile, graded_model
+
+
+class ProfileIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: dict[tuple[str, int], set[int]] = defaultdict(set)
+        self._codes: dict[int, tuple[int, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def load(self, profiles: Iterable[Mapping[str, Any]]):
+        """Rebuild from rows that carry user_id plus the matching fields."""
+        postings: dict[tuple[str, int], set[int]] = defaultdict(set)
+        codes: dict[int, tuple[int, ...]] = {}
+        for p in profiles:
+            uid = p["user_id"]
+            codes[uid] = compile_profile(p)
+            for key, code in zip(FIELDS, codes[uid]):
+                if code:
+                    postings[(key, code)].add(uid)
+        with self._lock:
+            self._postings, self._codes = postings, codes
+
+    def upsert(self, user_id: int, profile: Mapping[str, Any]):
+        new = compile_profile(profile)
+        with self._lock:
+            self._drop(user_id)
+            self._codes[user_id] = new
+            for key, code in zip(FIELDS, new):
+                if code:
+                    self._postings[(key, code)].add(user_id)
+
+    def remove(self, user_id: int):
+        with self._lock:
+            self._drop(user_id)
+
+    def _drop(self, user_id: int):
+        old = self._codes.pop(user_id, None)
+        if old is None:
+            return
+        for key, code in zip(FIELDS, old):
+            ids = self._postings.get((key, code))
+            if ids is not None:
+                ids.discard(user_id)
+                if not ids:
+                    del self._postings[(key, code)]
+
+    def candidate_ids(
+        self,
+        me: Mapping[str, Any],
+        top_k: int | None = None,
+        min_score: int | None = None,
+        weights: dict[str, int] | None = None,
+        exclude: Iterable[int] = (),
+    ) -> list[int] | None:
+        """
+        Return the sorted user ids that can score >= min_score, or that can make
+        the top_k (every id tied with the k-th best is included, so the caller's
+        stable ordering stays the same as a full scan).
+
+        Returns None when the index cannot prune: the graded scoring model
+        (partial matches score too), negative weights, a bound of 0 (users
+        sharing nothing would qualify), or fewer than top_k users with a
+        positive score. Callers should fall back to scanning everyone.
+        """
+        W = weights or DEFAULT_WEIGHTS
+        if graded_model() is not None or any(w < 0 for w in W.values()):
+            return None
+
+        # Fields are added in FIELDS order, like compatibility_score, so the
+        # totals here are the exact scores of every user that shares anything.
+        totals: dict[int, Any] = defaultdict(int)
+        with self._lock:
+            for key, mine in zip(FIELDS, compile_profile(me)):
+                w = W.get(key, 0)
+                if w and mine:
+                    for uid in self._postings.get((key, mine), ()):
+                        totals[uid] += w
+        for uid in exclude:
+            totals.pop(uid, None)
+        scores = {uid: int(s) for uid, s in totals.items() if int(s) > 0}
+
+        bound = min_score
+        if top_k:
+            if len(scores) < top_k:
+                return None
+            kth = sorted(scores.values(), reverse=True)[top_k - 1]
+            bound = kth if bound is None else max(bound, kth)
+        if bound is None or bound <= 0:
+            return None
+        return sorted(uid for uid, s in scores.items() if s >= bound)
+
+
+_index: ProfileIndex | None = None
+_index_lock = threading.Lock()
+
+def get_index() -> ProfileIndex:
+    """Shared index for this process, loaded from SQLite on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                idx = ProfileIndex()
+                idx.load(database.get_all_match_profiles())
+                _index = idx
+    return _index
+
+def invalidate():
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,298 @@
+"""
+profile_store.py
+Shared, read-mostly columnar copy of every user's matching fields.
+
+Instead of a dict of nine strings per user per request (get_profiles_except),
+the store keeps one compact array per field, shared by all requests:
+
+- ids:      array('q') of user ids, ascending (same order as ORDER BY u.id)
+- columns:  one array('i') per matching.FIELDS entry, holding the integer
+            codes from matching.compile_profile (strings live once in
+            matching's interned string table, see matching.decode)
+
+That is 8 + 6 * 4 = 32 bytes per profile, plus up to 50% spare capacity
+from growth. tests/test_profile_store.py measures it and fails above
+MAX_BYTES_PER_PROFILE (48); bench/bench_profile_store.py prints it (~34
+bytes/profile) next to ~280 bytes for a get_profiles_except dict before
+counting its strings.
+
+Loaded once from SQLite, then kept current with upsert() on profile writes
+and remove() when a user is deleted.
+view() hands the matcher zero-copy memoryviews of the first n rows. New
+users are appended in place past n, where no view reaches; editing or
+removing an existing row copies the columns it touches first
+(copy-on-write), so a view that is already out keeps reading one
+consistent snapshot and a ranking never mixes old and new codes.
+
+kth_best(codes, k) answers "what is the k-th best score anyone gets
+against this profile" (reciprocal.py's bars) without scoring anyone. Under
+exact matching a score only depends on which fields match, so the store
+counts, for each of the 63 non-empty subsets of fields, how many users
+share each combination of codes on it. Built on first use (with 97
+distinct lifestyles: ~0.3 s and ~17 MB at 20k users, ~1.6 s and ~32 MB at
+100k; fewer distinct values cost less) and kept current by upsert() /
+remove(), so it is only paid for by processes serving mutual rankings.
+Inclusion-exclusion over the viewer's at most 64 field subsets turns those
+into how many users match on exactly each subset, and so how many get
+each score.
+"""
+
+from __future__ import annotations
+import bisect
+import threading
+from array import array
+from collections import Counter
+from operator import itemgetter
+from typing import Any, Iterable, Mapping, Sequence
+
+import database
+from matching import DEFAULT_WEIGHTS, FIELDS, compile_profile, graded_model
+from parallel_rank import rank_columns
+
+MAX_BYTES_PER_PROFILE = 48
+
+# Field subset (bit j = FIELDS[j]) -> its field positions, and a getter of
+# the codes on them (a plain code for one field, else a tuple)
+_SUBSET_FIELDS = [tuple(j for j in range(len(FIELDS)) if mask >> j & 1)
+                  for mask in range(1 << len(FIELDS))]
+_SUBSET_CODES = [None] + [itemgetter(*fields) for fields in _SUBSET_FIELDS[1:]]
+
+
+class ProfileStore:
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.Lock()
+        self._n = 0
+        self._ids = array("q", bytes(8 * capacity))
+        self._columns = [array("i", bytes(4 * capacity)) for _ in FIELDS]
+        self._patterns: list[Counter] | None = None  # field subset -> codes -> users, see kth_best
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the arrays (including spare capacity)."""
+        return self._ids.itemsize * len(self._ids) + sum(
+            c.itemsize * len(c) for c in self._columns
+        )
+
+    def load(self, profiles: Iterable[Mapping[str, Any]]):
+        """Rebuild from rows with user_id + matching fields, ordered by user_id."""
+        ids = array("q")
+        columns = [array("i") for _ in FIELDS]
+        for p in profiles:
+            ids.append(p["user_id"])
+            for col, code in zip(columns, compile_profile(p)):
+                col.append(code)
+        with self._lock:
+            self._ids, self._columns, self._n = ids, columns, len(ids)
+            self._patterns = None
+
+    def upsert(self, user_id: int, profile: Mapping[str, Any]):
+        codes = compile_profile(profile)
+        with self._lock:
+            n = self._n
+            i = bisect.bisect_left(self._ids, user_id, 0, n)
+            if i < n and self._ids[i] == user_id:
+                self._count(tuple(col[i] for col in self._columns), -1)
+                self._count(codes, 1)
+                columns = []
+                for col, code in zip(self._columns, codes):
+                    if col[i] != code:
+                        col = array("i", col)  # views handed out keep the old copy
+                        col[i] = code
+                    columns.append(col)
+                self._columns = columns
+                return
+            self._count(codes, 1)
+            if i != n:
+                # Ids come from AUTOINCREMENT, so new users always append;
+                # anything else is rare enough to just rebuild in order.
+                self._insert_at(i, user_id, codes)
+                return
+            if n == len(self._ids):
+                self._grow()
+            self._ids[n] = user_id
+            for col, code in zip(self._columns, codes):
+                col[n] = code
+            self._n = n + 1
+
+    def _grow(self):
+        size = max(1024, len(self._ids) + len(self._ids) // 2)
+        pad = size - len(self._ids)
+        ids = array("q", self._ids)
+        ids.extend(array("q", bytes(8 * pad)))
+        columns = []
+        for col in self._columns:
+            new = array("i", col)
+            new.extend(array("i", bytes(4 * pad)))
+            columns.append(new)
+        self._ids, self._columns = ids, columns
+
+    def _insert_at(self, i, user_id, codes):
+        n = self._n
+        ids = array("q", self._ids[:i])
+        ids.append(user_id)
+        ids.extend(self._ids[i:n])
+        columns = []
+        for col, code in zip(self._columns, codes):
+            new = array("i", col[:i])
+            new.append(code)
+            new.extend(col[i:n])
+            columns.append(new)
+        self._ids, self._columns, self._n = ids, columns, n + 1
+
+    def remove(self, user_id: int):
+        """Drop a deleted user. Copies the arrays, so views already handed out stay intact."""
+        with self._lock:
+            n = self._n
+            i = bisect.bisect_left(self._ids, user_id, 0, n)
+            if i == n or self._ids[i] != user_id:
+                return
+            self._count(tuple(col[i] for col in self._columns), -1)
+            ids = array("q", self._ids[:i])
+            ids.extend(self._ids[i + 1:n])
+            columns = []
+            for col in self._columns:
+                new = array("i", col[:i])
+                new.extend(col[i + 1:n])
+                columns.append(new)
+            self._ids, self._columns, self._n = ids, columns, n - 1
+
+    def _count(self, codes: Sequence[int], delta: int):
+        """Add a row to the kth_best counts (if built)."""
+        if self._patterns is not None:
+            for mask in range(1, len(_SUBSET_CODES)):
+                self._patterns[mask][_SUBSET_CODES[mask](codes)] += delta
+
+    def kth_best(
+        self,
+        me_codes: Sequence[int],
+        k: int,
+        weights: dict[str, int] | None = None,
+    ) -> int | None:
+        """
+        The k-th best score in rank_codes(me_codes, top_k=k) over everyone in
+        the store (the owner of me_codes included), 0 if there are fewer than
+        k rows. None under the graded scoring model, whose partial
+        similarities don't reduce to match patterns; use rank_codes there.
+        """
+        if graded_model() is not None:
+            return None
+        W = weights or DEFAULT_WEIGHTS
+        # masks[s] / scores[s]: subset s of my matchable fields (bit i = i-th of them),
+        # as a FIELDS bit mask and as the score of matching exactly those fields
+        masks, scores = [0], [0]
+        for j, (key, code) in enumerate(zip(FIELDS, me_codes)):
+            w = W.get(key, 0)
+            if code and w:
+                masks += [mask | 1 << j for mask in masks]
+                scores += [score + w for score in scores]  # FIELDS order, like score_batch
+        with self._lock:
+            if self._patterns is None:
+                columns = [c[:self._n] for c in self._columns]
+                self._patterns = [Counter()] + [
+                    Counter(columns[j[0]] if len(j) == 1 else zip(*(columns[i] for i in j)))
+                    for j in _SUBSET_FIELDS[1:]
+                ]
+            n = self._n
+            # exact[s] starts as "users sharing my codes on subset s" ...
+            exact = [n] + [self._patterns[mask][_SUBSET_CODES[mask](me_codes)] for mask in masks[1:]]
+        if n < k:
+            return 0
+        # ... and becomes "users matching on exactly subset s" (inclusion-exclusion)
+        bit = 1
+        while bit < len(exact):
+            for s in range(len(exact)):
+                if not s & bit:
+                    exact[s] -= exact[s | bit]
+            bit <<= 1
+        by_score: Counter = Counter()
+        for score, count in zip(scores, exact):
+            if count:
+                by_score[int(score)] += count
+        seen = 0
+        for score in sorted(by_score, reverse=True):
+            seen += by_score[score]
+            if seen >= k:
+                return score
+        return 0
+
+    def view(self) -> tuple[memoryview, list[memoryview]]:
+        """Zero-copy (ids, columns) views over the current rows."""
+        with self._lock:
+            n, ids, columns = self._n, self._ids, self._columns
+        return memoryview(ids)[:n], [memoryview(c)[:n] for c in columns]
+
+    def rank(
+        self,
+        me: Mapping[str, Any],
+        top_k: int | None = None,
+        weights: dict[str, int] | None = None,
+        exclude: Iterable[int] = (),
+        after: tuple[int, int] | None = None,
+        only: Iterable[int] | None = None,
+    ) -> list[tuple[int, int]]:
+        """
+        Rank everyone in the store against `me`; returns (user_id, score) pairs
+        in the same order rank_candidates gives over get_profiles_except.
+        `after=(score, user_id)` starts right after that row (paging).
+        `only` limits the ranking to those user ids (e.g. one region's).
+        Large stores are scored on the parallel_rank process pool.
+        """
+        return self.rank_codes(compile_profile(me), top_k, weights, exclude, after, only)
+
+    def rank_codes(
+        self,
+        me_codes: tuple[int, ...],
+        top_k: int | None = None,
+        weights: dict[str, int] | None = None,
+        exclude: Iterable[int] = (),
+        after: tuple[int, int] | None = None,
+        only: Iterable[int] | None = None,
+    ) -> list[tuple[int, int]]:
+        """rank() for an already compiled profile (e.g. from codes())."""
+        ids, columns = self.view()
+        if only is not None:
+            ids, columns = _select(ids, columns, only)
+        return rank_columns(me_codes, ids, columns, top_k,
+                            weights or DEFAULT_WEIGHTS, exclude, after=after)
+
+    def codes(self, user_id: int) -> tuple[int, ...] | None:
+        """The stored compiled profile of `user_id`, or None if it isn't in the store."""
+        ids, columns = self.view()
+        i = bisect.bisect_left(ids, user_id)
+        if i < len(ids) and ids[i] == user_id:
+            return tuple(col[i] for col in columns)
+        return None
+
+
+def _select(ids, columns, user_ids) -> tuple[array, list[array]]:
+    """Copies of the rows of `user_ids` that are in the store, still in id order."""
+    positions = []
+    for uid in sorted(set(user_ids)):
+        i = bisect.bisect_left(ids, uid)
+        if i < len(ids) and ids[i] == uid:
+            positions.append(i)
+    return (array("q", [ids[i] for i in positions]),
+            [array("i", [col[i] for i in positions]) for col in columns])
+
+
+_store: ProfileStore | None = None
+_store_lock = threading.Lock()
+
+def get_store() -> ProfileStore:
+    """Shared store for this process, loaded from SQLite on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = ProfileStore()
+                store.load(database.get_all_match_profiles())
+                _store = store
+    return _store
+
+def invalidate():
+    global _store
+    with _store_lock:
+        _store = None
@@ -0,0 +1,299 @@
+"""
+profiler.py
+Opt-in profiles of individual slow requests.
+
+Two triggers, both off by default:
+- slow requests: while PROFILE_SLOW_MS > 0, one sampler thread records the
+  Python stack of every in-flight request every PROFILE_SAMPLE_MS. When a
+  request finishes under the threshold its samples are thrown away; when it
+  took longer they are written as collapsed stacks ("a;b;c 12" lines, ready
+  for flamegraph.pl / speedscope). The sampler sleeps while no request is
+  running, and with both triggers off init_app registers nothing at all.
+- debug header: a request carrying "X-Profile: <PROFILE_TOKEN>" runs under
+  cProfile and is always written (.prof, load with pstats / snakeviz).
+
+Each profile gets a .json summary next to it: route, status, duration, the
+trigger and the request's individual database / ranking / render calls with
+their timings (metrics.trace_calls; empty with METRICS=0). The directory is
+rotated: oldest profiles are deleted once there are more than
+PROFILE_MAX_FILES or they take more than PROFILE_MAX_BYTES.
+
+Streamed responses are finished when the body has been sent, so template
+rendering counts.
+
+WHAT THIS MODULE PROVIDES
+- init_app(app)
+- recent(limit) -> list of summaries, newest first (app's /admin/profiles)
+- authorized(request) -> whether the request may read profiles (needs
+  PROFILE_TOKEN: profiles hold other users' ids, paths and raw stacks, so
+  without a token they can only be read from the PROFILE_DIR on disk)
+- PROFILE_DIR, FILE_SUFFIXES
+
+Config (env):
+- PROFILE_SLOW_MS    profile requests slower than this (default 0 = off)
+- PROFILE_TOKEN      secret for the X-Profile header and /admin/profiles (default "" = off)
+- PROFILE_SAMPLE_MS  sampling interval (default 5)
+- PROFILE_DIR        output directory (default: "profiles" next to the database)
+- PROFILE_MAX_FILES  profiles kept (default 100)
+- PROFILE_MAX_BYTES  disk space kept (default 20 MB)
+"""
+
+from __future__ import annotations
+import cProfile
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import urlencode
+
+from flask import g, request, session
+
+import database
+import metrics
+
+log = logging.getLogger(__name__)
+
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", 0))
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_HEADER = "X-Profile"
+PROFILE_SAMPLE_MS = float(os.environ.get("PROFILE_SAMPLE_MS", 5))
+PROFILE_DIR = os.environ.get("PROFILE_DIR") or os.path.join(os.path.dirname(database.DB_PATH), "profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 100))
+PROFILE_MAX_BYTES = int(os.environ.get("PROFILE_MAX_BYTES", 20 * 1024 * 1024))
+ENABLED = PROFILE_SLOW_MS > 0 or bool(PROFILE_TOKEN)
+
+FILE_SUFFIXES = (".folded", ".prof", ".json")
+
+
+# -------------------------
+# Stack sampler
+# -------------------------
+
+class Sampler:
+    """Counts the stacks of registered threads every `interval` seconds."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._active: dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def begin(self, thread_id: int) -> Counter:
+        samples: Counter = Counter()
+        with self._lock:
+            self._active[thread_id] = samples
+            self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="roomsync-profiler", daemon=True)
+                self._thread.start()
+        return samples
+
+    def end(self, thread_id: int):
+        with self._lock:
+            self._active.pop(thread_id, None)
+
+    def _loop(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                targets = list(self._active.items())
+                if not targets:
+                    self._wake.clear()
+                    continue
+            frames = sys._current_frames()
+            for thread_id, samples in targets:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[_stack(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+def _stack(frame) -> tuple:
+    """Code objects from the innermost frame out (cheap to hash; named when written)."""
+    codes = []
+    while frame is not None:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    return tuple(codes)
+
+
+def _label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _collapsed(samples: Counter) -> str:
+    return "".join(
+        f"{';'.join(_label(c) for c in reversed(stack))} {count}\n"
+        for stack, count in samples.most_common()
+    )
+
+
+# -------------------------
+# Output directory
+# -------------------------
+
+def _rotate(directory: str, max_files: int, max_bytes: int):
+    """Delete the oldest profiles (all files sharing a name) beyond the limits."""
+    groups: dict[str, list] = {}
+    for entry in os.scandir(directory):
+        base, ext = os.path.splitext(entry.name)
+        if ext in FILE_SUFFIXES:
+            st = entry.stat()
+            group = groups.setdefault(base, [0.0, 0, []])
+            group[0] = max(group[0], st.st_mtime)
+            group[1] += st.st_size
+            group[2].append(entry.path)
+    oldest_first = sorted(groups.values(), key=lambda grp: grp[0])
+    total = sum(grp[1] for grp in oldest_first)
+    while oldest_first and (len(oldest_first) > max_files or total > max_bytes):
+        _, size, paths = oldest_first.pop(0)
+        total -= size
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def recent(limit: int = 50) -> list[dict]:
+    """Summaries of the newest profiles, newest first."""
+    try:
+        entries = [e for e in os.scandir(PROFILE_DIR) if e.name.endswith(".json")]
+    except FileNotFoundError:
+        return []
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    summaries = []
+    for entry in entries[:limit]:
+        try:
+            with open(entry.path) as f:
+                summaries.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # rotated away or half-written
+    return summaries
+
+
+def authorized(req) -> bool:
+    """Profiles can only be read over HTTP with the token, so none is set = nobody."""
+    if not ENABLED or not PROFILE_TOKEN:
+        return False
+    given = req.headers.get(PROFILE_HEADER) or req.args.get("token") or ""
+    return hmac.compare_digest(given, PROFILE_TOKEN)
+
+
+# -------------------------
+# Flask hooks
+# -------------------------
+
+class _Capture:
+    __slots__ = ("start", "thread_id", "samples", "cprofile", "calls", "done")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.thread_id = threading.get_ident()
+        self.samples: Counter | None = None
+        self.cprofile: cProfile.Profile | None = None
+        self.calls = metrics.request_calls()
+        self.done = False
+
+
+def _logged_path(req) -> str:
+    """The request path and query string, minus the profile token."""
+    args = [(k, v) for k, v in req.args.items(multi=True) if k != "token"]
+    return req.path + ("?" + urlencode(args) if args else "")
+
+
+def _write(capture: _Capture, info: dict, duration: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = "{}-{}-{:.0f}ms-{}".format(
+        time.strftime("%Y%m%d-%H%M%S"), info["endpoint"] or "unmatched", duration * 1000, uuid.uuid4().hex[:6]
+    )
+    files = []
+    if capture.cprofile is not None:
+        capture.cprofile.dump_stats(os.path.join(PROFILE_DIR, name + ".prof"))
+        files.append(name + ".prof")
+    if capture.samples:
+        with open(os.path.join(PROFILE_DIR, name + ".folded"), "w") as f:
+            f.write(_collapsed(capture.samples))
+        files.append(name + ".folded")
+    calls = [{"kind": kind, "fn": fn, "ms": round(seconds * 1000, 3)}
+             for kind, fn, seconds in capture.calls or ()]
+    summary = dict(info, name=name, files=files, duration_ms=round(duration * 1000, 1),
+                   samples=sum(capture.samples.values()) if capture.samples else 0,
+                   calls=calls, calls_ms=round(sum(c["ms"] for c in calls), 3))
+    with open(os.path.join(PROFILE_DIR, name + ".json"), "w") as f:
+        json.dump(summary, f)
+    _rotate(PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_MAX_BYTES)
+
+
+def init_app(app):
+    if not ENABLED:
+        return
+    sampler = Sampler(PROFILE_SAMPLE_MS / 1000) if PROFILE_SLOW_MS > 0 else None
+    metrics.trace_calls()
+
+    def finish(capture, info):
+        if capture.done:
+            return
+        capture.done = True
+        duration = time.perf_counter() - capture.start
+        if capture.cprofile is not None:
+            capture.cprofile.disable()
+        if sampler is not None:
+            sampler.end(capture.thread_id)
+        if capture.cprofile is None and duration * 1000 < PROFILE_SLOW_MS:
+            return
+        info["trigger"] = "header" if capture.cprofile is not None else "slow"
+        try:
+            _write(capture, info, duration)
+        except OSError:
+            log.exception("could not write request profile to %s", PROFILE_DIR)
+
+    @app.before_request
+    def _profile_begin():
+        capture = _Capture()
+        forced = PROFILE_TOKEN and hmac.compare_digest(request.headers.get(PROFILE_HEADER, ""), PROFILE_TOKEN)
+        if forced:
+            capture.cprofile = cProfile.Profile()
+            capture.cprofile.enable()
+        elif sampler is not None:
+            capture.samples = sampler.begin(capture.thread_id)
+        else:
+            return
+        g.profile_capture = capture
+
+    @app.after_request
+    def _profile_end(response):
+        capture = g.pop("profile_capture", None)
+        if capture is None:
+            return response
+        info = {
+            "method": request.method,
+            "path": _logged_path(request),
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "user_id": session.get("user_id"),
+            "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        if response.is_streamed:
+            response.call_on_close(lambda: finish(capture, info))
+        else:
+            finish(capture, info)
+        return response
+
+    @app.teardown_request
+    def _profile_abandon(exc=None):
+        # after_request doesn't run when the view raised; stop sampling anyway
+        capture = g.pop("profile_capture", None)
+        if capture is not None:
+            capture.done = True
+            if capture.cprofile is not None:
+                capture.cprofile.disable()
+            if sampler is not None:
+                sampler.end(capture.thread_id)
@@ -0,0 +1,232 @@
+"""
+rate_limit.py
+Per-client rate limits and admission control for the expensive routes.
+
+Token buckets: every (rule, client) pair gets a bucket of `capacity` tokens
+that refills at `capacity / period` tokens per second; each request takes
+one token, and a request that finds the bucket empty is refused with a 429
+and a Retry-After saying when the next token arrives. The client is the
+session's user id when logged in, else the remote address (run behind a
+proxy that sets it, e.g. werkzeug's ProxyFix).
+
+Buckets live in memory by default, so each gunicorn worker keeps its own
+and a client can get up to `workers` times the limit. RATE_LIMIT_BACKEND=
+sqlite shares them through the rate_limits table instead, at the price of
+one BEGIN IMMEDIATE write per limited request, cache hits and 304s included,
+all behind SQLite's single write lock. That write waits at most
+RATE_LIMIT_LOCK_MS for the lock; when it can't get it (or the database
+fails) the request is let through rather than answered with a 500.
+
+AdmissionGate caps how many /matches rankings run at once in a worker. A
+request that can't get a slot within `wait` seconds is shed with a 429
+instead of piling up behind the others. It is per process on purpose: the
+resource it protects is the worker's own CPU.
+
+WHAT THIS MODULE PROVIDES
+- Rule(name, method, endpoint, capacity, period), parse_rules(spec)
+- MemoryBuckets / SQLiteBuckets: take(key, capacity, rate, now) -> (allowed, tokens)
+- RateLimiter(rules, buckets).check(endpoint, method, client) -> retry_after or None
+- AdmissionGate(max_concurrent, wait): `with gate:` raises Overloaded when full
+- both have stats() (allowed / limited per rule; admitted, rejected,
+  in_flight, peak)
+
+Config (env):
+- RATE_LIMITS         comma-separated "[METHOD:]endpoint=requests/seconds"
+                      (default "matches=60/60,POST:login=10/60,
+                      block_user_route=30/60,report_user_route=10/60"; "" = off)
+- RATE_LIMIT_BACKEND  memory (per worker, default) | sqlite (shared by workers)
+- RATE_LIMIT_LOCK_MS  sqlite backend: longest wait for the write lock (default 100)
+"""
+
+from __future__ import annotations
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+import database
+
+log = logging.getLogger(__name__)
+
+RATE_LIMITS = os.environ.get(
+    "RATE_LIMITS", "matches=60/60,POST:login=10/60,block_user_route=30/60,report_user_route=10/60"
+)
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_LOCK_MS = int(os.environ.get("RATE_LIMIT_LOCK_MS", 100))
+PRUNE_INTERVAL = 300  # seconds between deletes of idle buckets
+
+
+class Rule(NamedTuple):
+    name: str
+    method: str | None  # None = every method
+    endpoint: str
+    capacity: float
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+
+def parse_rules(spec: str) -> list[Rule]:
+    """'POST:login=10/60,matches=60/60' -> rules; raises ValueError on bad entries."""
+    rules = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            target, limit = item.split("=")
+            count, period = limit.split("/")
+            method, _, endpoint = target.rpartition(":")
+            rule = Rule(target, method.upper() or None, endpoint, float(count), float(period))
+        except ValueError:
+            raise ValueError(f"bad rate limit {item!r}, expected [METHOD:]endpoint=requests/seconds")
+        if rule.capacity < 1 or rule.period <= 0:
+            raise ValueError(f"bad rate limit {item!r}, need requests >= 1 and seconds > 0")
+        rules.append(rule)
+    return rules
+
+
+class MemoryBuckets:
+    """Buckets in a dict: exact, fast, but each worker process has its own."""
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> tuple[bool, float]:
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            return allowed, tokens
+
+    def prune(self, idle_before: float):
+        with self._lock:
+            for key in [k for k, (_, t) in self._buckets.items() if t < idle_before]:
+                del self._buckets[key]
+
+
+class SQLiteBuckets:
+    """Buckets in the rate_limits table, shared by every process using the DB. Fails open."""
+
+    def __init__(self, lock_timeout_ms: int = RATE_LIMIT_LOCK_MS):
+        self.lock_timeout_ms = lock_timeout_ms
+        self.errors = 0
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> tuple[bool, float]:
+        try:
+            return database.take_token(key, capacity, rate, now, busy_timeout_ms=self.lock_timeout_ms)
+        except sqlite3.Error as exc:
+            # Locked or failing database: better an unlimited request than a 500
+            self.errors += 1
+            log.warning("rate limit check for %s skipped: %s", key, exc)
+            return True, capacity
+
+    def prune(self, idle_before: float):
+        try:
+            database.prune_rate_limits(idle_before)
+        except sqlite3.Error as exc:
+            self.errors += 1
+            log.warning("rate limit prune skipped: %s", exc)
+
+
+class RateLimiter:
+    def __init__(self, rules: list[Rule], buckets=None):
+        self.rules = rules
+        self.buckets = buckets if buckets is not None else MemoryBuckets()
+        self._by_endpoint: dict[str, list[Rule]] = {}
+        for rule in rules:
+            self._by_endpoint.setdefault(rule.endpoint, []).append(rule)
+        self._longest = max((r.period for r in rules), default=0)
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+        self._stats = {r.name: {"allowed": 0, "limited": 0} for r in rules}
+
+    def check(self, endpoint: str | None, method: str, client: str) -> int | None:
+        """Take a token from every rule matching the request; seconds to wait if one is empty."""
+        rules = self._by_endpoint.get(endpoint)
+        if not rules:
+            return None
+        now = time.time()
+        self._maybe_prune(now)
+        retry_after = None
+        for rule in rules:
+            if rule.method is not None and rule.method != method:
+                continue
+            allowed, tokens = self.buckets.take(f"{rule.name}|{client}", rule.capacity, rule.rate, now)
+            with self._lock:
+                self._stats[rule.name]["allowed" if allowed else "limited"] += 1
+            if not allowed:
+                wait = max(1, math.ceil((1 - tokens) / rule.rate))
+                retry_after = max(retry_after or 0, wait)
+        return retry_after
+
+    def _maybe_prune(self, now: float):
+        if now < self._next_prune:
+            return
+        with self._lock:
+            if now < self._next_prune:
+                return
+            self._next_prune = now + PRUNE_INTERVAL
+        # An idle bucket has refilled completely after its period
+        self.buckets.prune(now - self._longest)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._stats.items()}
+
+
+def make_limiter(spec: str = RATE_LIMITS, backend: str = RATE_LIMIT_BACKEND) -> RateLimiter:
+    if backend not in ("sqlite", "memory"):
+        raise ValueError(f"unknown RATE_LIMIT_BACKEND {backend!r}")
+    return RateLimiter(parse_rules(spec), MemoryBuckets() if backend == "memory" else SQLiteBuckets())
+
+
+# -------------------------
+# Admission control
+# -------------------------
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"too many concurrent requests, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    def __init__(self, max_concurrent: int, wait: float = 0.25, retry_after: int = 1):
+        self.max_concurrent = max_concurrent
+        self.wait = wait
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrent))
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "rejected": 0, "in_flight": 0, "peak": 0}
+
+    def __enter__(self):
+        if self.max_concurrent <= 0:
+            return self  # 0 = unlimited
+        if not self._slots.acquire(timeout=self.wait):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise Overloaded(self.retry_after)
+        with self._lock:
+            self._stats["admitted"] += 1
+            self._stats["in_flight"] += 1
+            self._stats["peak"] = max(self._stats["peak"], self._stats["in_flight"])
+        return self
+
+    def __exit__(self, *exc):
+        if self.max_concurrent <= 0:
+            return False
+        with self._lock:
+            self._stats["in_flight"] -= 1
+        self._slots.release()
+        return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
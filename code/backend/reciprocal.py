@@ -0,0 +1,130 @@
+"""
+reciprocal.py
+Mutual-match ("reciprocal") ranking for /matches?mutual=1.
+
+One-way ranking orders candidates by how well they suit the viewer. A
+popular candidate with dozens of perfect matches is unlikely to pick the
+viewer back, so the mutual mode also asks how the viewer would place in the
+candidate's own list:
+
+    mine   = min(1, score / my_bar)      my_bar    = the viewer's k-th best score
+    theirs = min(1, score / their_bar)   their_bar = the candidate's k-th best score
+    mutual = round(100 * harmonic_mean(mine, theirs))
+
+compatibility_score is symmetric (both directions compare the same fields
+with the same weights), so the two perspectives differ only in the bar each
+side has to clear; mutual == 100 means each would show the other on their
+first page. A->B is scored once, in the viewer's batched one-way ranking,
+and B->A is never scored: the candidate's bar comes from
+profile_store.kth_best, which counts how many users match them on each
+combination of fields instead of ranking everyone against them.
+
+WHAT THIS MODULE PROVIDES
+- reciprocal_score(score, my_bar, their_bar) -> int
+- ReciprocalRanker: rank(me, top_k, exclude, after) over profile_store.
+  Ranks the viewer's shortlist (top_k * shortlist_factor one-way matches) by
+  mutual score. Bars are always current (kth_best's counts follow every
+  store edit), so profile_changed() has nothing to drop, except under
+  SCORING_MODEL=graded: there bars take a full ranking each and are cached
+  per compiled profile, and profile_changed() clears them.
+
+A candidate's bar counts the whole store, including the candidate itself
+(at most one row) and people the candidate blocked.
+
+Config (env):
+- MUTUAL_SHORTLIST_FACTOR   shortlist size as a multiple of the page size (default 4)
+"""
+
+from __future__ import annotations
+import os
+import threading
+from typing import Any, Callable, Iterable, Mapping
+
+import metrics
+from matching import compile_profile
+
+MUTUAL_SHORTLIST_FACTOR = int(os.environ.get("MUTUAL_SHORTLIST_FACTOR", 4))
+
+
+def reciprocal_score(score: int, my_bar: int, their_bar: int) -> int:
+    """Harmonic mean (0-100) of how close `score` comes to each side's k-th best."""
+    if score <= 0:
+        return 0
+    mine = min(1.0, score / my_bar) if my_bar > 0 else 1.0
+    theirs = min(1.0, score / their_bar) if their_bar > 0 else 1.0
+    return round(100 * 2 * mine * theirs / (mine + theirs))
+
+
+class ReciprocalRanker:
+    def __init__(
+        self,
+        get_store: Callable[[], Any],
+        shortlist_factor: int = MUTUAL_SHORTLIST_FACTOR,
+        max_bars: int = 10_000,
+    ):
+        self.get_store = get_store
+        self.shortlist_factor = max(1, shortlist_factor)
+        self.max_bars = max_bars
+        # Graded model only: (codes, k) -> k-th best score anyone with those codes gets
+        self._bars: dict[tuple[tuple[int, ...], int], int] = {}
+        self._lock = threading.Lock()
+
+    def _bar(self, store, codes: tuple[int, ...], k: int) -> int:
+        bar = store.kth_best(codes, k)
+        if bar is not None:
+            return bar
+        key = (codes, k)
+        bar = self._bars.get(key)
+        if bar is None:
+            top = store.rank_codes(codes, top_k=k)
+            bar = top[-1][1] if len(top) >= k else 0
+            with self._lock:
+                if len(self._bars) >= self.max_bars:
+                    self._bars.clear()
+                self._bars[key] = bar
+        return bar
+
+    @metrics.timed("rank_mutual")
+    def rank(
+        self,
+        me: Mapping[str, Any],
+        top_k: int,
+        exclude: Iterable[int] = (),
+        after: tuple[int, int] | None = None,
+    ) -> list[tuple[int, int]]:
+        """
+        (user_id, mutual score) pairs, best first, ties by user_id; the same
+        ordering as one-way ranking, so `after=(mutual, user_id)` pages it.
+        Only the shortlist is ranked, so paging ends after it.
+        """
+        k = top_k or 50
+        store = self.get_store()
+        exclude = frozenset(exclude)
+        shortlist = store.rank(me, top_k=k * self.shortlist_factor, exclude=exclude)
+
+        # The shortlist is sorted best first, so my k-th best is its k-th row
+        my_bar = shortlist[k - 1][1] if len(shortlist) >= k else 0
+        my_codes = compile_profile(me)
+        rows = []
+        for uid, score in shortlist:
+            codes = store.codes(uid)
+            if codes is None:
+                continue
+            their_bar = my_bar if codes == my_codes else self._bar(store, codes, k)
+            rows.append((reciprocal_score(score, my_bar, their_bar), uid))
+
+        rows.sort(key=lambda r: (-r[0], r[1]))
+        if after:
+            score, uid = after
+            rows = [r for r in rows if (-r[0], r[1]) > (-score, uid)]
+        return [(uid, mutual) for mutual, uid in rows[:top_k or None]]
+
+    def profile_changed(self, user_id: int):
+        """Drop the graded model's cached bars (anyone's k-th best may move)."""
+        if self._bars:
+            with self._lock:
+                self._bars.clear()
+
+    def clear(self):
+        with self._lock:
+            self._bars.clear()
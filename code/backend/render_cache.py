@@ -0,0 +1,81 @@
+"""
+render_cache.py
+Caching for server-rendered match pages.
+
+- FragmentCache: rendered match-card HTML, keyed by the card's "profile
+  version": the candidate's id and every displayed field, plus the
+  templates' version (e.g. static_assets.assets_version). An edited
+  profile or template yields a new key, so entries never need explicit
+  invalidation; old ones just age out of the LRU. The score differs per viewer, so cards
+  are cached with a placeholder that is swapped for the score on use.
+- page_etag(*parts): a strong ETag for a page built from those parts, so
+  /matches and /admin/users can answer If-None-Match with 304 before
+  rendering anything.
+
+WHAT THIS MODULE PROVIDES
+- FragmentCache(render, max_entries, version): key(profile), render(match) -> Markup, stats()
+- page_etag(*parts) -> str
+"""
+
+from __future__ import annotations
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Mapping
+
+from markupsafe import Markup
+
+# Profile fields shown on a card; part of the fragment key
+CARD_FIELDS = ("user_id", "username", "email", "budget", "location", "lifestyle",
+               "smoking", "pets", "cleanliness")
+_SCORE_SLOT = "\x00score\x00"
+
+
+def page_etag(*parts: Any) -> str:
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+class FragmentCache:
+    def __init__(
+        self,
+        render: Callable[[Mapping[str, Any]], str],
+        max_entries: int = 5000,
+        version: Callable[[], str] | None = None,
+    ):
+        self._render = render
+        self._version = version
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, Markup] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, profile: Mapping[str, Any]) -> tuple:
+        version = self._version() if self._version is not None else None
+        return (version,) + tuple(profile.get(f) for f in CARD_FIELDS)
+
+    def render(self, match: Mapping[str, Any]) -> Markup:
+        """The card for {"profile": ..., "score": int}."""
+        key = self.key(match["profile"])
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if html is None:
+            html = self._render({"profile": match["profile"], "score": _SCORE_SLOT})
+            with self._lock:
+                self._entries[key] = html
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return Markup(html.replace(_SCORE_SLOT, str(int(match["score"]))))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
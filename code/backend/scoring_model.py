@@ -0,0 +1,183 @@
+"""
+scoring_model.py
+Pluggable, graded similarity model for matching (alternative to the
+all-or-nothing matching.compatibility_score).
+
+Each field has a weight and a similarity function returning 0.0 - 1.0:
+- budget:       numeric distance, 1 - |a - b| / scale (so $899 vs $900 ~ 1.0)
+- cleanliness:  ordinal distance between levels (low / medium / high)
+- location:     1.0 for the same region (matching.location_key), else a
+                value from a similarity table
+- everything else (lifestyle, smoking, pets): exact match
+Weights, budget scale, levels and the location table load from JSON
+(scoring_model.json, or the path in SCORING_MODEL_CONFIG).
+
+score(me, other) is the per-pair reference. compile() + score_batch() is the
+vectorized evaluator: for each field it evaluates the similarity function
+once per *distinct* value in the candidate column, then scores every
+candidate with one table lookup per field. That is the same cost per
+candidate as the exact-match masks in matching.score_batch, and it gives
+exactly the same numbers as score(). bench/bench_scoring_model.py compares
+the two scorers.
+
+compile() produces the same codes as matching.compile_profile does under
+SCORING_MODEL=graded, which is how /matches, profile_store, profile_index
+and precompute_matches use this model (score_codes() on stored columns).
+"""
+
+from __future__ import annotations
+import json
+import os
+import re
+from array import array
+from itertools import repeat
+from operator import add
+from typing import Any, Iterable, Mapping, Sequence
+
+from matching import DEFAULT_WEIGHTS, FIELDS, _norm, decode, intern, location_key
+
+DEFAULT_CONFIG = os.environ.get(
+    "SCORING_MODEL_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_model.json"),
+)
+
+_NUMBER = re.compile(r"\d[\d,]*")
+_BUDGET_WORDS = {"low": 600, "mid": 800, "medium": 800, "high": 1000}
+_MISSING = -1  # budget column value when no budget could be parsed
+
+
+class ScoringModel:
+    def __init__(
+        self,
+        weights: dict[str, float] | None = None,
+        budget_scale: float = 400,
+        budget_step: int = 25,
+        cleanliness_levels: Sequence[str] = ("low", "medium", "high"),
+        cleanliness_aliases: Mapping[str, str] | None = None,
+        location_similarity: Mapping[str, Mapping[str, float]] | None = None,
+    ):
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.budget_scale = budget_scale
+        self.budget_step = budget_step
+        self.levels = {_norm(level): i for i, level in enumerate(cleanliness_levels)}
+        for alias, level in (cleanliness_aliases or {}).items():
+            self.levels[_norm(alias)] = self.levels[_norm(level)]
+        # Symmetric, normalized location table
+        self.location_similarity: dict[str, dict[str, float]] = {}
+        for a, row in (location_similarity or {}).items():
+            for b, sim in row.items():
+                a_n, b_n = _norm(a), _norm(b)
+                self.location_similarity.setdefault(a_n, {})[b_n] = sim
+                self.location_similarity.setdefault(b_n, {})[a_n] = sim
+
+    @classmethod
+    def from_config(cls, path: str = DEFAULT_CONFIG) -> "ScoringModel":
+        with open(path, encoding="utf-8") as f:
+            cfg = json.load(f)
+        budget = cfg.get("budget", {})
+        return cls(
+            weights=cfg.get("weights"),
+            budget_scale=budget.get("scale", 400),
+            budget_step=budget.get("step", 25),
+            cleanliness_levels=cfg.get("cleanliness_levels", ("low", "medium", "high")),
+            cleanliness_aliases=cfg.get("cleanliness_aliases"),
+            location_similarity=cfg.get("location_similarity"),
+        )
+
+    # ---- per-field values + similarity functions ----
+
+    def budget_value(self, budget: str | None) -> int:
+        """Budget in `budget_step` dollar units, or -1 if it can't be read."""
+        b = _norm(budget)
+        m = _NUMBER.search(b)
+        if m:
+            dollars = int(m.group().replace(",", ""))
+        else:
+            dollars = next((v for word, v in _BUDGET_WORDS.items() if word in b), None)
+            if dollars is None:
+                return _MISSING
+        return round(dollars / self.budget_step)
+
+    def similarity(self, field: str, a, b) -> float:
+        """Similarity of two present values (normalized strings; budget in steps)."""
+        if field == "budget":
+            return max(0.0, 1.0 - abs(a - b) * self.budget_step / self.budget_scale)
+        if a == b:
+            return 1.0
+        if field == "cleanliness" and a in self.levels and b in self.levels:
+            top = max(self.levels.values()) or 1
+            return 1.0 - abs(self.levels[a] - self.levels[b]) / top
+        if field == "location":
+            return self.location_similarity.get(a, {}).get(b, 0.0)
+        return 0.0
+
+    def _value(self, field: str, profile: Mapping[str, Any]):
+        if field == "budget":
+            v = self.budget_value(profile.get("budget"))
+            return None if v == _MISSING else v
+        if field == "location":
+            return location_key(profile) or None
+        return _norm(profile.get(field)) or None
+
+    # ---- reference scorer ----
+
+    def score(self, me: Mapping[str, Any], other: Mapping[str, Any]) -> int:
+        total = 0
+        for field in FIELDS:
+            w = self.weights.get(field, 0)
+            if not w:
+                continue
+            a, b = self._value(field, me), self._value(field, other)
+            if a is not None and b is not None:
+                total += w * self.similarity(field, a, b)
+        return int(round(total))
+
+    # ---- vectorized evaluator ----
+
+    def compile(self, candidates: Iterable[Mapping[str, Any]]) -> list[array]:
+        """One int column per field: interned codes (0 = missing), budget in steps (-1 = missing)."""
+        columns = [array("i") for _ in FIELDS]
+        for p in candidates:
+            for field, col in zip(FIELDS, columns):
+                if field == "budget":
+                    col.append(self.budget_value(p.get("budget")))
+                elif field == "location":
+                    col.append(intern(location_key(p)))
+                else:
+                    col.append(intern(p.get(field)))
+        return columns
+
+    def score_batch(self, me: Mapping[str, Any], columns: Sequence[Sequence[int]]) -> list[int]:
+        return self.score_codes(tuple(col[0] for col in self.compile([me])), columns)
+
+    def score_codes(self, me_codes: Sequence[int], columns: Sequence[Sequence[int]]) -> list[int]:
+        """score_batch for a profile already compiled like compile() does."""
+        n = len(columns[0]) if columns else 0
+        totals: list = [0] * n
+        for field, mine, col in zip(FIELDS, me_codes, columns):
+            w = self.weights.get(field, 0)
+            if not w or mine == (_MISSING if field == "budget" else 0):
+                continue
+            # Evaluate the similarity once per distinct value in this column
+            table = {}
+            for value in set(col):
+                if field == "budget":
+                    if value != _MISSING:
+                        table[value] = w * self.similarity(field, mine, value)
+                elif value:
+                    table[value] = w * self.similarity(field, decode(mine), decode(value))
+            totals = list(map(add, totals, map(table.get, col, repeat(0))))
+        return [int(round(t)) for t in totals]
+
+    def rank(
+        self,
+        me: Mapping[str, Any],
+        candidates: Iterable[Mapping[str, Any]],
+        top_k: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """Same output shape and tie order as matching.rank_candidates."""
+        candidates = list(candidates)
+        scores = self.score_batch(me, self.compile(candidates))
+        scored = [{"profile": p, "score": s} for p, s in zip(candidates, scores)]
+        scored.sort(key=lambda x: x["score"], reverse=True)
+        return scored[:top_k] if top_k else scored
@@ -0,0 +1,98 @@
+"""
+static_assets.py
+Content-hashed URLs and long-lived cache headers for frontend/static.
+
+url_for('static', filename='style.css') becomes /static/style.css?v=<hash of
+the file's bytes>. Because the URL changes whenever the file does, responses
+for a hashed URL can be cached by browsers and CDNs for a year
+("immutable"). Only a `v` equal to the file's current hash gets those
+headers; un-hashed requests and stale or made-up versions keep Flask's
+default headers, so they are revalidated instead of pinned forever.
+
+WHAT THIS MODULE PROVIDES
+- file_hash(static_folder, filename) -> str
+- assets_version(*folders) -> str (changes when any template/static file
+  does; rechecked at most every RECHECK_SECONDS)
+- init_app(app)
+
+Config (env):
+- STATIC_MAX_AGE: seconds for hashed static URLs (default: one year)
+"""
+
+from __future__ import annotations
+import hashlib
+import os
+import threading
+import time
+
+from flask import request
+
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", 365 * 24 * 3600))
+RECHECK_SECONDS = 2.0  # how often a file is stat()ed again to notice edits
+
+_hashes: dict[str, tuple[float, int, int, str]] = {}  # path -> (checked_at, mtime_ns, size, hash)
+_lock = threading.Lock()
+_versions: dict[tuple[str, ...], tuple[float, str]] = {}  # folders -> (checked_at, version)
+
+
+def file_hash(static_folder: str, filename: str) -> str:
+    """First 12 hex chars of the file's SHA-256 (recomputed only when mtime/size change)."""
+    path = os.path.join(static_folder, filename)
+    now = time.monotonic()
+    cached = _hashes.get(path)
+    if cached and now - cached[0] < RECHECK_SECONDS:
+        return cached[3]
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    if cached and cached[1] == st.st_mtime_ns and cached[2] == st.st_size:
+        digest = cached[3]
+    else:
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    with _lock:
+        _hashes[path] = (now, st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+def assets_version(*folders: str) -> str:
+    """One hash over every file in `folders` (by name, size and mtime), rewalked every RECHECK_SECONDS."""
+    key = tuple(folders)
+    now = time.monotonic()
+    cached = _versions.get(key)
+    if cached and now - cached[0] < RECHECK_SECONDS:
+        return cached[1]
+    h = hashlib.sha256()
+    for folder in folders:
+        for root, _, files in sorted(os.walk(folder)):
+            for name in sorted(files):
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue  # removed while walking
+                h.update(f"{os.path.relpath(os.path.join(root, name), folder)}:{st.st_size}:{st.st_mtime_ns};".encode())
+    version = h.hexdigest()[:12]
+    with _lock:
+        _versions[key] = (now, version)
+    return version
+
+
+def init_app(app):
+    @app.url_defaults
+    def _hashed_static_url(endpoint, values):
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            digest = file_hash(app.static_folder, values["filename"])
+            if digest:
+                values["v"] = digest
+
+    @app.after_request
+    def _static_cache_headers(response):
+        if (request.endpoint == "static" and response.status_code == 200
+                and request.args.get("v")
+                and request.args["v"] == file_hash(app.static_folder, request.view_args["filename"])):
+            response.cache_control.no_cache = None  # Flask's default for static files
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        return response
@@ -0,0 +1,40 @@
+"""
+conftest.py
+Puts code/backend on sys.path so the tests import the flat modules the way
+app.py does. Run from code/backend:  python -m pytest -q tests
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+# Several spellings per value, blanks and None, so normalization and the
+# gazetteer are exercised, not just string equality
+LOCATIONS = ["Seattle", "seattle, wa", "  Seattle WA ", "Tacoma", "TACOMA", "Bellevue",
+             "Walla Walla", "walla  walla", "", None]
+BUDGETS = ["450", "$699", "700", "$899", "900", "1,250", "low", "Medium", "high", "cheap", "", None]
+LIFESTYLES = ["early sleeper", "Early  Sleeper", "night owl", "student", "", None]
+YES_NO = ["yes", "Yes ", "no", "NO", "", None]
+CLEANLINESS = ["low", "medium", "Medium", "high", "", None]
+
+
+def make_population(n, seed=7):
+    rnd = random.Random(seed)
+    return [{
+        "user_id": i,
+        "budget": rnd.choice(BUDGETS),
+        "location": rnd.choice(LOCATIONS),
+        "lifestyle": rnd.choice(LIFESTYLES),
+        "smoking": rnd.choice(YES_NO),
+        "pets": rnd.choice(YES_NO),
+        "cleanliness": rnd.choice(CLEANLINESS),
+    } for i in range(1, n + 1)]
+
+
+@pytest.fixture(scope="session")
+def population():
+    return make_population(600)
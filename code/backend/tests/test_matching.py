@@ -0,0 +1,49 @@
+"""Compiled / batched / streamed scoring must give exactly compatibility_score's numbers."""
+
+import pytest
+
+from matching import (DEFAULT_WEIGHTS, compatibility_score, compile_columns, compile_profile,
+                      rank_candidates, score_batch, stream_rank_candidates)
+
+WEIGHTS = {
+    "default": None,
+    "custom": {"location": 50, "budget": 0, "lifestyle": 25, "pets": 15},
+    "float": {"location": 33.3, "budget": 12.5, "lifestyle": 20.1, "smoking": 0.7,
+              "pets": 4.45, "cleanliness": 9.95},
+    "negative": dict(DEFAULT_WEIGHTS, smoking=-30, pets=-5.5),
+}
+
+
+def reference(me, candidates, weights):
+    """rank_candidates' documented order: score descending, ties in input order."""
+    scored = [(compatibility_score(me, p, weights), i) for i, p in enumerate(candidates)]
+    scored.sort(key=lambda s: (-s[0], s[1]))
+    return [(candidates[i]["user_id"], score) for score, i in scored]
+
+
+def pairs(ranked):
+    return [(r["profile"]["user_id"], r["score"]) for r in ranked]
+
+
+@pytest.mark.parametrize("weights", WEIGHTS.values(), ids=WEIGHTS.keys())
+def test_score_batch_matches_compatibility_score(population, weights):
+    columns = compile_columns(compile_profile(p) for p in population)
+    for me in population[:40]:
+        expected = [compatibility_score(me, p, weights) for p in population]
+        assert score_batch(compile_profile(me), columns, weights) == expected
+
+
+@pytest.mark.parametrize("weights", WEIGHTS.values(), ids=WEIGHTS.keys())
+@pytest.mark.parametrize("top_k", [None, 1, 25])
+def test_rank_candidates_matches_reference(population, weights, top_k):
+    for me in population[:20]:
+        expected = reference(me, population, weights)[:top_k]
+        assert pairs(rank_candidates(me, population, weights, top_k)) == expected
+
+
+@pytest.mark.parametrize("weights", WEIGHTS.values(), ids=WEIGHTS.keys())
+@pytest.mark.parametrize("top_k", [1, 25, 1000])
+def test_stream_rank_candidates_matches_reference(population, weights, top_k):
+    for me in population[:20]:
+        expected = reference(me, population, weights)[:top_k]
+        assert pairs(stream_rank_candidates(me, iter(population), top_k, weights)) == expected
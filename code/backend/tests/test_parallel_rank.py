@@ -0,0 +1,57 @@
+"""The process-pool ranking must return exactly the serial ranking."""
+
+from array import array
+
+import pytest
+
+import parallel_rank
+from matching import DEFAULT_WEIGHTS, compatibility_score, compile_columns, compile_profile
+from parallel_rank import rank_columns
+from test_matching import WEIGHTS, reference
+
+
+@pytest.fixture(scope="module")
+def rows(population):
+    ids = array("q", (p["user_id"] for p in population))
+    return ids, compile_columns(compile_profile(p) for p in population)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def pool():
+    # Three shards, so merging local top-k lists across workers is exercised
+    workers = parallel_rank.RANK_WORKERS
+    parallel_rank.RANK_WORKERS = 3
+    yield
+    parallel_rank.shutdown_pool()
+    parallel_rank.RANK_WORKERS = workers
+
+
+@pytest.mark.parametrize("weights", WEIGHTS.values(), ids=WEIGHTS.keys())
+@pytest.mark.parametrize("top_k", [None, 1, 25])
+def test_parallel_matches_serial_and_reference(population, rows, weights, top_k):
+    ids, columns = rows
+    w = weights or DEFAULT_WEIGHTS
+    for me in population[:5]:
+        codes = compile_profile(me)
+        serial = rank_columns(codes, ids, columns, top_k, w, parallel=False)
+        assert rank_columns(codes, ids, columns, top_k, w, parallel=True) == serial
+        assert serial == reference(me, population, weights)[:top_k]
+
+
+def test_parallel_exclude_and_after(population, rows):
+    ids, columns = rows
+    me = population[0]
+    codes = compile_profile(me)
+    exclude = {p["user_id"] for p in population[::7]}
+    first = rank_columns(codes, ids, columns, 30, DEFAULT_WEIGHTS, exclude, parallel=True)
+    assert first == rank_columns(codes, ids, columns, 30, DEFAULT_WEIGHTS, exclude, parallel=False)
+    assert not exclude & {uid for uid, _ in first}
+
+    uid, score = first[-1]
+    after = (score, uid)
+    nxt = rank_columns(codes, ids, columns, 30, DEFAULT_WEIGHTS, exclude, parallel=True, after=after)
+    assert nxt == rank_columns(codes, ids, columns, 30, DEFAULT_WEIGHTS, exclude,
+                               parallel=False, after=after)
+    everyone = rank_columns(codes, ids, columns, None, DEFAULT_WEIGHTS, exclude, parallel=False)
+    assert first + nxt == everyone[:60]
+    assert all(s == compatibility_score(me, population[u - 1]) for u, s in nxt)
@@ -0,0 +1,90 @@
+"""Memory bound and snapshot behaviour of the columnar profile store."""
+
+import tracemalloc
+
+from conftest import make_population
+from matching import compile_profile, rank_candidates
+from profile_store import MAX_BYTES_PER_PROFILE, ProfileStore
+
+
+def test_bytes_per_profile_within_bound():
+    rows = make_population(50_000, seed=11)
+    store = ProfileStore()
+    store.load(rows[:200])  # warm the interner so only the arrays are measured
+    tracemalloc.start()
+    store.load(rows)
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert traced / len(rows) <= MAX_BYTES_PER_PROFILE
+    assert store.nbytes / len(rows) <= MAX_BYTES_PER_PROFILE
+
+    # Growing by appends keeps at most 50% spare capacity
+    grown = ProfileStore()
+    for p in rows:
+        grown.upsert(p["user_id"], p)
+    assert grown.nbytes / len(rows) <= MAX_BYTES_PER_PROFILE
+
+
+def test_views_keep_their_snapshot(population):
+    store = ProfileStore()
+    store.load(population)
+    ids, columns = store.view()
+    before = [bytes(c) for c in columns]
+
+    edited = dict(population[10], location="Tacoma", lifestyle="night owl", budget="1500")
+    store.upsert(edited["user_id"], edited)
+    store.upsert(10_000, dict(edited, user_id=10_000))
+    store.remove(population[3]["user_id"])
+
+    assert [bytes(c) for c in columns] == before
+    assert len(ids) == len(population)
+    assert store.codes(edited["user_id"]) == compile_profile(edited)
+    assert store.codes(population[3]["user_id"]) is None
+    assert len(store) == len(population)
+
+
+def test_rank_matches_rank_candidates(population):
+    store = ProfileStore()
+    store.load(population)
+    for me in population[:10]:
+        others = [p for p in population if p["user_id"] != me["user_id"]]
+        expected = [(r["profile"]["user_id"], r["score"]) for r in rank_candidates(me, others, top_k=40)]
+        assert store.rank(me, top_k=40, exclude=[me["user_id"]]) == expected
+
+
+def test_rank_only_some_ids(population):
+    store = ProfileStore()
+    store.load(population)
+    me = population[0]
+    only = [p["user_id"] for p in population[::3]] + [99_999]  # plus one id not in the store
+    subset = [p for p in population[::3] if p["user_id"] != me["user_id"]]
+    expected = [(r["profile"]["user_id"], r["score"]) for r in rank_candidates(me, subset)]
+    first = store.rank(me, top_k=20, exclude=[me["user_id"]], only=only)
+    uid, score = first[-1]
+    rest = store.rank(me, exclude=[me["user_id"]], after=(score, uid), only=only)
+    assert first + rest == expected
+
+
+def _scanned_kth(store, codes, k, weights):
+    top = store.rank_codes(codes, top_k=k, weights=weights)
+    return top[-1][1] if len(top) >= k else 0
+
+
+def test_kth_best_equals_a_full_scan(population):
+    from test_matching import WEIGHTS
+
+    store = ProfileStore()
+    store.load(population[:400])
+    store.kth_best(compile_profile(population[0]), 1)  # build the counts, then edit
+    for p in population[400:]:
+        store.upsert(p["user_id"], p)
+    for p in population[:60]:
+        store.upsert(p["user_id"], dict(p, location="Tacoma", smoking="yes"))
+    for p in population[60:90]:
+        store.remove(p["user_id"])
+
+    for weights in WEIGHTS.values():
+        for me in population[::25]:
+            codes = compile_profile(me)
+            for k in (1, 10, 50, 450, len(population)):
+                assert store.kth_best(codes, k, weights) == _scanned_kth(store, codes, k, weights)
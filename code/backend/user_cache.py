@@ -0,0 +1,125 @@
+"""
+user_cache.py
+Read-through cache of user + profile rows (database.get_user_and_profile),
+keyed by user id, for the authenticated routes that reload the current user
+on every request.
+
+- LRU bounded by `max_entries`, each entry lives `ttl` seconds
+- stampede guard: concurrent misses for the same user run ONE query; the
+  other threads wait for its result
+- invalidate(user_id) after writes (app._profile_changed); a load that was
+  already running when the user was invalidated is returned to its callers
+  but not stored
+
+The cache is per process, so with several gunicorn workers another worker
+can serve a row up to `ttl` seconds old after an edit.
+
+Stats (UserCache.stats()): entries, hits, misses, coalesced (misses that
+waited for another thread's query), evictions, invalidations
+"""
+
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+
+class _Load:
+    __slots__ = ("done", "row", "error", "stale")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.row = None
+        self.error: BaseException | None = None
+        self.stale = False
+
+
+class UserCache:
+    def __init__(
+        self,
+        loader: Callable[[int], dict[str, Any] | None],
+        max_entries: int = 10_000,
+        ttl: float = 60,
+    ):
+        self.loader = loader
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[int, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._loading: dict[int, _Load] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> dict[str, Any] | None:
+        """The user's row (a copy), loading it on a miss; None if the user doesn't exist."""
+        with self._lock:
+            cached = self._entries.get(user_id)
+            if cached is not None and cached[0] >= time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return dict(cached[1])
+            self.misses += 1
+            load = self._loading.get(user_id)
+            if load is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                load = self._loading[user_id] = _Load()
+                owner = True
+
+        if not owner:
+            load.done.wait()
+            if load.error is not None:
+                raise load.error
+            return dict(load.row) if load.row is not None else None
+
+        try:
+            load.row = self.loader(user_id)
+        except BaseException as exc:
+            load.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._loading[user_id]
+                if load.error is None and load.row is not None and not load.stale:
+                    self._store(user_id, load.row)
+            load.done.set()
+        return dict(load.row) if load.row is not None else None
+
+    def _store(self, user_id: int, row: dict[str, Any]):
+        if self.max_entries <= 0:
+            return
+        self._entries.pop(user_id, None)
+        self._entries[user_id] = (time.monotonic() + self.ttl, dict(row))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+            load = self._loading.get(user_id)
+            if load is not None:
+                load.stale = True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for load in self._loading.values():
+                load.stale = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,138 @@
+"""
+write_queue.py
+Write-behind queue for the small inserts behind /block, /report and
+/matches/accept.
+
+Each of those used to be its own transaction (one fsync per click). With the
+queue, request threads submit() a row and a single writer thread collects
+everything that arrives within `window` seconds (or up to `max_batch` rows)
+and writes it with database.write_rows in ONE transaction. submit() returns a
+Future that resolves to when that transaction commits, so a caller can wait
+for durability (group commit) or not wait at all.
+
+If the batch transaction fails (e.g. one row violates a constraint), its
+rows are retried one transaction each, so only the futures of the rows that
+fail on their own get the exception.
+
+The writer thread starts on the first submit(), so processes that import the
+app without serving requests (e.g. parallel_rank workers) never start one.
+
+Stats (WriteBehindQueue.stats()):
+- batches, rows, failed_batches (retried row by row), failed_rows,
+  last_batch_rows, queued
+"""
+
+from __future__ import annotations
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import database
+import metrics
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    def __init__(self, window: float = 0.02, max_batch: int = 1000):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: queue.Queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "rows": 0, "failed_batches": 0, "failed_rows": 0,
+                       "last_batch_rows": 0}
+
+    def submit(self, table: str, row: tuple) -> Future:
+        """Queue one row for `table` (a database.BULK_SQL key); resolves after commit."""
+        if table not in database.BULK_SQL:
+            raise ValueError(f"unknown table {table!r}")
+        if self._stop.is_set():
+            raise RuntimeError("write queue is stopped")
+        future: Future = Future()
+        self._queue.put((table, tuple(row), future))
+        self._ensure_started()
+        return future
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, queued=self._queue.qsize())
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._loop, name="roomsync-write-queue", daemon=True
+                    )
+                    self._thread.start()
+
+    def _take_batch(self, timeout: float | None) -> list:
+        """Block for the first row, then gather more until the window closes."""
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: list):
+        rows_by_table: dict[str, list[tuple]] = {}
+        for table, row, _ in batch:
+            rows_by_table.setdefault(table, []).append(row)
+        try:
+            database.write_rows(rows_by_table)
+        except Exception:
+            log.exception("write-behind flush of %d rows failed; retrying row by row", len(batch))
+            with self._lock:
+                self._stats["failed_batches"] += 1
+            self._flush_each(batch)
+            return
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["rows"] += len(batch)
+            self._stats["last_batch_rows"] = len(batch)
+        metrics.add("write_queue_rows", len(batch))
+        for _, _, future in batch:
+            future.set_result(None)
+
+    def _flush_each(self, batch: list):
+        """One transaction per row, so a bad row only fails its own future."""
+        written = 0
+        for table, row, future in batch:
+            try:
+                database.write_rows({table: [row]})
+            except Exception as exc:
+                with self._lock:
+                    self._stats["failed_rows"] += 1
+                future.set_exception(exc)
+                continue
+            written += 1
+            future.set_result(None)
+        with self._lock:
+            self._stats["rows"] += written
+        metrics.add("write_queue_rows", written)
+
+    def _loop(self):
+        while True:
+            batch = self._take_batch(timeout=0.5)
+            if batch:
+                self._flush(batch)
+            elif self._stop.is_set():
+                return
+
+    def stop(self, timeout: float | None = 5):
+        """Stop accepting rows, write whatever is queued, then end the thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,14 @@
+"""
+wsgi.py
+WSGI entry point for production serving (see gunicorn.conf.py):
+
+    cd code/backend
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+`python app.py` still starts Flask's development server. Both go through
+app.create_app(), which does the one-time setup (schema, background threads).
+"""
+
+from app import create_app
+
+app = create_app()